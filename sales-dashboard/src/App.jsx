@@ -1,9 +1,47 @@
-import { useMemo, useState } from 'react'
+import { useEffect, useMemo, useRef, useState } from 'react'
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts'
-import salesData from './data/sales-data.json'
+import bundledSalesData from './data/sales-data.json'
 import './App.css'
 
+// Optional refresh service (python sales_service.py), e.g. VITE_SALES_DATA_URL=http://localhost:8050/sales-data.json
+const SALES_DATA_URL = import.meta.env.VITE_SALES_DATA_URL
+const POLL_INTERVAL_MS = 30000
+
+// Start from the bundled data and poll the refresh service when one is configured;
+// If-None-Match keeps unchanged polls to an empty 304 response
+function useSalesData() {
+  const [salesData, setSalesData] = useState(bundledSalesData)
+  const etag = useRef(null)
+
+  useEffect(() => {
+    if (!SALES_DATA_URL) return
+    let cancelled = false
+    const poll = async () => {
+      try {
+        const headers = etag.current ? { 'If-None-Match': etag.current } : {}
+        const response = await fetch(SALES_DATA_URL, { headers, cache: 'no-store' })
+        if (cancelled || response.status !== 200) return
+        const data = await response.json()
+        if (cancelled) return
+        etag.current = response.headers.get('ETag')
+        setSalesData(data)
+      } catch (error) {
+        console.warn('Sales data refresh failed', error)
+      }
+    }
+    poll()
+    const timer = setInterval(poll, POLL_INTERVAL_MS)
+    return () => {
+      cancelled = true
+      clearInterval(timer)
+    }
+  }, [])
+
+  return salesData
+}
+
 function App() {
+  const salesData = useSalesData()
   const [selectedContentType, setSelectedContentType] = useState('All')
   const [selectedProduct, setSelectedProduct] = useState('All')
   
@@ -11,7 +49,7 @@ function App() {
   const mainProducts = ['COF1', 'spr/x1', 'HERCOF1', 'VGOMX']
   const filteredSalesData = useMemo(() => {
     return salesData.filter(item => mainProducts.includes(item.sku))
-  }, [])
+  }, [salesData])
   
   // Process data for visualizations
   const { contentTypeData, productData, filteredData, chartData, chartContentTypes, summary } = useMemo(() => {
@@ -1,8 +1,27 @@
 import pandas as pd
 import numpy as np
+import argparse
+import os
 import re
+import sys
+import time
+import hashlib
+import json
+import logging
 from pathlib import Path
 from datetime import datetime
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from sales_cache import cached_read, file_fingerprint, is_fresh
+from sales_cube import CUBE_FILE, DIMENSIONS, MEASURES, build_cube, save_cube
+from sales_facts import FACTS_DIR, LINE_ITEM_COLUMNS, PARTITION_COLUMNS, prune_facts, write_facts
+from sales_index import OrderIndex
+from sales_instrument import LOG_LEVELS, RunReport, configure_logging
+
+# Progress messages; the level is set with --log-level (see sales_instrument.configure_logging)
+log = logging.getLogger('sales_analysis')
 
 # Product pricing (individual unit prices)
 PRODUCT_PRICES = {
@@ -17,6 +36,107 @@ PRODUCT_PRICES = {
     'TP-HERCOF': 0.0,       # Trial Pack (free item, no revenue)
 }
 
+# BigSeller export location and the columns the pipeline reads (with explicit dtypes).
+# Numbers are read as text and coerced with pd.to_numeric, like the rest of the pipeline.
+BIGSELLER_PATH = 'Data/BigSeller Orders/bigseller_orders.csv'
+BIGSELLER_DTYPES = {
+    'order_no': str,
+    'order_date': str,
+    'order_status': str,
+    'marketplace': str,
+    'marketplace_store': str,
+    'sku': str,
+    'quantity': str,
+    'price': str,
+    'product_subtotal': str,
+    'order_total': str,
+}
+BIGSELLER_CHUNKSIZE = 200_000
+# BigSeller columns identifying a line item when repeated line items are dropped. The status
+# is left out: a later export can repeat an order after it moved from Processing to Completed.
+LINE_KEY_COLUMNS = ['order_no', 'order_date', 'marketplace', 'marketplace_store', 'sku', 'quantity', 'price',
+                    'product_subtotal', 'order_total']
+
+# In-memory dtypes per pipeline frame (see apply_schema): low-cardinality text columns are
+# categorical and integer quantities use the narrowest integer type. Money stays float64 and
+# the final table is converted back to plain text columns, so the CSV outputs do not change.
+ORDER_SCHEMA = {
+    'order_status': 'category',
+    'marketplace': 'category',
+    'marketplace_store': 'category',
+    'sku': 'category',
+    'quantity': 'integer',
+}
+FACT_SCHEMA = {
+    'sku': 'category',
+    'sales_channel': 'category',
+    'Content Type': 'category',
+    'Creator Username': 'category',
+    'source': 'category',
+    'quantity': 'integer',
+}
+EXPANDED_SCHEMA = {
+    'sales_channel': 'category',
+    'content_type': 'category',
+    'sku': 'category',
+    'quantity_sold': 'integer',
+}
+# BigSeller columns used to attribute and expand order lines
+ATTRIBUTE_COLUMNS = ['order_no', 'order_date', 'sku', 'marketplace_store', 'quantity', 'price']
+# What astype(str) turns a missing value into ('nan', or still missing in newer pandas)
+MISSING_TEXT = pd.Series([np.nan], dtype=object).astype(str).iloc[0]
+# What a missing SKU is linked and counted as: str() turns it into 'nan' in the original row loops
+MISSING_SKU = 'nan'
+
+# Reference SKU sheets
+COMBO_SKU_PATH = 'Data/Ref SKU/Combo SKU.xlsx'
+
+# Output tables
+OUTPUT_FILE = 'final_sales_table_quantity.csv'
+UNKNOWN_OUTPUT_FILE = 'tiktok_orders_unknown_content_type.csv'
+UNKNOWN_OUTPUT_COLUMNS = ['order_no', 'order_date', 'order_status', 'marketplace', 'marketplace_store',
+                          'sku', 'quantity', 'price', 'product_subtotal', 'order_total']
+
+# Parsed inputs are cached here (see sales_cache.py); set to None to always re-parse
+INPUT_CACHE_DIR = '.sales_cache'
+
+# TikTok Shop fact table exports (creator_order_all_<start>_<end>_<id>.csv) per store directory
+FACT_STORE_DIRS = {
+    'DrSamhanWellness': 'Data/DrSamhanWellness',
+    'HIM Clinic': 'Data/HIM Clinic',
+}
+FACT_FILE_PATTERN = re.compile(r'^creator_order_all_(\d{14})_(\d{14})_(\d+)\.csv$')
+# Columns kept from each fact table after loading
+FACT_COLUMNS = ['Order ID', 'sku', 'sales_channel', 'Content Type', 'Creator Username', 'quantity', 'source']
+# Fact table columns identifying a row when repeated rows are dropped
+FACT_KEY_COLUMNS = ['Order ID', 'Seller SKU', 'Content Type', 'Creator Username', 'Quantity']
+# Worker processes used to parse fact table exports (1 = load serially in this process)
+FACT_LOAD_WORKERS = min(4, os.cpu_count() or 1)
+# Worker processes for --partitioned runs (one task per (month, store) partition; 1 = serial)
+PARTITION_WORKERS = os.cpu_count() or 1
+
+# Per-fact-file partial aggregates are persisted here; set to None to recompute everything
+INCREMENTAL_STATE_DIR = '.sales_state'
+# Bump when the attribution or partial aggregate logic changes to invalidate saved partials
+PARTIALS_VERSION = 4
+
+# Persistent Order ID index of the fact table exports (see sales_index.py); None to disable
+ORDER_INDEX_PATH = '.sales_state/order_index.sqlite'
+# Bump when build_tiktok_lookups or content type normalization changes to rebuild the index
+ORDER_INDEX_VERSION = 2
+
+# Digits Excel keeps of a number: longer Order IDs saved as numbers end in padding zeros
+EXCEL_DIGITS = 15
+# Rounded Order IDs (scientific notation, Excel padding) carrying fewer significant digits
+# than this are not reconciled (see match_order_ids)
+RECONCILE_MIN_DIGITS = 12
+
+# Order window (inclusive, compared as timestamps), marketplaces and statuses to include
+ORDER_DATE_START = '2025-10-01'
+ORDER_DATE_END = '2025-11-30'
+MARKETPLACES = ['TikTok']
+ORDER_STATUSES = ['Completed', 'Shipped', 'Processing']
+
 # Function to calculate weighted price for combo products
 def calculate_combo_revenue(breakdown, combo_price):
     """Calculate revenue contribution for each product in a combo based on individual prices"""
@@ -55,221 +175,241 @@ def calculate_combo_revenue(breakdown, combo_price):
     
     return revenue_dict
 
-# Function to map combo SKUs to single SKUs
-def create_sku_mapping():
-    """Create mapping from combo SKUs to single SKUs with quantities"""
-    mapping = {}
-    
-    # Load combo and single SKU files
-    combo_sku = pd.read_excel('Data/Ref SKU/Combo SKU.xlsx')
-    single_sku = pd.read_excel('Data/Ref SKU/Single SKU.xlsx')
-    
-    # Base single SKU mappings
-    base_mapping = {
-        'HIM': 'COF1',  # HIM Coffee base unit
-        'HER': 'HERCOF1',  # HER Coffee base unit
-        'COF': 'COF1',  # HIM Coffee (alternative)
-        'SPU': 'spr/x1',  # Spray Up base unit
-        'VGO': 'VGOMX',  # VIGOMAX base unit
-    }
+# Quantity placeholder in SKU_RULES: use the number captured by the rule pattern
+CAPTURED_QTY = None
+
+# Combo SKU breakdown rules as (scope, pattern, units), checked in order (first match wins).
+# Scope 'combo' applies to SKU names from the combo SKU sheet, 'order' to order SKUs that
+# are not in the sheet, and 'any' to both.
+SKU_RULES = [
+    # HIM[number] pattern (e.g., HIM3 = 3 boxes of HIM Coffee)
+    ('combo', r'^HIM(\d+)$', [('COF1', CAPTURED_QTY)]),
+    # HER[number] pattern (e.g., HER3 = 3 boxes of HER Coffee)
+    ('combo', r'^HER(\d+)$', [('HERCOF1', CAPTURED_QTY)]),
+    # COF[number] pattern (e.g., COF3 = 3 boxes of HIM Coffee)
+    ('combo', r'^COF(\d+)$', [('COF1', CAPTURED_QTY)]),
+    # HERCOF[number] pattern
+    ('combo', r'^HERCOF(\d+)$', [('HERCOF1', CAPTURED_QTY)]),
+    # SPU[number] pattern (e.g., SPU3 = 3 bottles of Spray Up)
+    ('combo', r'^SPU(\d+)$', [('spr/x1', CAPTURED_QTY)]),
+    # HIM[number] with a variant suffix (e.g., HIM3-A = 3 boxes of HIM Coffee)
+    ('order', r'^HIM(\d+)(-.*)?$', [('COF1', CAPTURED_QTY)]),
+    # HER3+1 = 3 boxes of HER Coffee + 1 more HER Coffee
+    ('order', r'^HER(\d+)(?=.*\+1)([+-].*)?$', [('HERCOF1', CAPTURED_QTY), ('HERCOF1', 1)]),
+    # HER[number] with a variant suffix (e.g., HER3-A = 3 boxes of HER Coffee)
+    ('order', r'^HER(\d+)([+-].*)?$', [('HERCOF1', CAPTURED_QTY)]),
+    # SPU or SPU-A = 1 bottle of Spray Up
+    ('any', r'^SPU(-.*)?$', [('spr/x1', 1)]),
+    # SPUHIM pattern (HIM Coffee + Spray Up)
+    ('combo', r'^SPUHIM', [('COF1', 1), ('spr/x1', 1)]),
+    ('combo', r'^(?=.*SPUHIM)(?=.*-A)', [('COF1', 1), ('spr/x1', 1)]),
+    ('order', r'SPUHIM', [('COF1', 1), ('spr/x1', 1)]),
+    # HIM1 or HIM1-A = 1 box of HIM Coffee
+    ('combo', r'^HIM1(-.*)?$', [('COF1', 1)]),
+    # HER1 = 1 box of HER Coffee
+    ('combo', r'^HER1(-.*)?$', [('HERCOF1', 1)]),
+    # HIM2 = 2 boxes of HIM Coffee
+    ('combo', r'^HIM2(-.*)?$', [('COF1', 2)]),
+    # HIMHER1 pattern (1 HIM + 1 HER)
+    ('combo', r'^HIMHER1$', [('COF1', 1), ('HERCOF1', 1)]),
+    # 2HIMVGO pattern (2 HIM Coffee + 1 VIGOMAX)
+    ('any', r'^2HIMVGO$', [('COF1', 2), ('VGOMX', 1)]),
+    # 3HIM3HER pattern (3 HIM Coffee + 3 HER Coffee)
+    ('combo', r'^3HIM3HER$', [('COF1', 3), ('HERCOF1', 3)]),
+    # HIM3SHA-V2 pattern (3 HIM Coffee + Shaker)
+    ('combo', r'HIM3SHA', [('COF1', 3), ('SHAKER', 1)]),
+    # HER3SHA-V2 pattern (3 HER Coffee + Shaker)
+    ('combo', r'HER3SHA', [('HERCOF1', 3), ('SHAKER', 1)]),
+    # HIM3TP pattern (3 HIM Coffee + Trial Pack)
+    ('combo', r'^HIM3TP$', [('COF1', 3), ('TP-COF', 1)]),
+    # HER3TP pattern (3 HER Coffee + Trial Pack)
+    ('combo', r'^HER3TP$', [('HERCOF1', 3), ('TP-HERCOF', 1)]),
+    # TPHIM pattern (Trial Pack HIM)
+    ('combo', r'^TPHIM$', [('TP-COF', 1)]),
+    # TPHER pattern (Trial Pack HER)
+    ('combo', r'^TPHER$', [('TP-HERCOF', 1)]),
+    # COFFEECUP-V1 or COFFEE CUP V1 pattern
+    ('any', r'COFFEECUP|COFFEE CUP', [('COFFEE CUP V1', 1)]),
+    # SHA-V2 pattern (Shaker)
+    ('combo', r'SHA-V2|SHAKER', [('SHAKER', 1)]),
+    ('order', r'SHA-V2', [('SHAKER', 1)]),
+]
+
+# Resolver for combo SKU breakdowns
+class SkuResolver:
+    """Resolve SKU strings to (single SKU, quantity) breakdowns using precompiled SKU_RULES.
+
+    SKUs from the combo SKU sheet fall back to themselves as a single unit; other order
+    SKUs without a matching rule resolve to an empty breakdown. Each distinct SKU is
+    resolved once and cached.
+    """
     
-    # Process each combo SKU
-    for _, row in combo_sku.iterrows():
-        combo_name = str(row['SKU Name']).strip()
-        title = str(row['Title']).upper() if pd.notna(row['Title']) else ''
-        
-        # Initialize breakdown
-        breakdown = []
-        
-        # Skip if empty
-        if not combo_name or combo_name == 'nan':
-            continue
-        
-        # Pattern matching for common combo SKUs
-        # HIM[number] pattern (e.g., HIM3 = 3 boxes of HIM Coffee)
-        if re.match(r'^HIM(\d+)$', combo_name):
-            num = int(re.match(r'^HIM(\d+)$', combo_name).group(1))
-            breakdown.append(('COF1', num))
-        
-        # HER[number] pattern (e.g., HER3 = 3 boxes of HER Coffee)
-        elif re.match(r'^HER(\d+)$', combo_name):
-            num = int(re.match(r'^HER(\d+)$', combo_name).group(1))
-            breakdown.append(('HERCOF1', num))
-        
-        # COF[number] pattern (e.g., COF3 = 3 boxes of HIM Coffee)
-        elif re.match(r'^COF(\d+)$', combo_name):
-            num = int(re.match(r'^COF(\d+)$', combo_name).group(1))
-            breakdown.append(('COF1', num))
-        
-        # HERCOF[number] pattern
-        elif re.match(r'^HERCOF(\d+)$', combo_name):
-            num = int(re.match(r'^HERCOF(\d+)$', combo_name).group(1))
-            breakdown.append(('HERCOF1', num))
-        
-        # SPU[number] pattern (e.g., SPU3 = 3 bottles of Spray Up)
-        elif re.match(r'^SPU(\d+)$', combo_name):
-            num = int(re.match(r'^SPU(\d+)$', combo_name).group(1))
-            breakdown.append(('spr/x1', num))
-        
-        # SPU or SPU-A = 1 bottle of Spray Up
-        elif combo_name == 'SPU' or combo_name.startswith('SPU-'):
-            breakdown.append(('spr/x1', 1))
-        
-        # SPUHIM pattern (HIM Coffee + Spray Up)
-        elif combo_name == 'SPUHIM' or combo_name.startswith('SPUHIM'):
-            breakdown.append(('COF1', 1))
-            breakdown.append(('spr/x1', 1))
-        
-        # SPUHIM-A pattern (similar)
-        elif 'SPUHIM' in combo_name and '-A' in combo_name:
-            breakdown.append(('COF1', 1))
-            breakdown.append(('spr/x1', 1))
-        
-        # HIM1 or HIM1-A = 1 box of HIM Coffee
-        elif combo_name == 'HIM1' or combo_name.startswith('HIM1-'):
-            breakdown.append(('COF1', 1))
-        
-        # HER1 = 1 box of HER Coffee
-        elif combo_name == 'HER1' or combo_name.startswith('HER1-'):
-            breakdown.append(('HERCOF1', 1))
-        
-        # HIM2 = 2 boxes of HIM Coffee
-        elif combo_name == 'HIM2' or combo_name.startswith('HIM2-'):
-            breakdown.append(('COF1', 2))
-        
-        # HIMHER1 pattern (1 HIM + 1 HER)
-        elif combo_name == 'HIMHER1':
-            breakdown.append(('COF1', 1))
-            breakdown.append(('HERCOF1', 1))
-        
-        # 2HIMVGO pattern (2 HIM Coffee + 1 VIGOMAX)
-        elif combo_name == '2HIMVGO':
-            breakdown.append(('COF1', 2))
-            breakdown.append(('VGOMX', 1))
-        
-        # 3HIM3HER pattern (3 HIM Coffee + 3 HER Coffee)
-        elif combo_name == '3HIM3HER':
-            breakdown.append(('COF1', 3))
-            breakdown.append(('HERCOF1', 3))
-        
-        # HIM3SHA-V2 pattern (3 HIM Coffee + Shaker)
-        elif 'HIM3SHA' in combo_name:
-            breakdown.append(('COF1', 3))
-            breakdown.append(('SHAKER', 1))
-        
-        # HER3SHA-V2 pattern (3 HER Coffee + Shaker)
-        elif 'HER3SHA' in combo_name:
-            breakdown.append(('HERCOF1', 3))
-            breakdown.append(('SHAKER', 1))
-        
-        # HIM3TP pattern (3 HIM Coffee + Trial Pack)
-        elif combo_name == 'HIM3TP':
-            breakdown.append(('COF1', 3))
-            breakdown.append(('TP-COF', 1))
-        
-        # HER3TP pattern (3 HER Coffee + Trial Pack)
-        elif combo_name == 'HER3TP':
-            breakdown.append(('HERCOF1', 3))
-            breakdown.append(('TP-HERCOF', 1))
-        
-        # TPHIM pattern (Trial Pack HIM)
-        elif combo_name == 'TPHIM':
-            breakdown.append(('TP-COF', 1))
-        
-        # TPHER pattern (Trial Pack HER)
-        elif combo_name == 'TPHER':
-            breakdown.append(('TP-HERCOF', 1))
-        
-        # COFFEECUP-V1 or COFFEE CUP V1 pattern
-        elif 'COFFEECUP' in combo_name or 'COFFEE CUP' in combo_name:
-            breakdown.append(('COFFEE CUP V1', 1))
+    def __init__(self, combo_skus=()):
+        self.combo_skus = set(combo_skus)
+        compiled = [(scope, re.compile(pattern), tuple(units)) for scope, pattern, units in SKU_RULES]
+        self.rules = {
+            scope: [(pattern, units) for rule_scope, pattern, units in compiled if rule_scope in (scope, 'any')]
+            for scope in ('combo', 'order')
+        }
+        self._cache = {}
+    
+    def resolve_one(self, sku):
+        """Return the breakdown for a single SKU string"""
+        if sku in self._cache:
+            return self._cache[sku]
         
-        # SHA-V2 pattern (Shaker)
-        elif 'SHA-V2' in combo_name or 'SHAKER' in combo_name:
-            breakdown.append(('SHAKER', 1))
+        scope = 'combo' if sku in self.combo_skus else 'order'
+        breakdown = ()
+        for pattern, units in self.rules[scope]:
+            match = pattern.search(sku)
+            if match:
+                breakdown = tuple(
+                    (single_sku, int(match.group(1)) if qty is CAPTURED_QTY else qty)
+                    for single_sku, qty in units
+                )
+                break
         
-        # If no pattern matched, check if it's already a single SKU
-        if not breakdown:
-            # Check if it exists in single SKU list
-            if combo_name in single_sku['SKU Name'].values:
-                breakdown.append((combo_name, 1))
-            else:
-                # Default: keep as is (might be a combo we don't know how to break down)
-                breakdown.append((combo_name, 1))
+        # Default: keep combo sheet SKUs as is (might be a combo we don't know how to break down)
+        if not breakdown and scope == 'combo':
+            breakdown = ((sku, 1),)
         
-        mapping[combo_name] = breakdown
-    
-    return mapping
-
-# Load all data files
-print("Loading data files...")
-
-# BigSeller Orders
-print("Loading BigSeller Orders...")
-bigseller = pd.read_csv('Data/BigSeller Orders/bigseller_orders.csv', low_memory=False)
-
-# TikTok Shop Orders - DrSamhanWellness (FACT TABLE)
-print("Loading TikTok Shop Orders - DrSamhanWellness (FACT TABLE)...")
-tt_dr_oct = pd.read_csv('Data/DrSamhanWellness/creator_order_all_20251001000000_20251031235959_864265660.csv')
-tt_dr_nov = pd.read_csv('Data/DrSamhanWellness/creator_order_all_20251101000000_20251118235959_800700552.csv')
-tt_dr_oct['source'] = 'DrSamhanWellness'
-tt_dr_nov['source'] = 'DrSamhanWellness'
-
-# TikTok Shop Orders - HIM Clinic (FACT TABLE)
-print("Loading TikTok Shop Orders - HIM Clinic (FACT TABLE)...")
-tt_him_oct = pd.read_csv('Data/HIM Clinic/creator_order_all_20251001000000_20251031235959_2611784.csv')
-tt_him_nov = pd.read_csv('Data/HIM Clinic/creator_order_all_20251101000000_20251119235959_462128984.csv')
-tt_him_oct['source'] = 'HIM Clinic'
-tt_him_nov['source'] = 'HIM Clinic'
-
-# Combine TikTok orders from FACT TABLES only
-tiktok_orders = pd.concat([tt_dr_oct, tt_dr_nov, tt_him_oct, tt_him_nov], ignore_index=True)
-print(f"Total TikTok orders loaded from FACT TABLES: {len(tiktok_orders)}")
-
-# Filter BigSeller for Oct-Nov 2025 and TikTok marketplace only
-print("\nFiltering BigSeller for Oct-Nov 2025 and TikTok marketplace...")
-bigseller['order_date'] = pd.to_datetime(bigseller['order_date'], errors='coerce')
-bigseller_oct_nov = bigseller[
-    (bigseller['order_date'] >= '2025-10-01') & 
-    (bigseller['order_date'] <= '2025-11-30') &
-    (bigseller['marketplace'] == 'TikTok')
-].copy()
-print(f"BigSeller Oct-Nov TikTok orders: {len(bigseller_oct_nov)}")
-
-# Filter for Completed/Shipped/Processing status
-print("\nFiltering for Completed/Shipped/Processing status...")
-bigseller_filtered = bigseller_oct_nov[
-    bigseller_oct_nov['order_status'].isin(['Completed', 'Shipped', 'Processing'])
-].copy()
-print(f"BigSeller Completed/Shipped/Processing TikTok: {len(bigseller_filtered)}")
-
-tiktok_filtered = tiktok_orders[
-    tiktok_orders['Order Status'].isin(['Completed', 'Shipped', 'Processing'])
-].copy()
-print(f"TikTok Completed/Shipped/Processing: {len(tiktok_filtered)}")
-
-# Prepare TikTok data for merging
-print("\nPreparing TikTok data for linking...")
-tiktok_filtered['Order ID'] = tiktok_filtered['Order ID'].astype(str)
-tiktok_filtered['sales_channel'] = tiktok_filtered.apply(
-    lambda row: f"TikTok Shop - {row['Creator Username']} - {row['Content Type']}"
-    if pd.notna(row['Creator Username']) and pd.notna(row['Content Type'])
-    else f"TikTok Shop - {row['Creator Username']}" if pd.notna(row['Creator Username'])
-    else "TikTok Shop - Unknown",
-    axis=1
-)
-tiktok_filtered['sku'] = tiktok_filtered['Seller SKU'].astype(str)
-tiktok_filtered['quantity'] = pd.to_numeric(tiktok_filtered['Quantity'], errors='coerce').fillna(0)
-
-# Create lookup dictionaries for TikTok orders
-# First, create lookup by Order ID only (for cases where SKU might not match exactly)
-tiktok_order_lookup = tiktok_filtered.groupby('Order ID').agg({
-    'Content Type': 'first',  # Get content type
-    'Creator Username': 'first'
-}).reset_index()
-
-tiktok_order_content_type = {}
-tiktok_order_creator = {}
+        self._cache[sku] = breakdown
+        return breakdown
+    
+    def resolve(self, skus):
+        """Resolve many SKU strings at once, returning {sku: breakdown} for each distinct SKU"""
+        return {sku: self.resolve_one(sku) for sku in dict.fromkeys(skus)}
+
+# Function to load the combo SKU sheet into a resolver
+def create_sku_resolver(path=COMBO_SKU_PATH, cache_dir=INPUT_CACHE_DIR):
+    """Create a SkuResolver for the SKU names in the combo SKU sheet"""
+    combo_sku = cached_read(path, pd.read_excel, cache_dir=cache_dir)
+    combo_names = combo_sku['SKU Name'].dropna().astype(str).str.strip()
+    combo_names = combo_names[(combo_names != '') & (combo_names != 'nan')]
+    return SkuResolver(combo_names)
+
+# Function to build the long-form combo breakdown table used by the expansion
+def build_sku_breakdown_table(combo_skus, sku_resolver):
+    """Build one row per (combo SKU, unit SKU) with multiplier and revenue weights.
+
+    Revenue for an order line is quantity * (price * revenue_weight + unit_revenue),
+    which reproduces calculate_combo_revenue for mapped/inferred combos and the
+    list-price / combo-price fallback for SKUs that cannot be broken down.
+    """
+    rows = []
+    for combo_sku, breakdown in sku_resolver.resolve(combo_skus).items():
+        if breakdown:
+            # Revenue share per unit SKU for a combo price of 1
+            weights = calculate_combo_revenue(breakdown, 1.0)
+            for single_sku, multiplier in breakdown:
+                weight = weights.get(single_sku, 0) if multiplier > 0 else 0
+                rows.append((combo_sku, single_sku, multiplier, weight, 0.0))
+        elif combo_sku in PRODUCT_PRICES:
+            # Single product, use individual price
+            rows.append((combo_sku, combo_sku, 1, 0.0, PRODUCT_PRICES[combo_sku]))
+        else:
+            # Unknown product, use combo price
+            rows.append((combo_sku, combo_sku, 1, 1.0, 0.0))
+    
+    return pd.DataFrame(rows, columns=['combo_sku', 'sku', 'multiplier', 'revenue_weight', 'unit_revenue'])
+
+# Function to convert a text column to a categorical via its distinct values
+def text_categories(values, strip=False):
+    """Return values.astype(str) (optionally .str.strip()) as a Categorical.
+
+    Each distinct value is converted once. Missing values become MISSING_SKU, so on every
+    pandas version they are linked and counted like the original row loops did.
+    """
+    values = values.astype('category')
+    categories = values.cat.categories.astype(str)
+    if strip:
+        categories = categories.str.strip()
+    positions, categories = pd.factorize(categories)
+    codes = values.cat.codes.to_numpy()
+    missing = codes < 0
+    codes = np.where(missing, -1, positions[codes])
+    if missing.any():
+        if MISSING_SKU not in categories:
+            categories = categories.append(pd.Index([MISSING_SKU]))
+        codes[missing] = categories.get_loc(MISSING_SKU)
+    return pd.Categorical.from_codes(codes, categories)
+
+# Function to put two categoricals on the same categories
+def align_categories(left, right):
+    """Return (left, right) recoded to the union of their categories, so merges compare codes"""
+    categories = left.categories.union(right.categories)
+    return left.set_categories(categories), right.set_categories(categories)
+
+# Function to break down order lines into individual units
+def expand_combo_sales(orders, sku_resolver, keys=('sales_channel', 'content_type')):
+    """Explode order lines into unit SKU rows with quantity_sold and allocated revenue (EXPANDED_SCHEMA dtypes).
+
+    keys are the order columns carried onto every unit SKU row ('combo_sku' is the stripped
+    order SKU).
+    """
+    combo_sku = text_categories(orders['sku'], strip=True)
+    lines = pd.DataFrame({
+        **{key: orders[key].array for key in keys if key != 'combo_sku'},
+        'combo_sku': combo_sku,
+        'combo_quantity': orders['quantity'].to_numpy(),
+        'combo_price': pd.to_numeric(orders['price'], errors='coerce').fillna(0).to_numpy(),
+    })
+    
+    # Resolve each distinct SKU once, then explode all lines with a single join on the
+    # categorical codes (the breakdown table shares the order lines' SKU categories)
+    breakdown_table = build_sku_breakdown_table(combo_sku.categories, sku_resolver)
+    breakdown_table['combo_sku'] = pd.Categorical(breakdown_table['combo_sku'], categories=combo_sku.categories)
+    breakdown_table['sku'] = breakdown_table['sku'].astype('category')
+    expanded = lines.merge(breakdown_table, on='combo_sku', how='inner', sort=False)
+    
+    quantity = expanded['combo_quantity'].to_numpy()
+    return apply_schema(pd.DataFrame({
+        **{key: expanded[key] for key in keys},
+        'sku': expanded['sku'],
+        'quantity_sold': quantity * expanded['multiplier'].to_numpy(),
+        'revenue': quantity * (expanded['combo_price'].to_numpy() * expanded['revenue_weight'].to_numpy()
+                               + expanded['unit_revenue'].to_numpy()),
+    }), EXPANDED_SCHEMA)
+
+# Function to sum order lines by content type and combo SKU
+def aggregate_combo_sales(orders, keys=('content_type',)):
+    """Sum quantity and line value (quantity * price) by keys (default content_type) and combo SKU"""
+    quantity = orders['quantity'].to_numpy()
+    lines = pd.DataFrame({
+        **{key: orders[key].array for key in keys},
+        'combo_sku': text_categories(orders['sku'], strip=True),
+        'combo_quantity': quantity,
+        'combo_value': quantity * pd.to_numeric(orders['price'], errors='coerce').fillna(0).to_numpy(),
+    })
+    return lines.groupby([*keys, 'combo_sku'], observed=True).agg({
+        'combo_quantity': 'sum',
+        'combo_value': 'sum'
+    }).reset_index()
+
+# Function to allocate combo totals to unit SKUs
+def allocate_combo_sales(combo_sales, sku_resolver, keys=('content_type',)):
+    """Map (keys, combo SKU) totals onto unit SKUs and sum them by (keys, sku).
+
+    The breakdown table is the sparse combo x unit SKU allocation matrix in coordinate
+    form. Each unit SKU gets multiplier * quantity units and value * revenue_weight +
+    quantity * unit_revenue revenue, which is what summing expand_combo_sales rows gives,
+    but the work scales with distinct (content_type, combo) pairs instead of order lines.
+    """
+    combo_sku = combo_sales['combo_sku'].astype('category')
+    breakdown_table = build_sku_breakdown_table(combo_sku.cat.categories, sku_resolver)
+    breakdown_table['combo_sku'] = pd.Categorical(breakdown_table['combo_sku'], categories=combo_sku.cat.categories)
+    allocated = combo_sales.assign(combo_sku=combo_sku).merge(breakdown_table, on='combo_sku', how='inner', sort=False)
+    
+    quantity = allocated['combo_quantity'].to_numpy()
+    return aggregate_sales(pd.DataFrame({
+        **{key: allocated[key] for key in keys},
+        'sku': allocated['sku'],
+        'quantity_sold': quantity * allocated['multiplier'].to_numpy(),
+        'revenue': (allocated['combo_value'].to_numpy() * allocated['revenue_weight'].to_numpy()
+                    + quantity * allocated['unit_revenue'].to_numpy()),
+    }), [*keys, 'sku'])
+
+# Function to normalize content type labels from the TikTok fact tables
 def normalize_content_type(content_type):
     """Normalize content type variations"""
     if pd.isna(content_type) or content_type == '':
@@ -282,247 +422,1447 @@ def normalize_content_type(content_type):
         return 'External Traffic Programme'
     return content_type_str
 
-for _, row in tiktok_order_lookup.iterrows():
-    order_id = str(row['Order ID'])
-    tiktok_order_content_type[order_id] = normalize_content_type(row['Content Type'])
-    tiktok_order_creator[order_id] = row['Creator Username'] if pd.notna(row['Creator Username']) else 'Unknown'
-
-# Also create lookup by Order ID + SKU for more precise matching
-tiktok_lookup = tiktok_filtered.groupby(['Order ID', 'sku']).agg({
-    'sales_channel': 'first',
-    'Content Type': 'first',
-    'quantity': 'sum'
-}).reset_index()
-tiktok_lookup_dict = {}
-tiktok_content_type_dict = {}
-for _, row in tiktok_lookup.iterrows():
-    key = (str(row['Order ID']), str(row['sku']))
-    tiktok_lookup_dict[key] = row['sales_channel']
-    tiktok_content_type_dict[key] = normalize_content_type(row['Content Type'])
-
-print(f"Created lookup dictionaries with {len(tiktok_lookup_dict)} entries (Order ID + SKU)")
-print(f"Created Order ID lookup with {len(tiktok_order_content_type)} entries")
-print(f"Sample content types in lookup: {list(set(list(tiktok_content_type_dict.values())[:20]))}")
-
-
-# Process BigSeller data
-print("Processing BigSeller data and linking with TikTok...")
-bigseller_filtered['order_no'] = bigseller_filtered['order_no'].astype(str)
-bigseller_filtered['sku'] = bigseller_filtered['sku'].astype(str)
-bigseller_filtered['quantity'] = pd.to_numeric(bigseller_filtered['quantity'], errors='coerce').fillna(0)
-
-# Create sales channel and content type: use creator/content type from TikTok data when available
-# Otherwise use TikTok store name
-def get_sales_channel(row):
-    # Try to find in TikTok lookup (has creator/content type info)
-    key = (str(row['order_no']), str(row['sku']))
-    if key in tiktok_lookup_dict:
-        return tiktok_lookup_dict[key]
-    # If not found, use default TikTok format with store name
-    return f"TikTok - {row['marketplace_store']}" if pd.notna(row['marketplace_store']) and row['marketplace_store'] != '' else "TikTok - Unknown"
-
-def get_content_type(row):
-    order_id = str(row['order_no']).strip()
-    sku = str(row['sku']).strip()
-    # First try exact match with Order ID + SKU
-    key = (order_id, sku)
-    if key in tiktok_content_type_dict:
-        return tiktok_content_type_dict[key]
-    # If not found, try lookup by Order ID only (fallback)
-    if order_id in tiktok_order_content_type:
-        return tiktok_order_content_type[order_id]
-    # If still not found, return Unknown
-    return 'Unknown'
-
-bigseller_filtered['sales_channel'] = bigseller_filtered.apply(get_sales_channel, axis=1)
-bigseller_filtered['content_type'] = bigseller_filtered.apply(get_content_type, axis=1)
-
-# Separate orders: those with content type (from FACT TABLES) vs those without
-bigseller_with_content_type = bigseller_filtered[bigseller_filtered['content_type'] != 'Unknown'].copy()
-bigseller_without_content_type = bigseller_filtered[bigseller_filtered['content_type'] == 'Unknown'].copy()
-
-print(f"\nContent type distribution after lookup:")
-print(bigseller_filtered['content_type'].value_counts())
-print(f"\nTotal rows: {len(bigseller_filtered)}")
-print(f"Rows with content type (from FACT TABLES): {len(bigseller_with_content_type)}")
-print(f"Rows without content type (to be listed separately): {len(bigseller_without_content_type)}")
-
-
-# Save orders without content type to a separate table
-if len(bigseller_without_content_type) > 0:
-    unknown_content_type_table = bigseller_without_content_type[['order_no', 'order_date', 'order_status', 'marketplace', 'marketplace_store', 'sku', 'quantity', 'price', 'product_subtotal', 'order_total']].copy()
-    unknown_content_type_table.to_csv('tiktok_orders_unknown_content_type.csv', index=False)
-    print(f"\nSaved {len(unknown_content_type_table)} TikTok orders without content type to: tiktok_orders_unknown_content_type.csv")
-
-# Create SKU mapping
-print("\nCreating SKU mapping from combo to single SKUs...")
-sku_mapping = create_sku_mapping()
-print(f"Created mapping for {len(sku_mapping)} SKUs")
-
-# Break down combo SKUs into single SKUs
-# ONLY process orders from FACT TABLES (those with content_type != 'Unknown')
-print("\nBreaking down combo SKUs into individual units (FACT TABLE orders only)...")
-expanded_sales = []
-
-for _, row in bigseller_with_content_type.iterrows():
-    sales_channel = row['sales_channel']
-    content_type = row['content_type']
-    combo_sku = str(row['sku']).strip()
-    combo_quantity = row['quantity']
-    combo_price = pd.to_numeric(row.get('price', 0), errors='coerce') or 0
-    
-    # Check if this SKU is in our mapping
-    if combo_sku in sku_mapping:
-        # Break down the combo SKU
-        breakdown = sku_mapping[combo_sku]
-        # Calculate revenue distribution
-        revenue_dict = calculate_combo_revenue(breakdown, combo_price)
+# Function to normalize a whole column of content types
+def normalize_content_types(content_types):
+    """Apply normalize_content_type to each distinct value once and broadcast the result"""
+    codes, uniques = pd.factorize(content_types)
+    # Missing values get code -1, which picks the trailing 'Unknown'
+    normalized = np.array([normalize_content_type(value) for value in uniques] + ['Unknown'], dtype=object)
+    return normalized[codes]
+
+# Function to build TikTok sales channel labels
+def build_tiktok_sales_channel(tiktok):
+    """Build 'TikTok Shop - <creator> - <content type>' labels with column operations"""
+    creator = tiktok['Creator Username']
+    content_type = tiktok['Content Type']
+    has_creator = creator.notna().to_numpy()
+    has_both = has_creator & content_type.notna().to_numpy()
+    
+    # Labels for every row in one step: a masked assignment fails on pandas 3 when no row has both
+    with_creator = 'TikTok Shop - ' + creator.fillna('').astype(str).to_numpy(dtype=object)
+    with_both = with_creator + ' - ' + content_type.fillna('').astype(str).to_numpy(dtype=object)
+    sales_channel = np.where(has_both, with_both, np.where(has_creator, with_creator, 'TikTok Shop - Unknown'))
+    return pd.Series(sales_channel, index=tiktok.index, dtype=object)
+
+# Function to build the TikTok attribution lookup tables
+def build_tiktok_lookups(tiktok):
+    """Build the Order ID and (Order ID, SKU) lookup tables with normalized content types"""
+    order_lookup = tiktok.groupby('Order ID', observed=True).agg({
+        'Content Type': 'first',  # Get content type
+        'Creator Username': 'first'
+    }).reset_index()
+    order_lookup['content_type'] = normalize_content_types(order_lookup['Content Type'])
+    
+    sku_lookup = tiktok.groupby(['Order ID', 'sku'], observed=True).agg({
+        'sales_channel': 'first',
+        'Content Type': 'first',
+        'quantity': 'sum'
+    }).reset_index()
+    sku_lookup['content_type'] = normalize_content_types(sku_lookup['Content Type'])
+    return order_lookup, sku_lookup
+
+# Function to link BigSeller rows with the TikTok lookups
+def attribute_orders(orders, order_lookup, sku_lookup):
+    """Return (sales_channel, content_type, matched) arrays for BigSeller rows using left merges.
+
+    Sales channel comes from an exact (order_no, sku) match, otherwise the TikTok store
+    name. Content type tries (order_no, sku) first, then order_no only, then 'Unknown'.
+    matched marks rows found by either content type lookup.
+    """
+    order_no = orders['order_no'].astype(str)
+    # SKU keys are categoricals on shared categories, so the merges compare integer codes
+    sku, lookup_sku = align_categories(text_categories(orders['sku']), text_categories(sku_lookup['sku']))
+    
+    # Sales channel: exact match on the raw keys
+    keys = pd.DataFrame({'Order ID': order_no.to_numpy(), 'sku': sku})
+    lookup = pd.DataFrame({'Order ID': sku_lookup['Order ID'].to_numpy(), 'sku': lookup_sku,
+                           'sales_channel': sku_lookup['sales_channel'].to_numpy()})
+    sales_channel = keys.merge(lookup, on=['Order ID', 'sku'], how='left')['sales_channel'].to_numpy()
+    store = orders['marketplace_store']
+    has_store = store.notna() & (store != '')
+    store_channel = ('TikTok - ' + store.astype(str)).where(has_store, 'TikTok - Unknown').to_numpy(dtype=object)
+    sales_channel = np.where(pd.isna(sales_channel), store_channel, sales_channel)
+    
+    # Content type: exact match on the stripped keys, then fall back to Order ID only
+    sku, lookup_sku = align_categories(text_categories(orders['sku'], strip=True), text_categories(sku_lookup['sku']))
+    keys = pd.DataFrame({'Order ID': order_no.str.strip().to_numpy(), 'sku': sku})
+    lookup = pd.DataFrame({'Order ID': sku_lookup['Order ID'].to_numpy(), 'sku': lookup_sku,
+                           'content_type': sku_lookup['content_type'].to_numpy()})
+    exact_content_type = keys.merge(lookup, on=['Order ID', 'sku'], how='left')['content_type']
+    order_content_type = keys[['Order ID']].merge(
+        order_lookup[['Order ID', 'content_type']], on='Order ID', how='left'
+    )['content_type']
+    content_type = exact_content_type.fillna(order_content_type)
+    matched = content_type.notna().to_numpy()
+    content_type = content_type.fillna('Unknown').to_numpy()
+    
+    return sales_channel, content_type, matched
+
+# Function to reduce Order IDs written in any number format to the integer they spell
+def normalize_order_ids(order_ids):
+    """Return a frame (significand, length, carried) describing the integer each text Order ID spells.
+
+    Surrounding spaces, quotes and Excel's ="..." are dropped, zero decimals of a float are
+    removed and scientific notation is expanded. significand holds the integer's digits without
+    leading and trailing zeros and length its number of digits (0 when the ID is not an
+    integer), so IDs spell the same integer when both match. carried is the number of leading
+    digits the ID really carries; it is less than length for scientific notation and for IDs
+    longer than EXCEL_DIGITS that end in Excel's padding zeros. These are column operations
+    on the distinct IDs.
+    """
+    codes, uniques = pd.factorize(pd.Series(order_ids, dtype='str'))
+    text = pd.Series(uniques, dtype='str').str.strip(' \t="\'')
+    # Regex replaces rather than str.extract, which runs per ID even on Arrow-backed strings
+    is_number = text.str.fullmatch(r'\+?\d*(\.\d*)?([eE][+-]?\d+)?').fillna(False).to_numpy(dtype=bool)
+    scientific = text.str.contains('[eE]').fillna(False).to_numpy(dtype=bool)
+    mantissa = text.str.replace(r'[eE].*$', '', regex=True)
+    fraction = mantissa.str.replace(r'^[^.]*\.?', '', regex=True)
+    exponent = pd.to_numeric(text.str.replace(r'^[^eE]*[eE]?', '', regex=True), errors='coerce').fillna(0)
+    digits = (mantissa.str.replace(r'\..*$', '', regex=True) + fraction).str.lstrip('+0')
+    significand = digits.str.rstrip('0')
+    # The decimals move the point left and the exponent right; decimals left over are not an integer
+    digit_count = digits.str.len().to_numpy(dtype=np.int64)
+    length = digit_count - fraction.str.len().to_numpy(dtype=np.int64) + exponent.to_numpy(dtype=np.int64)
+    significand_count = significand.str.len().to_numpy(dtype=np.int64)
+    is_integer = is_number & (length > 0) & (significand_count <= length)
+    
+    excel_padded = (length > EXCEL_DIGITS) & (significand_count <= EXCEL_DIGITS)
+    carried = np.where(scientific, np.minimum(digit_count, length), np.where(excel_padded, EXCEL_DIGITS, length))
+    normalized = pd.DataFrame({
+        'significand': significand.where(is_integer, '').to_numpy(dtype=object)[codes],
+        'length': np.where(is_integer, length, 0)[codes],
+        'carried': np.where(is_integer, carried, 0).astype(np.int64)[codes],
+    })
+    normalized.loc[codes < 0, ['significand', 'length', 'carried']] = ['', 0, 0]
+    return normalized
+
+# Function to find Order IDs already written as plain digits
+def plain_order_ids(order_ids):
+    """Return a boolean mask of the Order IDs that are plain digits without leading zeros"""
+    return pd.Series(order_ids, dtype='str').str.fullmatch(r'[1-9]\d*').fillna(False).to_numpy(dtype=bool)
+
+# Function to turn normalized Order IDs of up to 19 digits into integers
+def order_id_values(normalized):
+    """Return the uint64 value of each normalize_order_ids row (all rows must have 1-19 digits)"""
+    significand = normalized['significand'].to_numpy(dtype=str).astype(np.uint64)
+    zeros = normalized['length'].to_numpy() - normalized['significand'].str.len().to_numpy()
+    return significand * np.power(np.uint64(10), zeros.astype(np.uint64))
+
+# Function to bound the integers a possibly rounded Order ID stands for
+def order_id_windows(normalized):
+    """Return (low, high) uint64 bounds for each normalize_order_ids row (all rows must have 1-19 digits).
+
+    An ID rounded to at least RECONCILE_MIN_DIGITS digits stands for any integer of the same
+    length within half a unit of its last carried digit plus the float64 spacing; any other
+    ID only for its own value.
+    """
+    value = order_id_values(normalized)
+    length = normalized['length'].to_numpy()
+    carried = normalized['carried'].to_numpy()
+    rounded = (carried < length) & (carried >= RECONCILE_MIN_DIGITS)
+    unit = np.power(np.uint64(10), (length - np.minimum(carried, length)).astype(np.uint64))
+    tolerance = np.where(rounded, unit // np.uint64(2) + np.spacing(value.astype(np.float64)).astype(np.uint64),
+                         np.uint64(0))
+    low = np.maximum(value - np.minimum(tolerance, value), np.power(np.uint64(10), (length - 1).astype(np.uint64)))
+    high = np.minimum(value + tolerance, np.power(np.uint64(10), length.astype(np.uint64)) - np.uint64(1))
+    return low, high
+
+# Function to select the fact Order IDs some windows can match
+def order_ids_in_windows(order_ids, low, high):
+    """Return a mask of the Order IDs that are not plain digits or lie in one of the low-high windows"""
+    order_ids = pd.Series(order_ids, dtype='str')
+    plain = plain_order_ids(order_ids) & (order_ids.str.len() <= 19).to_numpy(dtype=bool)
+    inside = np.zeros(len(order_ids), dtype=bool)
+    if len(low) and plain.any():
+        order = np.argsort(low)
+        low, reach = low[order], np.maximum.accumulate(high[order])
+        value = order_ids[plain].to_numpy(dtype=str).astype(np.uint64)
+        window = np.searchsorted(low, value, side='right') - 1
+        inside[plain] = (window >= 0) & (value <= reach[np.maximum(window, 0)])
+    return ~plain_order_ids(order_ids) | inside
+
+# Function to match Order IDs to fact table Order IDs through their normalized form
+def match_order_ids(order_ids, fact_order_ids, skus=None, fact_skus=None):
+    """Return (positions, rounded): for each of order_ids the position of its fact_order_ids match (-1: none).
+
+    An ID matches the first fact Order ID that spells the same integer (normalize_order_ids).
+    IDs that only carry their leading digits (scientific notation, Excel padding) get a rounded
+    match: the fact Order ID within their rounding error (half a unit of the last carried digit
+    plus the float64 spacing), if exactly one is left and at least RECONCILE_MIN_DIGITS digits
+    are carried. With skus (one per ID) and fact_skus (Order ID and sku columns), IDs with
+    several candidates keep only those that have the ID's SKU. The matching is a merge, a
+    binary search over the sorted fact values and a join of the candidate pairs, not per-ID
+    probes.
+    """
+    keys = ['significand', 'length']
+    normalized = normalize_order_ids(order_ids)
+    fact_order_ids = np.asarray(fact_order_ids, dtype=object)
+    facts = normalize_order_ids(fact_order_ids).assign(position=np.arange(len(fact_order_ids)))
+    facts = facts[facts['length'] > 0].drop_duplicates(keys)
+    positions = normalized[keys].merge(facts[keys + ['position']], on=keys, how='left')['position']
+    positions = positions.fillna(-1).to_numpy(dtype=np.int64)
+    rounded = np.zeros(len(normalized), dtype=bool)
+    
+    # Up to 19 digits fit in uint64, so candidates come from a search over sorted integers
+    length = normalized['length'].to_numpy()
+    carried = normalized['carried'].to_numpy()
+    candidates = np.flatnonzero((positions < 0) & (length <= 19) & (carried < length)
+                                & (carried >= RECONCILE_MIN_DIGITS))
+    facts = facts[facts['length'] <= 19]
+    if len(candidates) and len(facts):
+        values = order_id_values(facts)
+        order = np.argsort(values)
+        values, fact_positions = values[order], facts['position'].to_numpy()[order]
+        low, high = order_id_windows(normalized.iloc[candidates])
+        low = np.searchsorted(values, low, side='left')
+        counts = np.searchsorted(values, high, side='right') - low
         
-        for single_sku, multiplier in breakdown:
-            quantity = combo_quantity * multiplier
-            # Get revenue for this product (per unit)
-            revenue_per_unit = revenue_dict.get(single_sku, 0) / multiplier if multiplier > 0 else 0
-            total_revenue = revenue_per_unit * quantity
-            
-            expanded_sales.append({
-                'sales_channel': sales_channel,
-                'content_type': content_type,
-                'sku': single_sku,
-                'quantity_sold': quantity,
-                'revenue': total_revenue
+        # One (ID, fact Order ID) pair per candidate in the window
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pairs = pd.DataFrame({
+            'id': np.repeat(candidates, counts),
+            'position': fact_positions[np.repeat(low, counts) + offsets],
+        })
+        ambiguous = pairs['id'].duplicated(keep=False)
+        if skus is not None and ambiguous.any():
+            # Of several candidates, keep the ones with the row's SKU
+            tied = pairs[ambiguous]
+            tied = tied.assign(**{
+                'Order ID': fact_order_ids[tied['position'].to_numpy()].astype(str),
+                'sku': np.asarray(skus, dtype=object)[tied['id'].to_numpy()].astype(str),
             })
+            fact_pairs = pd.DataFrame({'Order ID': fact_skus['Order ID'].to_numpy(dtype=object).astype(str),
+                                       'sku': fact_skus['sku'].to_numpy(dtype=object).astype(str)})
+            tied = tied.merge(fact_pairs.drop_duplicates(), on=['Order ID', 'sku'])[['id', 'position']]
+            pairs = pd.concat([pairs[~ambiguous], tied], ignore_index=True)
+        pairs = pairs.drop_duplicates('id', keep=False)
+        positions[pairs['id'].to_numpy()] = pairs['position'].to_numpy()
+        rounded[pairs['id'].to_numpy()] = True
+    return positions, rounded
+
+# Function to convert frame columns to their compact dtypes
+def apply_schema(frame, schema):
+    """Convert the schema columns present in frame to their dtypes (in place) and return frame.
+
+    'integer' downcasts integer columns to the narrowest integer type; float columns (e.g.
+    quantities with missing values) are left as they are.
+    """
+    for column, dtype in schema.items():
+        if column not in frame.columns:
+            continue
+        values = frame[column]
+        if dtype == 'integer':
+            if pd.api.types.is_integer_dtype(values.dtype):
+                frame[column] = pd.to_numeric(values, downcast='integer')
+        elif values.dtype != dtype:
+            frame[column] = values.astype(dtype)
+    return frame
+
+# Function to concatenate frames without losing categorical dtypes
+def concat_frames(frames):
+    """pd.concat that unions the categories of categorical columns so they stay categorical"""
+    frames = list(frames)
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = sorted(set().union(*(frame[column].cat.categories for frame in frames)))
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+# Function to fingerprint order lines
+def line_fingerprints(lines, order_column, key_columns, state=None, candidates=None):
+    """Return (fingerprints, state): 64-bit fingerprints of order lines and the state for the next chunk.
+
+    A fingerprint hashes the key columns (as text) and the number of identical lines of the
+    same order before it. Lines come in order blocks (consecutive rows of one order): a later
+    block that repeats the order's first block line for line (an overlapping export listing
+    the order again) counts from zero again, so it gets the first block's fingerprints, while
+    any other later block continues the order's counts, so identical lines of one order stay
+    distinct wherever they are. state['split_blocks'] counts those other later blocks (the
+    file is not grouped by order). Chunks must end at a block boundary (see order_blocks);
+    pass the returned state with the next chunk of the same file. candidates masks the lines
+    that can be kept; it must follow from the key columns, and only their counts are carried
+    to the next chunk.
+    """
+    if state is None:
+        state = {'first_blocks': SortedRuns(np.uint64), 'counts': SortedRuns(np.int64), 'split_blocks': 0}
+    if len(lines) == 0:
+        return np.empty(0, dtype=np.uint64), state
+    content = pd.util.hash_pandas_object(lines[key_columns].astype(str), index=False).to_numpy()
+    order = pd.util.hash_array(lines[order_column].astype(str).to_numpy(dtype=object))
+    new_block = np.ones(len(lines), dtype=bool)
+    new_block[1:] = order[1:] != order[:-1]
+    block = np.cumsum(new_block) - 1
+    in_block = pd.DataFrame({'block': block, 'content': content}).groupby(
+        ['block', 'content'], sort=False).cumcount().to_numpy()
+    
+    # A block's lines as a multiset: XOR of its (distinct) line hashes
+    starts = np.flatnonzero(new_block)
+    block_hash = np.bitwise_xor.reduceat(pd.util.hash_pandas_object(
+        pd.DataFrame({'content': content, 'occurrence': in_block}), index=False).to_numpy(), starts)
+    block_order = order[starts]
+    earlier, earlier_hash = state['first_blocks'].get(block_order)
+    first_here = ~pd.Series(block_order).duplicated().to_numpy() & ~earlier
+    first_hash = pd.Series(block_hash).groupby(block_order).transform('first').to_numpy(copy=True)
+    first_hash[earlier] = earlier_hash[earlier]
+    repeated = ~first_here & (block_hash == first_hash)
+    
+    # Lines of the other blocks continue their order's counts
+    counted = ~repeated[block]
+    occurrence = in_block.copy()
+    counted_content = content[counted]
+    _, prior = state['counts'].get(counted_content)
+    occurrence[counted] = pd.Series(counted_content).groupby(counted_content).cumcount().to_numpy() + prior
+    fingerprints = pd.util.hash_pandas_object(
+        pd.DataFrame({'content': content, 'occurrence': occurrence}), index=False).to_numpy()
+    
+    # Carry the state forward in place; lines that can never be kept need no counts
+    state['first_blocks'].add(block_order[first_here], block_hash[first_here])
+    if candidates is not None:
+        counted_content = content[counted & np.asarray(candidates, dtype=bool)]
+    totals = pd.Series(counted_content).value_counts()
+    state['counts'].add(totals.index.to_numpy(), totals.to_numpy())
+    state['split_blocks'] += int((~first_here & ~repeated).sum())
+    return fingerprints, state
+
+# Function to cut a file's chunks at order block boundaries
+def order_blocks(chunks, order_column):
+    """Yield the chunks with each one's last order block moved to the next, so no block is split"""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        order_no = chunk[order_column].astype(str).to_numpy(dtype=object)
+        other = np.flatnonzero(order_no != order_no[-1])
+        tail = other[-1] + 1 if len(other) else 0
+        pending = chunk.iloc[tail:]
+        if tail > 0:
+            yield chunk.iloc[:tail].reset_index(drop=True)
+    if pending is not None and len(pending):
+        yield pending.reset_index(drop=True)
+
+# 64-bit keys kept as a few sorted arrays
+class SortedRuns:
+    """64-bit keys, optionally with a value summed over the additions of each key.
+
+    Each add becomes a sorted run of its own, and runs are merged while one is at most twice
+    the size of the next: there are O(log n) runs to search, and adding a chunk costs about
+    its own size instead of re-sorting everything added before.
+    """
+    
+    def __init__(self, dtype=None):
+        self.dtype = dtype
+        self.runs = []
+    
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self.runs)
+    
+    def get(self, keys):
+        """Return (found, values): a mask of the keys added before and their summed values (0 if not found)"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        found = np.zeros(len(keys), dtype=bool)
+        values = np.zeros(len(keys), dtype=self.dtype or np.int64)
+        for run_keys, run_values in self.runs:
+            position = np.searchsorted(run_keys, keys)
+            hit = position < len(run_keys)
+            hit[hit] = run_keys[position[hit]] == keys[hit]
+            found |= hit
+            if run_values is not None:
+                values[hit] += run_values[position[hit]]
+        return found, values
+    
+    def add(self, keys, values=None):
+        """Add distinct keys, with their values if the runs have a dtype"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if len(keys) == 0:
+            return
+        if self.dtype is not None:
+            values = np.asarray(values, dtype=self.dtype)
+        self.runs.append(self._sorted(keys, values))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            (keys, values), (more_keys, more_values) = self.runs[-2:]
+            if values is not None:
+                values = np.concatenate([values, more_values])
+            self.runs[-2:] = [self._sorted(np.concatenate([keys, more_keys]), values)]
+    
+    def _sorted(self, keys, values):
+        # A stable sort finds the two sorted halves of a merge, so merging stays linear
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        if values is None:
+            return keys, None
+        values = values[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        if not first.all():
+            starts = np.flatnonzero(first)
+            keys, values = keys[starts], np.add.reduceat(values, starts)
+        return keys, values
+
+# Set of row fingerprints seen so far
+class RowFilter:
+    """Distinct 64-bit row fingerprints, kept as SortedRuns (8 bytes per distinct row)."""
+    
+    def __init__(self):
+        self.fingerprints = SortedRuns()
+    
+    def __len__(self):
+        return len(self.fingerprints)
+    
+    def add(self, fingerprints):
+        """Add fingerprints; return a mask of those already seen (earlier in the set or in this array)"""
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        repeated = pd.Series(fingerprints).duplicated().to_numpy()
+        known, _ = self.fingerprints.get(fingerprints)
+        duplicate = repeated | known
+        self.fingerprints.add(fingerprints[~duplicate])
+        return duplicate
+
+# Function to stream the BigSeller export
+def read_bigseller_orders(path=BIGSELLER_PATH, start_date=ORDER_DATE_START, end_date=ORDER_DATE_END,
+                          marketplaces=MARKETPLACES, statuses=ORDER_STATUSES, chunksize=BIGSELLER_CHUNKSIZE,
+                          dedup=True):
+    """Read the BigSeller export in chunks, keeping only the rows the pipeline needs.
+
+    Only BIGSELLER_DTYPES columns are parsed and each chunk is filtered on order date,
+    marketplace and order status before it is kept, so memory follows the filtered size.
+    With dedup, kept line items whose fingerprint (see line_fingerprints) was already kept
+    are dropped; only the kept fingerprints and the counts of lines in the window and
+    marketplaces are held, not the rows. Kept chunks
+    are converted to ORDER_SCHEMA dtypes. orders.attrs['window_rows'] counts rows in the date
+    window and marketplaces before the status filter, orders.attrs['duplicate_rows'] the
+    dropped rows and orders.attrs['split_blocks'] the order blocks continuing an order listed
+    earlier in the file.
+    """
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+    kept = []
+    window_rows = 0
+    seen = RowFilter()
+    state = None
+    duplicate_rows = 0
+    
+    chunks = pd.read_csv(path, usecols=list(BIGSELLER_DTYPES), dtype=BIGSELLER_DTYPES, chunksize=chunksize)
+    for chunk in order_blocks(chunks, 'order_no') if dedup else chunks:
+        order_date = pd.to_datetime(chunk['order_date'], errors='coerce')
+        in_window = (
+            (order_date >= start_date) &
+            (order_date <= end_date) &
+            chunk['marketplace'].isin(marketplaces)
+        )
+        if dedup:
+            # Fingerprint the raw rows: order blocks are only consecutive before filtering. The
+            # status is not a key column, so lines outside the window are the ones never kept
+            fingerprints, state = line_fingerprints(chunk, 'order_no', LINE_KEY_COLUMNS, state,
+                                                    candidates=in_window.to_numpy())
+        chunk['order_date'] = order_date
+        window_rows += int(in_window.sum())
+        keep = (in_window & chunk['order_status'].isin(statuses)).to_numpy(copy=True)
+        if dedup:
+            duplicate = seen.add(fingerprints[keep])
+            duplicate_rows += int(duplicate.sum())
+            keep[np.flatnonzero(keep)[duplicate]] = False
+        chunk = chunk[keep]
+        if len(chunk) > 0:
+            for column in ('quantity', 'price'):
+                chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+            kept.append(apply_schema(chunk, ORDER_SCHEMA))
+    
+    if kept:
+        orders = concat_frames(kept)
     else:
-        # SKU not in mapping - try to infer from pattern
-        breakdown = []
-        
-        # HIM[number] pattern (e.g., HIM3 = 3 boxes of HIM Coffee)
-        if re.match(r'^HIM(\d+)(-.*)?$', combo_sku):
-            num = int(re.match(r'^HIM(\d+)(-.*)?$', combo_sku).group(1))
-            breakdown.append(('COF1', num))
-        
-        # HER[number] pattern (e.g., HER3 = 3 boxes of HER Coffee)
-        elif re.match(r'^HER(\d+)(\+.*|-.*)?$', combo_sku):
-            num = int(re.match(r'^HER(\d+)(\+.*|-.*)?$', combo_sku).group(1))
-            breakdown.append(('HERCOF1', num))
-            # HER3+1 might mean 3 HER + 1 something, but for now just count the HER
-            if '+1' in combo_sku:
-                breakdown.append(('HERCOF1', 1))  # Add 1 more HER
-        
-        # SPU or SPU-A = 1 bottle of Spray Up
-        elif combo_sku == 'SPU' or combo_sku.startswith('SPU-'):
-            breakdown.append(('spr/x1', 1))
-        
-        # SPUHIM pattern (HIM Coffee + Spray Up)
-        elif 'SPUHIM' in combo_sku:
-            breakdown.append(('COF1', 1))
-            breakdown.append(('spr/x1', 1))
-        
-        # 2HIMVGO pattern (2 HIM Coffee + 1 VIGOMAX)
-        elif combo_sku == '2HIMVGO':
-            breakdown.append(('COF1', 2))
-            breakdown.append(('VGOMX', 1))
-        
-        # HIM1-A = 1 box of HIM Coffee
-        elif combo_sku.startswith('HIM1-'):
-            breakdown.append(('COF1', 1))
-        
-        # COFFEECUP-V1 or COFFEE CUP V1 pattern
-        elif 'COFFEECUP' in combo_sku or 'COFFEE CUP' in combo_sku:
-            breakdown.append(('COFFEE CUP V1', 1))
-        
-        # SHA-V2 pattern (Shaker)
-        elif 'SHA-V2' in combo_sku:
-            breakdown.append(('SHAKER', 1))
+        # No row passed the filters: an empty frame with the dtypes of the kept chunks
+        orders = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in BIGSELLER_DTYPES.items()})
+        orders['order_date'] = pd.to_datetime(orders['order_date'])
+        for column in ('quantity', 'price'):
+            orders[column] = pd.to_numeric(orders[column]).astype(np.float64)
+        apply_schema(orders, ORDER_SCHEMA)
+    orders.attrs['window_rows'] = window_rows
+    orders.attrs['duplicate_rows'] = duplicate_rows
+    orders.attrs['split_blocks'] = state['split_blocks'] if state is not None else 0
+    return orders
+
+# Function to find TikTok fact table exports
+def discover_fact_files(store_dirs=FACT_STORE_DIRS, start_date=ORDER_DATE_START, end_date=ORDER_DATE_END):
+    """Find creator_order_all exports overlapping the order window, oldest first"""
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+    fact_files = []
+    for store, directory in store_dirs.items():
+        for path in sorted(Path(directory).glob('creator_order_all_*.csv')):
+            match = FACT_FILE_PATTERN.match(path.name)
+            if not match:
+                continue
+            file_start = pd.Timestamp(datetime.strptime(match.group(1), '%Y%m%d%H%M%S'))
+            file_end = pd.Timestamp(datetime.strptime(match.group(2), '%Y%m%d%H%M%S'))
+            if file_end < start_date or file_start > end_date:
+                continue
+            fact_files.append({
+                'path': str(path),
+                'store': store,
+                'start': file_start.isoformat(),
+                'end': file_end.isoformat(),
+                'export_id': match.group(3),
+            })
+    return sorted(fact_files, key=lambda f: (f['start'], f['end'], f['store'], f['path']))
+
+# Settings for one pipeline run; defaults come from the module constants above
+@dataclass
+class PipelineConfig:
+    bigseller_path: str = BIGSELLER_PATH
+    combo_sku_path: str = COMBO_SKU_PATH
+    fact_store_dirs: dict = field(default_factory=lambda: dict(FACT_STORE_DIRS))
+    order_date_start: str = ORDER_DATE_START
+    order_date_end: str = ORDER_DATE_END
+    marketplaces: list = field(default_factory=lambda: list(MARKETPLACES))
+    order_statuses: list = field(default_factory=lambda: list(ORDER_STATUSES))
+    bigseller_chunksize: int = BIGSELLER_CHUNKSIZE
+    # Drop BigSeller line items and fact table rows repeated by overlapping exports
+    dedup: bool = True
+    # Link rows no export claims through normalized Order IDs (see reconcile)
+    reconcile: bool = True
+    input_cache_dir: str = INPUT_CACHE_DIR
+    state_dir: str = INCREMENTAL_STATE_DIR
+    order_index_path: str = ORDER_INDEX_PATH
+    fact_load_workers: int = FACT_LOAD_WORKERS
+    # Link and aggregate (month, store) partitions of the orders in a process pool
+    partitioned: bool = False
+    partition_workers: int = PARTITION_WORKERS
+    output_file: str = OUTPUT_FILE
+    unknown_output_file: str = UNKNOWN_OUTPUT_FILE
+    cube_file: str = CUBE_FILE
+    write_outputs: bool = True
+    # Expand every order line before aggregating (slower; kept to cross-check allocate())
+    row_level_expansion: bool = False
+    # Also write the expanded line items as a partitioned Parquet dataset here (see sales_facts.py)
+    facts_dir: str = None
+
+# Reference data kept in memory between runs
+class ReferenceData:
+    """Holds the combo SKU resolver (with its resolved sku_mapping) and PRODUCT_PRICES across runs.
+
+    The resolver is only rebuilt when the combo SKU sheet changes, so a long-lived process
+    keeps both the parsed sheet and every SKU breakdown it has resolved so far.
+    """
+    
+    def __init__(self):
+        self.product_prices = PRODUCT_PRICES
+        self.resolver = None
+        self.sku_mapping = None
+        self._source = None
+    
+    def sku_resolver(self, config):
+        """Return the SkuResolver for config.combo_sku_path, reloading it if the sheet changed"""
+        path = config.combo_sku_path
+        if self.resolver is None or self._source['path'] != path or not is_fresh(self._source, path):
+            self._source = {'path': path, **file_fingerprint(path)}
+            log.info("Creating SKU mapping from combo to single SKUs...")
+            self.resolver = create_sku_resolver(path, config.input_cache_dir)
+            self.sku_mapping = self.resolver.resolve(self.resolver.combo_skus)
+            log.info(f"Created mapping for {len(self.sku_mapping)} SKUs")
+        return self.resolver
+
+# Function to load one TikTok fact table export
+def load_fact_table(path, store, statuses=ORDER_STATUSES, cache_dir=INPUT_CACHE_DIR, dedup=True):
+    """Load a fact table export, keep Completed/Shipped/Processing rows and return the link columns (FACT_SCHEMA dtypes).
+
+    With dedup, rows repeated within the export (see line_fingerprints) are dropped.
+    """
+    tiktok = cached_read(path, pd.read_csv, cache_dir=cache_dir)
+    # Select the kept rows and only the columns used below in one step
+    tiktok = tiktok.loc[tiktok['Order Status'].isin(statuses), FACT_KEY_COLUMNS].reset_index(drop=True)
+    if dedup:
+        fingerprints, _ = line_fingerprints(tiktok, 'Order ID', FACT_KEY_COLUMNS)
+        repeated = pd.Series(fingerprints).duplicated().to_numpy()
+        if repeated.any():
+            tiktok = tiktok[~repeated].reset_index(drop=True)
+    tiktok['source'] = store
+    tiktok['Order ID'] = tiktok['Order ID'].astype(str)
+    tiktok['sales_channel'] = build_tiktok_sales_channel(tiktok)
+    tiktok['sku'] = tiktok['Seller SKU'].astype(str).fillna(MISSING_SKU)
+    tiktok['quantity'] = pd.to_numeric(tiktok['Quantity'], errors='coerce').fillna(0)
+    return apply_schema(tiktok[FACT_COLUMNS], FACT_SCHEMA)
+
+# Function to load several fact table exports in parallel
+def load_fact_tables(fact_files, config):
+    """Load fact table exports in a process pool, returning compact frames in input order"""
+    paths = [fact_file['path'] for fact_file in fact_files]
+    stores = [fact_file['store'] for fact_file in fact_files]
+    loader = partial(load_fact_table, statuses=config.order_statuses, cache_dir=config.input_cache_dir,
+                     dedup=config.dedup)
+    if config.fact_load_workers <= 1 or len(fact_files) <= 1:
+        return [loader(path, store) for path, store in zip(paths, stores)]
+    with ProcessPoolExecutor(max_workers=min(config.fact_load_workers, len(fact_files))) as pool:
+        return list(pool.map(loader, paths, stores))
+
+# Function to fingerprint the kept rows of one fact table export
+def read_fact_fingerprints(path, statuses=ORDER_STATUSES, input_cache_dir=INPUT_CACHE_DIR):
+    """Return a frame with the line_fingerprints of the rows load_fact_table keeps (before dropping repeats)"""
+    tiktok = cached_read(path, pd.read_csv, cache_dir=input_cache_dir)
+    tiktok = tiktok.loc[tiktok['Order Status'].isin(statuses), FACT_KEY_COLUMNS]
+    fingerprints, _ = line_fingerprints(tiktok, 'Order ID', FACT_KEY_COLUMNS)
+    return pd.DataFrame({'fingerprint': fingerprints})
+
+# Function to aggregate expanded sales by content type and product
+def aggregate_sales(expanded, keys=('content_type', 'sku')):
+    """Sum quantity_sold and revenue by keys (default content_type, sku)"""
+    return expanded.groupby(list(keys), observed=True).agg({
+        'quantity_sold': 'sum',
+        'revenue': 'sum'
+    }).reset_index()
+
+# Function to hash the settings the partial aggregates depend on
+def pipeline_settings_hash(config):
+    """Hash the settings and rules behind the partials; saved partials are only reused if unchanged"""
+    settings = json.dumps({
+        'version': PARTIALS_VERSION,
+        'inputs': [config.bigseller_path, config.combo_sku_path],
+        'window': [config.order_date_start, config.order_date_end],
+        'marketplaces': config.marketplaces,
+        'statuses': config.order_statuses,
+        'dedup': config.dedup,
+        'product_prices': PRODUCT_PRICES,
+        'sku_rules': SKU_RULES,
+    }, sort_keys=True)
+    return hashlib.sha256(settings.encode()).hexdigest()
+
+# Function to identify BigSeller lines independently of their position in the export
+def line_keys(orders):
+    """Return a 64-bit key per BigSeller line that stays the same when the export is replaced.
+
+    It hashes the LINE_KEY_COLUMNS values (numbers by value, so it does not depend on the
+    dtypes a file gets) and the number of identical lines before it. The order status is
+    left out, so a line keeps its key as its order moves through the statuses.
+    """
+    numbers = ['quantity', 'price', 'product_subtotal', 'order_total']
+    values = pd.DataFrame({
+        column: pd.to_numeric(orders[column], errors='coerce').astype(np.float64) if column in numbers
+        else orders[column].astype(str)
+        for column in LINE_KEY_COLUMNS
+    })
+    content = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    occurrence = pd.Series(content).groupby(content).cumcount().to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame({'content': content, 'occurrence': occurrence}), index=False).to_numpy()
+
+# Function to load the saved partials manifest if it still matches the shared inputs
+def load_partials_manifest(state_dir, settings):
+    """Return the saved manifest, or None if missing or the settings or the combo SKU sheet changed"""
+    manifest_path = Path(state_dir) / 'manifest.json'
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text())
+    if manifest['settings'] != settings:
+        return None
+    if not all(is_fresh(entry, path) for path, entry in manifest['inputs'].items()):
+        return None
+    return manifest
+
+# Function to name the files derived from one export
+def export_name(path):
+    """Short stable name of a fact table export, used for its saved partials and line-item files"""
+    return hashlib.sha1(path.encode()).hexdigest()[:16]
+
+# Function to find an export's saved partials that can still be used
+def saved_export(saved_files, fact_file, config):
+    """Return the manifest entry of an unchanged export (None if missing, changed or its line items go elsewhere)"""
+    saved = saved_files.get(fact_file['path'])
+    if saved is None or not is_fresh(saved, fact_file['path']):
+        return None
+    # The export's line items have to be (re)written to a different facts dataset
+    if config.facts_dir is not None and saved.get('facts') != config.facts_dir:
+        return None
+    return saved
+
+# Function to compare an export's claims with the ones saved for it
+def same_claims(claims, keys, row_content_type):
+    """Check whether the claimed line keys and their content types equal the saved claims"""
+    if len(keys) != len(claims['keys']):
+        return False
+    order, saved_order = np.argsort(keys), np.argsort(claims['keys'])
+    return (np.array_equal(keys[order], claims['keys'][saved_order])
+            and np.array_equal(row_content_type[order].astype(str), claims['content_type'][saved_order].astype(str)))
+
+# Function to save the partial aggregates of the exports
+def save_partials(state_dir, settings, inputs, files, keys, facts_dir=None):
+    """Write partials, cube partials and claims of recomputed exports and the manifest describing all exports.
+
+    files holds (fact_file, saved, rows, row_content_type, partial_sales, partial_cube) in export
+    order; saved is the manifest entry of a reused export (None: recomputed). Claims are stored
+    as the line_keys of the claimed rows, and keys (every line of this run) as lines.npy, so the
+    next run can check them against a replaced BigSeller export. facts_dir records where the
+    recomputed exports' line items were written (None: not written).
+    """
+    partials_dir = Path(state_dir) / 'partials'
+    partials_dir.mkdir(parents=True, exist_ok=True)
+    saved_files = []
+    for fact_file, saved, rows, row_content_type, partial_sales, partial_cube in files:
+        if saved is not None:
+            saved_files.append({**saved, 'mtime_ns': os.stat(fact_file['path']).st_mtime_ns})
+            continue
+        name = export_name(fact_file['path'])
+        partial_sales.to_csv(partials_dir / f'{name}.csv', index=False)
+        partial_cube.to_csv(partials_dir / f'{name}.cube.csv', index=False)
+        np.savez(partials_dir / f'{name}.npz', keys=keys[rows], content_type=row_content_type)
+        saved_files.append({
+            **fact_file,
+            **file_fingerprint(fact_file['path']),
+            'partial': f'partials/{name}.csv',
+            'cube': f'partials/{name}.cube.csv',
+            'claims': f'partials/{name}.npz',
+            'facts': facts_dir,
+        })
+    np.save(Path(state_dir) / 'lines.npy', keys)
+    manifest_path = Path(state_dir) / 'manifest.json'
+    manifest = {'settings': settings, 'inputs': inputs, 'lines': 'lines.npy', 'files': saved_files}
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+
+# Stage: load the BigSeller orders and find the fact table exports
+def load(config):
+    """Return (orders, fact_files): the window/marketplace/status-filtered BigSeller rows and the exports to use"""
+    log.info("Loading data files...")
+    
+    # TikTok Shop Orders (FACT TABLES): every creator_order_all export overlapping the order window
+    fact_files = discover_fact_files(config.fact_store_dirs, config.order_date_start, config.order_date_end)
+    log.info(f"Found {len(fact_files)} TikTok Shop fact table exports:")
+    for fact_file in fact_files:
+        log.info(f"  {fact_file['store']}: {Path(fact_file['path']).name} ({fact_file['start'][:10]} to {fact_file['end'][:10]})")
+    
+    # BigSeller Orders: stream the export, filtering for the order window, TikTok marketplace
+    # and Completed/Shipped/Processing status while reading
+    log.info(f"Loading BigSeller Orders for {config.order_date_start} to {config.order_date_end} "
+          f"({', '.join(config.marketplaces)})...")
+    orders = cached_read(
+        config.bigseller_path, read_bigseller_orders, cache_dir=config.input_cache_dir,
+        start_date=config.order_date_start, end_date=config.order_date_end,
+        marketplaces=config.marketplaces, statuses=config.order_statuses, dedup=config.dedup,
+        chunksize=config.bigseller_chunksize,
+    )
+    log.info(f"BigSeller TikTok orders {config.order_date_start} to {config.order_date_end}: {orders.attrs['window_rows']}")
+    if orders.attrs.get('duplicate_rows'):
+        log.info(f"Dropped {orders.attrs['duplicate_rows']} repeated BigSeller line items")
+    if orders.attrs.get('split_blocks'):
+        log.warning(f"The BigSeller export is not grouped by order ({orders.attrs['split_blocks']} blocks continue an "
+                    f"order listed earlier): their lines are kept, but a block repeating an order's first block "
+                    f"line for line is dropped as a repeat")
+    return orders, fact_files
+
+# Stage: count the rows each fact table export repeats
+def dedup_fact_files(fact_files, config):
+    """Return {export file name: repeated rows}, checking the exports in order against one RowFilter.
+
+    A row is repeated if an earlier row of the same export or any row of an earlier export
+    has its fingerprint. Repeats within an export are dropped when it is loaded; rows of
+    orders an earlier export already has never link, as that export claims the BigSeller rows
+    first. Each export's fingerprints are kept in the input cache (8 bytes per row), so later
+    runs do not re-read the CSVs.
+    """
+    seen = RowFilter()
+    duplicate_rows = {}
+    for fact_file in fact_files:
+        name = Path(fact_file['path']).name
+        fingerprints = cached_read(fact_file['path'], read_fact_fingerprints, cache_dir=config.input_cache_dir,
+                                   statuses=config.order_statuses, input_cache_dir=config.input_cache_dir)
+        duplicate_rows[name] = int(seen.add(fingerprints['fingerprint'].to_numpy()).sum())
+        if duplicate_rows[name]:
+            log.info(f"  {fact_file['store']} {name}: {duplicate_rows[name]} of {len(fingerprints)} rows repeated")
+    return duplicate_rows
+
+# Stage: filter and prepare BigSeller rows for linking
+def filter_orders(orders, config):
+    """Keep in-window rows for the configured marketplaces/statuses and normalize the link columns"""
+    keep = (
+        (orders['order_date'] >= pd.Timestamp(config.order_date_start)) &
+        (orders['order_date'] <= pd.Timestamp(config.order_date_end)) &
+        orders['marketplace'].isin(config.marketplaces) &
+        orders['order_status'].isin(config.order_statuses)
+    )
+    # The streamed export is usually filtered already; only copy when rows are dropped
+    if not keep.all():
+        orders = orders[keep].reset_index(drop=True)
+    orders['order_no'] = orders['order_no'].astype(str)
+    orders['sku'] = text_categories(orders['sku'])
+    orders['quantity'] = pd.to_numeric(orders['quantity'], errors='coerce').fillna(0)
+    apply_schema(orders, ORDER_SCHEMA)
+    log.info(f"BigSeller Completed/Shipped/Processing TikTok: {len(orders)}")
+    return orders
+
+# Function to hash the settings the order index entries depend on
+def order_index_settings(config):
+    """Describe how index entries are built; the index is rebuilt when this changes"""
+    return json.dumps({'version': ORDER_INDEX_VERSION, 'statuses': sorted(config.order_statuses)})
+
+# Stage: link not-yet-claimed BigSeller rows with one fact table export
+def attribute(orders, unclaimed, order_lookup, sku_lookup):
+    """Return (rows, claimed): positions and ATTRIBUTE_COLUMNS rows (with sales_channel/content_type/creator) this export links"""
+    candidates = orders.loc[unclaimed, ATTRIBUTE_COLUMNS]
+    sales_channel, content_type, matched = attribute_orders(candidates, order_lookup, sku_lookup)
+    claimed = candidates[matched]
+    # Creator of the order in this export (by stripped Order ID), for the sales cube
+    creators = order_lookup.set_index('Order ID')['Creator Username']
+    creator = claimed['order_no'].str.strip().map(creators).astype(object).fillna('Unknown')
+    claimed = claimed.assign(
+        sales_channel=pd.Categorical(sales_channel[matched]),
+        content_type=pd.Categorical(content_type[matched]),
+        creator=pd.Categorical(creator.astype(str)),
+    )
+    rows = np.flatnonzero(unclaimed)[matched]
+    return rows, claimed
+
+# Stage: break down combo SKUs into single SKUs
+def expand(claimed, sku_resolver):
+    """Expand the linked rows that have a content type (FACT TABLE orders only) into unit SKU rows"""
+    known = claimed['content_type'] != 'Unknown'
+    return expand_combo_sales(claimed if known.all() else claimed[known], sku_resolver)
+
+# Stage: break down linked rows into line-item facts and write them
+def write_line_items(claimed, fact_file, sku_resolver, facts_dir, name=None):
+    """Write the unit SKU line items of one export's linked rows with a content type; return their count.
+
+    The files are named after the export unless name is given.
+    """
+    known = claimed['content_type'] != 'Unknown'
+    lines = (claimed if known.all() else claimed[known]).assign(store=fact_file['store'])
+    lines['store'] = lines['store'].astype('category')
+    lines['month'] = pd.Categorical(lines['order_date'].to_numpy().astype('datetime64[M]').astype(str))
+    keys = [column for column in PARTITION_COLUMNS + LINE_ITEM_COLUMNS if column not in ('sku', *MEASURES)]
+    line_items = expand_combo_sales(lines, sku_resolver, keys)
+    write_facts(line_items, facts_dir, name or export_name(fact_file['path']))
+    return len(line_items)
+
+# Stage: aggregate by combo SKU, then break down combo totals into single SKUs
+def allocate(claimed, sku_resolver):
+    """Return (content_type, sku) partial sales for the linked rows that have a content type"""
+    known = claimed['content_type'] != 'Unknown'
+    return allocate_combo_sales(aggregate_combo_sales(claimed if known.all() else claimed[known]), sku_resolver)
+
+# Function to sum linked rows by sales cube dimensions and combo SKU
+def aggregate_cube_combo_sales(claimed, store):
+    """Sum the linked rows that have a content type by (date, store, creator, content_type) and combo SKU"""
+    known = claimed['content_type'] != 'Unknown'
+    lines = (claimed if known.all() else claimed[known]).assign(store=store)
+    # Nothing to normalize when the export links no rows (their order_date may not be datetime then)
+    lines['date'] = lines['order_date'].dt.normalize() if len(lines) else pd.to_datetime(lines['order_date'])
+    return aggregate_combo_sales(lines, DIMENSIONS[:-1])
+
+# Stage: the same allocation at sales cube grain
+def allocate_cube(claimed, store, sku_resolver):
+    """Return partial sales by (date, store, creator, content_type, sku) for the linked rows that have a content type"""
+    return allocate_combo_sales(aggregate_cube_combo_sales(claimed, store), sku_resolver, DIMENSIONS[:-1])
+
+# Function to sum combo totals of several partitions
+def merge_combo_sales(combo_sales, keys=('content_type',)):
+    """Sum aggregate_combo_sales results (e.g. one per partition) by keys and combo SKU"""
+    merged = pd.concat(combo_sales, ignore_index=True)
+    return merged.groupby([*keys, 'combo_sku'], observed=True).agg({
+        'combo_quantity': 'sum',
+        'combo_value': 'sum'
+    }).reset_index()
+
+# Function to split not-yet-claimed BigSeller rows by order month and store
+def partition_orders(orders, unclaimed):
+    """Return {(month, store): row positions} for the unclaimed rows, in key order"""
+    positions = np.flatnonzero(unclaimed)
+    keys = pd.DataFrame({
+        'month': orders['order_date'].to_numpy()[positions].astype('datetime64[M]').astype(str),
+        'store': orders['marketplace_store'].astype(object).to_numpy()[positions],
+    })
+    keys['store'] = keys['store'].fillna('Unknown')
+    return {key: positions[rows] for key, rows in sorted(keys.groupby(['month', 'store']).indices.items())}
+
+# Function to link and partially aggregate one (month, store) partition
+def link_partition(orders, lookups, stores, sku_resolver, row_level_expansion=False):
+    """Link one partition's BigSeller rows export by export (oldest first) and aggregate them.
+
+    lookups holds one (order_lookup, sku_lookup) pair per export, restricted to the partition's
+    Order IDs, and stores the export's store names. Returns one (rows, content_type, sales, cube)
+    tuple per export: the partition positions it claims and their content types, (content_type,
+    combo SKU) totals (unit SKU sums with row_level_expansion) and cube-grain combo totals, or
+    None for exports without lookup rows for the partition.
+    """
+    unclaimed = np.ones(len(orders), dtype=bool)
+    linked = []
+    for (order_lookup, sku_lookup), store in zip(lookups, stores):
+        if len(order_lookup) == 0 and len(sku_lookup) == 0:
+            linked.append(None)
+            continue
+        rows, claimed = attribute(orders, unclaimed, order_lookup, sku_lookup)
+        unclaimed[rows] = False
+        known = claimed['content_type'] != 'Unknown'
+        if row_level_expansion:
+            sales = aggregate_sales(expand(claimed, sku_resolver))
+        else:
+            sales = aggregate_combo_sales(claimed if known.all() else claimed[known])
+        cube = aggregate_cube_combo_sales(claimed, store)
+        linked.append((rows, claimed['content_type'].to_numpy(dtype=str), sales, cube))
+    return linked
+
+# Function to split a lookup table by partition
+def split_lookup(lookup, keys, partition_count):
+    """Return one frame per partition with the lookup rows whose Order ID keys (Order ID, partition) lists"""
+    routed = lookup.merge(keys, on='Order ID')
+    groups = routed.groupby('partition').indices
+    return [routed.iloc[groups.get(number, [])].drop(columns='partition') for number in range(partition_count)]
+
+# Stage: link (month, store) partitions in a process pool and reduce them per export
+def link_partitions(orders, unclaimed, fact_files, lookups, sku_resolver, config):
+    """Return one (rows, content_type, partial_sales, partial_cube) tuple per export, like the per-export loop.
+
+    Each partition gets the rows of every export's lookups for its own Order IDs, so the oldest
+    export still claims each row. Partition combo totals are summed per export before they are
+    allocated to unit SKUs (allocation is linear, so this equals allocating each partition).
+    """
+    partitions = partition_orders(orders, unclaimed) or {('', ''): np.array([], dtype=np.intp)}
+    
+    # Route lookup rows to every partition that has their Order ID (raw or stripped), one merge per lookup
+    order_ids = orders['order_no'].astype(str)
+    keys = pd.concat([
+        pd.DataFrame({'Order ID': ids.to_numpy()[positions], 'partition': number})
+        for number, positions in enumerate(partitions.values())
+        for ids in (order_ids, order_ids.str.strip())
+    ], ignore_index=True).drop_duplicates()
+    split_lookups = [
+        (split_lookup(order_lookup, keys, len(partitions)), split_lookup(sku_lookup, keys, len(partitions)))
+        for order_lookup, sku_lookup in lookups
+    ]
+    tasks = [
+        (orders.loc[positions, ATTRIBUTE_COLUMNS].reset_index(drop=True),
+         [(order_lookups[number], sku_lookups[number]) for order_lookups, sku_lookups in split_lookups])
+        for number, positions in enumerate(partitions.values())
+    ]
+    log.info(f"Linking {len(partitions)} (month, store) partitions: {', '.join(f'{month} {store}' for month, store in partitions)}")
+    
+    stores = [fact_file['store'] for fact_file in fact_files]
+    worker = partial(link_partition, stores=stores, sku_resolver=sku_resolver,
+                     row_level_expansion=config.row_level_expansion)
+    if config.partition_workers <= 1 or len(tasks) <= 1:
+        results = [worker(partition, partition_lookups) for partition, partition_lookups in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(config.partition_workers, len(tasks))) as pool:
+            results = list(pool.map(worker, *zip(*tasks)))
+    
+    linked = []
+    for export in range(len(fact_files)):
+        parts = [(positions, result[export]) for positions, result in zip(partitions.values(), results)
+                 if result[export] is not None]
+        if not parts:
+            linked.append((np.array([], dtype=np.intp), np.array([], dtype=str),
+                           pd.DataFrame(columns=['content_type', 'sku', 'quantity_sold', 'revenue']),
+                           pd.DataFrame(columns=DIMENSIONS + MEASURES)))
+            continue
+        rows = np.concatenate([positions[rows] for positions, (rows, _, _, _) in parts])
+        row_content_type = np.concatenate([content_type for _, (_, content_type, _, _) in parts])
+        order = np.argsort(rows, kind='stable')
+        sales = [sales for _, (_, _, sales, _) in parts]
+        if config.row_level_expansion:
+            partial_sales = aggregate_sales(pd.concat(sales, ignore_index=True))
+        else:
+            partial_sales = allocate_combo_sales(merge_combo_sales(sales), sku_resolver)
+        cube = merge_combo_sales([cube for _, (_, _, _, cube) in parts], DIMENSIONS[:-1])
+        partial_cube = allocate_combo_sales(cube, sku_resolver, DIMENSIONS[:-1])
+        linked.append((rows[order], row_content_type[order], partial_sales, partial_cube))
+    return linked
+
+# Stage: link rows no export claimed through normalized Order IDs
+def reconcile(orders, unclaimed, fact_files, lookups, config):
+    """Link unclaimed rows whose order_no matches a fact table Order ID once both are normalized.
+
+    Catches IDs mangled by Excel or a float column ('576...538.0', leading zeros,
+    '5.76000000003128E+17'; see match_order_ids). lookups holds the lookups of exports parsed
+    in this run; the Order IDs of the other exports are read from the order index (or the
+    exports are parsed). Each row goes to the oldest export with its Order ID. Returns
+    (claims, match_rates): one (fact_file, rows, claimed) per export that links rows, and per
+    BigSeller store the unclaimed rows, the rows recovered by a normalized and by a rounded
+    match, and the match rate.
+    """
+    rows = np.flatnonzero(unclaimed)
+    candidates = orders.iloc[rows]
+    index = OrderIndex(config.order_index_path, order_index_settings(config)) if config.order_index_path is not None else None
+    try:
+        lookups = dict(lookups)
+        indexed_paths = [fact_file['path'] for fact_file in fact_files
+                         if fact_file['path'] not in lookups and index is not None and index.is_current(fact_file['path'])]
+        missing_files = [fact_file for fact_file in fact_files
+                         if fact_file['path'] not in lookups and fact_file['path'] not in indexed_paths]
+        if len(rows):
+            for fact_file, tiktok in zip(missing_files, load_fact_tables(missing_files, config)):
+                lookups[fact_file['path']] = build_tiktok_lookups(tiktok)
+    
+        # A plain order_no that no export claimed only matches a fact Order ID that is not plain,
+        # unless Excel may have rounded it; other IDs match fact Order IDs within their window
+        order_no = candidates['order_no'].str.strip()
+        normalized = normalize_order_ids(order_no)
+        length = normalized['length'].to_numpy()
+        searched = (~plain_order_ids(order_no) | (normalized['carried'] < length).to_numpy()) & (length > 0)
+        windows = order_id_windows(normalized[searched]) if (length[searched] <= 19).all() else None
         
-        # If we found a breakdown, use it
-        if breakdown:
-            # Calculate revenue distribution
-            revenue_dict = calculate_combo_revenue(breakdown, combo_price)
-            
-            for single_sku, multiplier in breakdown:
-                quantity = combo_quantity * multiplier
-                # Get revenue for this product (per unit)
-                revenue_per_unit = revenue_dict.get(single_sku, 0) / multiplier if multiplier > 0 else 0
-                total_revenue = revenue_per_unit * quantity
-                
-                expanded_sales.append({
-                    'sales_channel': sales_channel,
-                    'content_type': content_type,
-                    'sku': single_sku,
-                    'quantity_sold': quantity,
-                    'revenue': total_revenue
-                })
+        # The fact Order IDs (and Order ID, SKU pairs) those can match, oldest export first
+        fact_ids, fact_skus, probed = [], [], {}
+        if len(rows) and indexed_paths:
+            fact_ids.append(index.order_ids(indexed_paths, windows))
+            probed = index.lookups(indexed_paths, pd.unique(fact_ids[0]['Order ID']))
+            fact_skus.extend(sku_lookup[['Order ID', 'sku']] for _, sku_lookup in probed.values())
+        for path, (order_lookup, sku_lookup) in lookups.items():
+            order_ids = order_lookup['Order ID'].to_numpy(dtype=object)
+            sku_lookup = sku_lookup[['Order ID', 'sku']].astype(object)
+            if windows is not None:
+                order_ids = order_ids[order_ids_in_windows(order_ids, *windows)]
+                sku_lookup = sku_lookup[order_ids_in_windows(sku_lookup['Order ID'], *windows)]
+            fact_ids.append(pd.DataFrame({'path': path, 'Order ID': order_ids}))
+            fact_skus.append(sku_lookup)
+        fact_ids = pd.concat(fact_ids, ignore_index=True) if fact_ids else pd.DataFrame(columns=['path', 'Order ID'])
+        fact_skus = pd.concat(fact_skus, ignore_index=True) if fact_skus else pd.DataFrame(columns=['Order ID', 'sku'])
+        export_positions = {fact_file['path']: position for position, fact_file in enumerate(fact_files)}
+        fact_ids['export'] = fact_ids['path'].map(export_positions)
+        fact_ids = fact_ids.sort_values('export', kind='stable', ignore_index=True)
+    
+        if len(fact_ids):
+            positions, rounded = match_order_ids(order_no.to_numpy(dtype=object), fact_ids['Order ID'].to_numpy(dtype=object),
+                                                 candidates['sku'].astype(str).str.strip().to_numpy(dtype=object), fact_skus)
         else:
-            # SKU not in mapping and no pattern match - check if it's a single product
-            if combo_sku in PRODUCT_PRICES:
-                # Single product, use individual price
-                total_revenue = PRODUCT_PRICES[combo_sku] * combo_quantity
-            else:
-                # Unknown product, use combo price
-                total_revenue = combo_price * combo_quantity
-            
-            expanded_sales.append({
-                'sales_channel': sales_channel,
-                'content_type': content_type,
-                'sku': combo_sku,
-                'quantity_sold': combo_quantity,
-                'revenue': total_revenue
-            })
+            positions, rounded = np.full(len(rows), -1), np.zeros(len(rows), dtype=bool)
+        found = positions >= 0
+        row_export = np.full(len(rows), -1)
+        row_export[found] = fact_ids['export'].to_numpy()[positions[found]]
+    
+        claims = []
+        recovered = np.zeros(len(rows), dtype=bool)
+        for export in np.unique(row_export[found]):
+            fact_file = fact_files[export]
+            selected = np.flatnonzero(row_export == export)
+            relinked = candidates.iloc[selected][ATTRIBUTE_COLUMNS].reset_index(drop=True)
+            relinked['order_no'] = fact_ids['Order ID'].to_numpy()[positions[selected]]
+            lookup = lookups[fact_file['path']] if fact_file['path'] in lookups else probed[fact_file['path']]
+            linked, claimed = attribute(relinked, np.ones(len(relinked), dtype=bool), *lookup)
+            recovered[selected[linked]] = True
+            claims.append((fact_file, rows[selected[linked]], claimed))
+    finally:
+        if index is not None:
+            index.close()
+    
+    match_rates = pd.DataFrame({
+        'store': candidates['marketplace_store'].to_numpy(dtype=object),
+        'unclaimed_rows': 1,
+        'normalized': recovered & ~rounded,
+        'rounded': recovered & rounded,
+    }).fillna({'store': 'Unknown'}).groupby('store', as_index=False).sum()
+    match_rates['match_rate'] = ((match_rates['normalized'] + match_rates['rounded']) / match_rates['unclaimed_rows']).round(4)
+    return claims, match_rates
 
-# Convert to DataFrame
-expanded_df = pd.DataFrame(expanded_sales)
-
-
-# Aggregate by content type and product (focus on Content Type → Product)
-print("Aggregating by content type and product...")
-final_sales = expanded_df.groupby(['content_type', 'sku']).agg({
-    'quantity_sold': 'sum',
-    'revenue': 'sum'
-}).reset_index()
-
-
-# Round revenue to 2 decimal places
-final_sales['revenue'] = final_sales['revenue'].round(2)
-
-# Sort by content type and quantity (focus on Content Type → Product)
-final_sales = final_sales.sort_values(['content_type', 'quantity_sold'], ascending=[True, False])
-
-print(f"\nFinal sales table shape: {final_sales.shape}")
-print(f"Unique content types: {final_sales['content_type'].nunique()}")
-print(f"Unique SKUs: {final_sales['sku'].nunique()}")
-print(f"Total Revenue: RM {final_sales['revenue'].sum():,.2f}")
-print(f"\nNOTE: This table only includes orders from FACT TABLES (DrSamhanWellness and HIM Clinic)")
-print(f"Structure: Content Type -> Product (with quantity_sold and revenue)")
-print(f"Orders without content type are saved separately in: tiktok_orders_unknown_content_type.csv")
-
-# Save to CSV
-output_file = 'final_sales_table_quantity.csv'
-try:
-    final_sales.to_csv(output_file, index=False)
-    print(f"\nSaved final sales table to: {output_file}")
-except PermissionError:
-    print(f"\nWarning: Could not save to {output_file} (file may be open).")
-    print("Please close the file and run the script again, or the data is available in memory.")
-    print("\nFirst few rows of the data:")
-    print(final_sales.head(20))
+# Stage: merge partial aggregates into the final table
+def aggregate(partials):
+    """Sum (content_type, sku) partials, round revenue and sort by content type and quantity"""
+    if partials:
+        # Plain text keys, so groups and ties sort the same however the partials were typed
+        merged = pd.concat(partials, ignore_index=True).astype({'content_type': object, 'sku': object})
+        final_sales = aggregate_sales(merged)
+    else:
+        final_sales = pd.DataFrame(columns=['content_type', 'sku', 'quantity_sold', 'revenue'])
+    
+    # Round revenue to 2 decimal places
+    final_sales['revenue'] = final_sales['revenue'].round(2)
+    
+    # Sort by content type and quantity (focus on Content Type → Product)
+    return final_sales.sort_values(['content_type', 'quantity_sold'], ascending=[True, False])
+
+# Stage: write the output tables
+def export(result, config):
+    """Save the orders without content type and the final sales table as CSV, and the sales cube"""
+    unknown_orders = result['unknown_orders']
+    if len(unknown_orders) > 0:
+        unknown_orders.to_csv(config.unknown_output_file, index=False)
+        log.info(f"Saved {len(unknown_orders)} TikTok orders without content type to: {config.unknown_output_file}")
+    
+    final_sales = result['final_sales']
+    try:
+        final_sales.to_csv(config.output_file, index=False)
+        log.info(f"Saved final sales table to: {config.output_file}")
+    except PermissionError:
+        log.warning(f"Warning: Could not save to {config.output_file} (file may be open).\n"
+                    "Please close the file and run the script again, or the data is available in memory.\n"
+                    f"First few rows of the data:\n{final_sales.head(20)}")
+    
+    if config.cube_file is not None:
+        save_cube(result['cube'], config.cube_file)
+        log.info(f"Saved sales cube ({len(result['cube'])} rows) to: {config.cube_file}")
+
+# Run the full pipeline
+def run(config=None, reference=None, report=None):
+    """Run load -> filter -> attribute -> allocate (or expand) -> aggregate -> export.
+
+    Exports are linked one at a time; unchanged exports reuse the partial aggregates saved
+    in config.state_dir by earlier runs while the BigSeller lines they claimed (by line_keys)
+    are unchanged. Pass the same ReferenceData between calls to keep
+    the SKU resolver warm. Rows no export claims are then relinked through normalized Order
+    IDs (config.reconcile). With config.facts_dir, every linked export also writes its line
+    items to that dataset. Every stage is measured in `report` (a RunReport, created if not
+    given). Returns a dict with final_sales, cube, orders (with content_type),
+    unknown_orders, fact_files and report.
+    """
+    config = config or PipelineConfig()
+    reference = reference or ReferenceData()
+    report = report or RunReport()
+    report.meta['config'] = asdict(config)
+    
+    with report.stage('load') as stage:
+        orders, fact_files = load(config)
+        stage['rows_out'] = len(orders)
+    bigseller_duplicates = orders.attrs.get('duplicate_rows', 0)
+    with report.stage('filter', rows_in=len(orders)) as stage:
+        orders = filter_orders(orders, config)
+        stage['rows_out'] = len(orders)
+    with report.stage('reference') as stage:
+        sku_resolver = reference.sku_resolver(config)
+        stage['rows_out'] = len(reference.sku_mapping)
+    if config.dedup:
+        with report.stage('dedup', rows_in=len(fact_files)) as stage:
+            duplicate_rows = {Path(config.bigseller_path).name: bigseller_duplicates}
+            duplicate_rows.update(dedup_fact_files(fact_files, config))
+            stage['rows_out'] = sum(duplicate_rows.values())
+        report.meta['duplicate_rows'] = duplicate_rows
+    
+    # Link BigSeller rows with the fact tables and break down combo SKUs into single SKUs, one
+    # export at a time. ONLY orders from FACT TABLES (content_type != 'Unknown') are aggregated.
+    log.info("Linking BigSeller data with TikTok fact tables and aggregating (FACT TABLE orders only)...")
+    content_type = np.full(len(orders), 'Unknown', dtype=object)
+    unclaimed = np.ones(len(orders), dtype=bool)
+    partials = []
+    cubes = []
+    
+    settings = pipeline_settings_hash(config)
+    manifest = load_partials_manifest(config.state_dir, settings) if config.state_dir is not None else None
+    if manifest is not None:
+        # Refresh mtimes so touched-but-identical inputs are not re-hashed on every run
+        inputs = {path: {**entry, 'mtime_ns': os.stat(path).st_mtime_ns} for path, entry in manifest['inputs'].items()}
+    elif config.state_dir is not None:
+        # Fingerprint the combo SKU sheet now, so edits made during the run are picked up next time.
+        # The BigSeller export is not fingerprinted: saved claims are checked line by line instead
+        inputs = {config.combo_sku_path: file_fingerprint(config.combo_sku_path)}
+    keys = line_keys(orders) if config.state_dir is not None else None
+    key_rows = pd.Index(keys) if manifest is not None else None
+    if key_rows is not None and not key_rows.is_unique:
+        manifest = None
+    saved_files = {saved['path']: saved for saved in manifest['files']} if manifest is not None else {}
+    index = OrderIndex(config.order_index_path, order_index_settings(config)) if config.order_index_path is not None else None
+    
+    # Reuse saved partials for the leading exports that are unchanged since the last run and at
+    # the same position (an export removed or inserted before them leaves rows to relink), as
+    # long as the lines they claimed are still there and they link none of the lines added since
+    files = []
+    with report.stage('reuse_partials') as stage:
+        if manifest is not None:
+            new_lines = ~np.isin(keys, np.load(Path(config.state_dir) / manifest['lines']))
+            saved_paths = [saved['path'] for saved in manifest['files']]
+        for position, fact_file in enumerate(fact_files if manifest is not None else []):
+            if saved_paths[position:position + 1] != [fact_file['path']]:
+                break
+            saved = saved_export(saved_files, fact_file, config)
+            if saved is None:
+                break
+            claims = np.load(Path(config.state_dir) / saved['claims'])
+            rows = key_rows.get_indexer(claims['keys'])
+            # A claimed line is gone (or, with the status filter, left the window)
+            if (rows < 0).any() or not unclaimed[rows].all():
+                break
+            added = unclaimed & new_lines
+            if added.any():
+                # New lines are probed against the indexed export; without the index nothing is reused
+                if index is None or not index.is_current(fact_file['path']):
+                    break
+                order_ids = orders.loc[added, 'order_no'].astype(str)
+                lookup = index.lookups([fact_file['path']], pd.unique(pd.concat([order_ids, order_ids.str.strip()])))
+                if len(attribute(orders, added, *lookup[fact_file['path']])[1]):
+                    break
+            content_type[rows] = claims['content_type']
+            unclaimed[rows] = False
+            partials.append(pd.read_csv(Path(config.state_dir) / saved['partial']))
+            cubes.append(pd.read_csv(Path(config.state_dir) / saved['cube'], parse_dates=['date']))
+            files.append((fact_file, saved, rows, claims['content_type'], None, None))
+            log.info(f"  {fact_file['store']} {Path(fact_file['path']).name}: unchanged, reusing saved partials")
+        stage['rows_out'] = len(files)
+    
+    # Recompute the rest: parse the exports in parallel, then link them in order
+    pending_files = fact_files[len(files):]
+    # Only exports missing from (or changed since) the order index are parsed
+    stale_files = [fact_file for fact_file in pending_files if index is None or not index.is_current(fact_file['path'])]
+    with report.stage('load_fact_tables', rows_in=len(stale_files)) as stage:
+        fact_tables = load_fact_tables(stale_files, config)
+        stage['rows_out'] = sum(len(tiktok) for tiktok in fact_tables)
+    with report.stage('index', rows_in=len(pending_files)) as stage:
+        lookups = {}
+        for fact_file, tiktok in zip(stale_files, fact_tables):
+            lookups[fact_file['path']] = build_tiktok_lookups(tiktok)
+            if index is not None:
+                index.add(fact_file, *lookups[fact_file['path']])
+        # Unchanged exports: probe the index once with the raw and stripped Order IDs
+        indexed_paths = [fact_file['path'] for fact_file in pending_files if fact_file['path'] not in lookups]
+        if indexed_paths:
+            order_ids = orders['order_no'].astype(str)
+            lookups.update(index.lookups(indexed_paths, pd.unique(pd.concat([order_ids, order_ids.str.strip()]))))
+        if index is not None:
+            index.close()
+        stage['rows_out'] = sum(len(sku_lookup) for _, sku_lookup in lookups.values())
+    del fact_tables
+    # Full lookups of the exports parsed in this run, kept to reconcile the rows left unclaimed
+    parsed_lookups = {fact_file['path']: lookups[fact_file['path']] for fact_file in stale_files} if config.reconcile else {}
+    
+    if config.partitioned:
+        pending_lookups = [lookups.pop(fact_file['path']) for fact_file in pending_files]
+        with report.stage('partitions', rows_in=int(unclaimed.sum())) as stage:
+            linked = link_partitions(orders, unclaimed, pending_files, pending_lookups, sku_resolver, config)
+            stage['rows_out'] = sum(len(rows) for rows, _, _, _ in linked)
+        for fact_file, lookup, (rows, row_content_type, partial_sales, partial_cube) in zip(pending_files, pending_lookups, linked):
+            log.info(f"  {fact_file['store']} {Path(fact_file['path']).name}: {len(rows)} BigSeller rows linked")
+            if config.facts_dir is not None:
+                # Partitions return aggregates only; relink the export's claimed rows for their line items
+                with report.stage('facts', rows_in=len(rows), export=Path(fact_file['path']).name) as stage:
+                    export_rows = np.zeros(len(orders), dtype=bool)
+                    export_rows[rows] = True
+                    _, claimed = attribute(orders, export_rows, *lookup)
+                    stage['rows_out'] = write_line_items(claimed, fact_file, sku_resolver, config.facts_dir)
+            content_type[rows] = row_content_type
+            unclaimed[rows] = False
+            partials.append(partial_sales)
+            cubes.append(partial_cube)
+            files.append((fact_file, None, rows, row_content_type, partial_sales, partial_cube))
+        pending_files = []
+    
+    for fact_file in pending_files:
+        name = Path(fact_file['path']).name
+        with report.stage('attribute', rows_in=int(unclaimed.sum()), export=name) as stage:
+            order_lookup, sku_lookup = lookups.pop(fact_file['path'])
+            rows, claimed = attribute(orders, unclaimed, order_lookup, sku_lookup)
+            stage['rows_out'] = len(claimed)
+        log.info(f"  {fact_file['store']} {name}: {len(sku_lookup)} fact order SKUs, {len(claimed)} BigSeller rows linked")
+        row_content_type = claimed['content_type'].to_numpy(dtype=str)
+        # An unchanged export after a recomputed one: reuse its partials if it claimed the same lines
+        saved = saved_export(saved_files, fact_file, config)
+        if saved is not None and same_claims(np.load(Path(config.state_dir) / saved['claims']), keys[rows], row_content_type):
+            log.info(f"  {fact_file['store']} {name}: same lines claimed, reusing saved partials")
+            content_type[rows] = row_content_type
+            unclaimed[rows] = False
+            partials.append(pd.read_csv(Path(config.state_dir) / saved['partial']))
+            cubes.append(pd.read_csv(Path(config.state_dir) / saved['cube'], parse_dates=['date']))
+            files.append((fact_file, saved, rows, row_content_type, None, None))
+            continue
+        if config.row_level_expansion:
+            with report.stage('expand', rows_in=len(claimed), export=name) as stage:
+                expanded = expand(claimed, sku_resolver)
+                stage['rows_out'] = len(expanded)
+            with report.stage('aggregate', rows_in=len(expanded), export=name) as stage:
+                partial_sales = aggregate_sales(expanded)
+                stage['rows_out'] = len(partial_sales)
+        else:
+            with report.stage('allocate', rows_in=len(claimed), export=name) as stage:
+                partial_sales = allocate(claimed, sku_resolver)
+                stage['rows_out'] = len(partial_sales)
+        content_type[rows] = row_content_type
+        unclaimed[rows] = False
+        with report.stage('cube', rows_in=len(claimed), export=name) as stage:
+            partial_cube = allocate_cube(claimed, fact_file['store'], sku_resolver)
+            stage['rows_out'] = len(partial_cube)
+        if config.facts_dir is not None:
+            with report.stage('facts', rows_in=len(claimed), export=name) as stage:
+                stage['rows_out'] = write_line_items(claimed, fact_file, sku_resolver, config.facts_dir)
+        partials.append(partial_sales)
+        cubes.append(partial_cube)
+        files.append((fact_file, None, rows, row_content_type, partial_sales, partial_cube))
+    
+    if config.state_dir is not None:
+        with report.stage('save_partials', rows_in=sum(saved is None for _, saved, _, _, _, _ in files)):
+            save_partials(config.state_dir, settings, inputs, files, keys, config.facts_dir)
+    
+    # Rows still unclaimed may carry a mangled Order ID; they are relinked on every run (not
+    # saved with the partials), so they always go to the exports present now
+    fact_names = [export_name(fact_file['path']) for fact_file in fact_files]
+    if config.reconcile:
+        with report.stage('reconcile', rows_in=int(unclaimed.sum())) as stage:
+            claims, match_rates = reconcile(orders, unclaimed, fact_files, parsed_lookups, config)
+            stage['rows_out'] = sum(len(claimed) for _, _, claimed in claims)
+        del parsed_lookups
+        report.meta['reconciled_rows'] = match_rates.to_dict('records')
+        if stage['rows_out']:
+            log.info(f"Reconciled {stage['rows_out']} unclaimed rows through normalized Order IDs:\n"
+                     f"{match_rates.to_string(index=False)}")
+        for fact_file, rows, claimed in claims:
+            name = f"{export_name(fact_file['path'])}-reconciled"
+            with report.stage('allocate', rows_in=len(claimed), export=name) as stage:
+                if config.row_level_expansion:
+                    partial_sales = aggregate_sales(expand(claimed, sku_resolver))
+                else:
+                    partial_sales = allocate(claimed, sku_resolver)
+                stage['rows_out'] = len(partial_sales)
+            with report.stage('cube', rows_in=len(claimed), export=name) as stage:
+                partial_cube = allocate_cube(claimed, fact_file['store'], sku_resolver)
+                stage['rows_out'] = len(partial_cube)
+            if config.facts_dir is not None:
+                with report.stage('facts', rows_in=len(claimed), export=name) as stage:
+                    stage['rows_out'] = write_line_items(claimed, fact_file, sku_resolver, config.facts_dir, name)
+                fact_names.append(name)
+            content_type[rows] = claimed['content_type'].to_numpy(dtype=str)
+            unclaimed[rows] = False
+            partials.append(partial_sales)
+            cubes.append(partial_cube)
+    if config.facts_dir is not None:
+        # Drop the line items of exports that are gone or no longer overlap the order window
+        prune_facts(config.facts_dir, fact_names)
+    
+    # Separate orders: those with content type (from FACT TABLES) vs those without
+    orders['content_type'] = pd.Categorical(content_type)
+    has_content_type = orders['content_type'] != 'Unknown'
+    log.info(f"Content type distribution after lookup:\n{orders['content_type'].value_counts().to_string()}")
+    log.info(f"Total rows: {len(orders)}")
+    log.info(f"Rows with content type (from FACT TABLES): {int(has_content_type.sum())}")
+    log.info(f"Rows without content type (to be listed separately): {int((~has_content_type).sum())}")
+    
+    log.info("Aggregating by content type and product...")
+    with report.stage('aggregate', rows_in=sum(len(partial_sales) for partial_sales in partials)) as stage:
+        final_sales = aggregate(partials)
+        stage['rows_out'] = len(final_sales)
+    with report.stage('cube', rows_in=sum(len(partial_cube) for partial_cube in cubes)) as stage:
+        cube = build_cube(cubes)
+        stage['rows_out'] = len(cube)
+    result = {
+        'final_sales': final_sales,
+        'cube': cube,
+        'orders': orders,
+        'unknown_orders': orders.loc[~has_content_type, UNKNOWN_OUTPUT_COLUMNS],
+        'fact_files': fact_files,
+        'report': report,
+    }
+    report.meta['fact_files'] = len(fact_files)
+    report.meta['reused_fact_files'] = sum(saved is not None for _, saved, _, _, _, _ in files)
+    report.meta['unknown_rows'] = len(result['unknown_orders'])
+    if config.write_outputs:
+        with report.stage('export', rows_in=len(final_sales) + len(result['unknown_orders'])):
+            export(result, config)
+    return result
 
-# Display summary
-print("\n=== SALES BY CONTENT TYPE (Quantity) ===")
-content_type_qty = final_sales.groupby('content_type')['quantity_sold'].sum().sort_values(ascending=False)
-print(content_type_qty)
+# Function to print the summary tables
+def print_summary(final_sales, config):
+    """Print the final table overview and the content type / product summaries"""
+    print(f"\nFinal sales table shape: {final_sales.shape}")
+    print(f"Unique content types: {final_sales['content_type'].nunique()}")
+    print(f"Unique SKUs: {final_sales['sku'].nunique()}")
+    print(f"Total Revenue: RM {final_sales['revenue'].sum():,.2f}")
+    print(f"\nNOTE: This table only includes orders from FACT TABLES ({', '.join(config.fact_store_dirs)})")
+    print(f"Structure: Content Type -> Product (with quantity_sold and revenue)")
+    print(f"Orders without content type are saved separately in: {config.unknown_output_file}")
+    
+    print("\n=== SALES BY CONTENT TYPE (Quantity) ===")
+    content_type_qty = final_sales.groupby('content_type')['quantity_sold'].sum().sort_values(ascending=False)
+    print(content_type_qty)
+    
+    print("\n=== SALES BY CONTENT TYPE (Revenue) ===")
+    content_type_rev = final_sales.groupby('content_type')['revenue'].sum().sort_values(ascending=False)
+    print(content_type_rev)
+    
+    print("\n=== TOP 20 PRODUCTS BY QUANTITY ===")
+    product_summary = final_sales.groupby('sku')['quantity_sold'].sum().sort_values(ascending=False).head(20)
+    print(product_summary)
+    
+    print("\n=== SALES BY CONTENT TYPE ===")
+    print(content_type_qty)
+    
+    print("\n=== SAMPLE OF FINAL TABLE ===")
+    print(final_sales.head(20))
 
-print("\n=== SALES BY CONTENT TYPE (Revenue) ===")
-content_type_rev = final_sales.groupby('content_type')['revenue'].sum().sort_values(ascending=False)
-print(content_type_rev)
+# Long-lived worker: keep reference data warm and run on request
+def run_worker(config, requests=None):
+    """Run the pipeline once per request line, keeping reference data in memory between runs.
 
-print("\n=== TOP 20 PRODUCTS BY QUANTITY ===")
-product_summary = final_sales.groupby('sku')['quantity_sold'].sum().sort_values(ascending=False).head(20)
-print(product_summary)
+    Each line on stdin is either empty (run with the base config) or a JSON object of
+    PipelineConfig overrides; 'quit' stops the worker. One JSON status line (with the
+    per-stage wall times) is written to stdout per run; log messages go to stderr.
+    """
+    requests = requests or sys.stdin
+    reference = ReferenceData()
+    print(json.dumps({'status': 'ready'}), flush=True)
+    for line in requests:
+        line = line.strip()
+        if line in ('quit', 'exit'):
+            break
+        started = time.perf_counter()
+        try:
+            run_config = replace(config, **(json.loads(line) if line else {}))
+            result = run(run_config, reference)
+            final_sales = result['final_sales']
+            response = {
+                'status': 'ok',
+                'rows': len(final_sales),
+                'quantity_sold': float(final_sales['quantity_sold'].sum()),
+                'revenue': round(float(final_sales['revenue'].sum()), 2),
+                'unknown_rows': len(result['unknown_orders']),
+                'seconds': round(time.perf_counter() - started, 3),
+                'stage_seconds': {name: total['wall_seconds'] for name, total in result['report'].totals().items()},
+            }
+        except Exception as error:
+            response = {'status': 'error', 'error': f'{type(error).__name__}: {error}'}
+        print(json.dumps(response), flush=True)
 
-print("\n=== SALES BY CONTENT TYPE ===")
-content_type_summary = final_sales.groupby('content_type')['quantity_sold'].sum().sort_values(ascending=False)
-print(content_type_summary)
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the sales by content type tables')
+    parser.add_argument('--start', default=ORDER_DATE_START, help='first order date (default: %(default)s)')
+    parser.add_argument('--end', default=ORDER_DATE_END, help='last order date (default: %(default)s)')
+    parser.add_argument('--marketplace', action='append', help='marketplace to include (repeatable, default: TikTok)')
+    parser.add_argument('--status', action='append', help='order status to include (repeatable)')
+    parser.add_argument('--bigseller', default=BIGSELLER_PATH, help='BigSeller export CSV')
+    parser.add_argument('--combo-sku', default=COMBO_SKU_PATH, help='combo SKU sheet')
+    parser.add_argument('--workers', type=int, default=FACT_LOAD_WORKERS, help='fact table loader processes')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='final sales table CSV')
+    parser.add_argument('--unknown-output', default=UNKNOWN_OUTPUT_FILE, help='orders without content type CSV')
+    parser.add_argument('--cube', default=CUBE_FILE, help='sales cube file (.parquet, .pkl or .csv)')
+    parser.add_argument('--no-cache', action='store_true', help='always re-parse the input files (no input cache or order index)')
+    parser.add_argument('--full', action='store_true', help='ignore and do not save partial aggregates')
+    parser.add_argument('--worker', action='store_true', help='stay running and serve runs requested on stdin')
+    parser.add_argument('--no-dedup', action='store_true', help='keep line items repeated by overlapping exports')
+    parser.add_argument('--no-reconcile', action='store_true', help='do not relink unclaimed rows through normalized Order IDs')
+    parser.add_argument('--facts', nargs='?', const=FACTS_DIR, metavar='DIR',
+                        help=f'also write the line items as a partitioned Parquet dataset (default DIR: {FACTS_DIR})')
+    parser.add_argument('--row-level', action='store_true', help='expand every order line before aggregating')
+    parser.add_argument('--partitioned', action='store_true', help='link (month, store) partitions in a process pool')
+    parser.add_argument('--partition-workers', type=int, default=PARTITION_WORKERS, help='processes for --partitioned runs')
+    parser.add_argument('--log-level', default='INFO', choices=LOG_LEVELS, help='progress message level (default: INFO)')
+    parser.add_argument('--report', help='write a JSON run report with per-stage timings and memory here')
+    parser.add_argument('--profile', metavar='STAGE', help='run STAGE (e.g. attribute) under cProfile')
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+    
+    config = PipelineConfig(
+        bigseller_path=args.bigseller,
+        combo_sku_path=args.combo_sku,
+        order_date_start=args.start,
+        order_date_end=args.end,
+        marketplaces=args.marketplace or list(MARKETPLACES),
+        order_statuses=args.status or list(ORDER_STATUSES),
+        input_cache_dir=None if args.no_cache else INPUT_CACHE_DIR,
+        order_index_path=None if args.no_cache else ORDER_INDEX_PATH,
+        state_dir=None if args.full else INCREMENTAL_STATE_DIR,
+        fact_load_workers=args.workers,
+        output_file=args.output,
+        unknown_output_file=args.unknown_output,
+        cube_file=args.cube,
+        dedup=not args.no_dedup,
+        reconcile=not args.no_reconcile,
+        row_level_expansion=args.row_level,
+        facts_dir=args.facts,
+        partitioned=args.partitioned,
+        partition_workers=args.partition_workers,
+    )
+    if args.worker:
+        run_worker(config)
+        return
+    
+    report = RunReport(profile_stage=args.profile)
+    result = run(config, report=report)
+    print_summary(result['final_sales'], config)
+    
+    log.info(f"Stage timings:\n{report.summary()}")
+    if args.profile:
+        log.info(f"Profile of stage '{args.profile}':\n{report.profile_summary()}")
+    if args.report:
+        log.info(f"Saved run report to: {report.write(args.report)}")
 
-print("\n=== SAMPLE OF FINAL TABLE ===")
-print(final_sales.head(20))
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""Execution backends for the sales pipeline.
+
+PandasBackend is the reference: sales_analysis.run(), eager and in-process, with the input
+cache, saved partials, order index and sales cube. PolarsBackend builds one lazy polars query
+over the BigSeller export and the fact table exports: only the needed columns are read
+(projection pushdown), the order window, marketplace and status filters run while scanning
+(predicate pushdown), and the Order ID join and group-bys run multi-threaded on the streaming
+engine, so the inputs do not have to fit in memory. Only the (export, content type, combo
+SKU) totals and the orders without content type are collected; combo allocation and the
+final aggregation reuse sales_analysis, so both backends write the same CSV files.
+
+Usage:
+    python sales_backend.py run --backend polars
+    python sales_backend.py --data-dir bench_data/scale_10 check
+"""
+import argparse
+import filecmp
+import logging
+import sys
+import tempfile
+from dataclasses import asdict, replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import sales_analysis as sa
+from sales_instrument import LOG_LEVELS, RunReport, configure_logging
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+log = logging.getLogger('sales_analysis.backend')
+
+# Strings pandas.read_csv reads as missing by default; the lazy scans treat them the same way
+PANDAS_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+class PandasBackend:
+    """The reference pipeline (sales_analysis.run)"""
+
+    name = 'pandas'
+
+    def run(self, config, reference=None, report=None):
+        return sa.run(config, reference, report)
+
+
+class PolarsBackend:
+    """Lazy, out-of-core pipeline on polars' streaming engine.
+
+    Attribution matches sales_analysis: each BigSeller row is claimed by the oldest export
+    whose (Order ID, SKU) or Order ID lookup has it, and the rows left over are reconciled
+    through normalized Order IDs like sales_analysis.reconcile. Not supported (the config
+    fields are ignored): saved partials, the order index, the sales cube, the line-item facts
+    dataset, row-level expansion and the per-export fact table repeat counts (repeated
+    BigSeller line items are dropped the same way).
+    """
+
+    name = 'polars'
+
+    def __init__(self):
+        if pl is None:
+            raise ImportError("The polars backend needs polars (pip install polars)")
+
+    def run(self, config, reference=None, report=None):
+        """Run the pipeline and return a dict like sales_analysis.run (orders and cube are None)"""
+        config = config or sa.PipelineConfig()
+        reference = reference or sa.ReferenceData()
+        report = report or RunReport()
+        report.meta['config'] = asdict(config)
+        report.meta['backend'] = self.name
+
+        with report.stage('plan') as stage:
+            fact_files = sa.discover_fact_files(config.fact_store_dirs, config.order_date_start, config.order_date_end)
+            log.info(f"Found {len(fact_files)} TikTok Shop fact table exports")
+            # Repeated line items are found in one pass up front, so the main query only
+            # filters on their row numbers
+            repeated_rows = scan_repeated_lines(config).collect(engine='streaming')['row'] if config.dedup else None
+            if repeated_rows is not None:
+                report.meta['duplicate_rows'] = {Path(config.bigseller_path).name: len(repeated_rows)}
+            combo_sales, unknown_orders, counts = build_queries(config, fact_files, repeated_rows)
+            stage['rows_out'] = len(fact_files)
+        with report.stage('reference') as stage:
+            sku_resolver = reference.sku_resolver(config)
+            stage['rows_out'] = len(reference.sku_mapping)
+        with report.stage('collect') as stage:
+            combo_sales, unknown_orders, counts = pl.collect_all([combo_sales, unknown_orders, counts], engine='streaming')
+            counts = counts.row(0, named=True)
+            stage['rows_in'] = counts['rows']
+            stage['rows_out'] = len(combo_sales) + len(unknown_orders)
+
+        # Same dtypes as pd.to_numeric gives the pandas pipeline, so the CSVs format alike
+        combo_sales = combo_sales.to_pandas().astype({'combo_value': 'float64'})
+        unknown_orders = unknown_orders.to_pandas()
+        unclaimed = unknown_orders.pop('export').isna().to_numpy()
+        if counts['integer_quantities']:
+            combo_sales['combo_quantity'] = combo_sales['combo_quantity'].astype('int64')
+            unknown_orders['quantity'] = unknown_orders['quantity'].astype('int64')
+        if counts['integer_prices']:
+            unknown_orders['price'] = unknown_orders['price'].astype('int64')
+
+        with report.stage('allocate', rows_in=len(combo_sales)) as stage:
+            partials = [
+                sa.allocate_combo_sales(export_sales.drop(columns='export'), sku_resolver)
+                for _, export_sales in combo_sales.groupby('export', sort=True)
+            ]
+            stage['rows_out'] = sum(len(partial_sales) for partial_sales in partials)
+        if config.reconcile:
+            # The few rows no export has are collected, so they go through the pandas
+            # reconciliation; the exports are parsed (through the input cache) for it
+            with report.stage('reconcile', rows_in=int(unclaimed.sum())) as stage:
+                claims, match_rates = sa.reconcile(unknown_orders, unclaimed, fact_files, {},
+                                                   replace(config, order_index_path=None))
+                known = np.zeros(len(unknown_orders), dtype=bool)
+                for _, rows, claimed in claims:
+                    partials.append(sa.allocate(claimed, sku_resolver))
+                    known[rows[(claimed['content_type'] != 'Unknown').to_numpy()]] = True
+                unknown_orders = unknown_orders[~known].reset_index(drop=True)
+                stage['rows_out'] = sum(len(rows) for _, rows, _ in claims)
+            report.meta['reconciled_rows'] = match_rates.to_dict('records')
+        log.info(f"BigSeller Completed/Shipped/Processing TikTok: {counts['rows']}")
+        log.info(f"Rows with content type (from FACT TABLES): {counts['rows'] - len(unknown_orders)}")
+        log.info(f"Rows without content type (to be listed separately): {len(unknown_orders)}")
+        with report.stage('aggregate', rows_in=stage['rows_out']) as stage:
+            final_sales = sa.aggregate(partials)
+            stage['rows_out'] = len(final_sales)
+        result = {
+            'final_sales': final_sales,
+            'cube': None,
+            'orders': None,
+            'unknown_orders': unknown_orders,
+            'fact_files': fact_files,
+            'report': report,
+        }
+        report.meta['fact_files'] = len(fact_files)
+        report.meta['unknown_rows'] = len(unknown_orders)
+        if config.write_outputs:
+            with report.stage('export', rows_in=len(final_sales) + len(unknown_orders)):
+                sa.export(result, replace(config, cube_file=None))
+        return result
+
+
+# Available backends by name; PandasBackend is the reference the others are checked against
+BACKENDS = {backend.name: backend for backend in (PandasBackend, PolarsBackend)}
+
+
+def get_backend(name='pandas'):
+    """Return a backend instance by name (ImportError if its engine is not installed)"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+def _text(column):
+    """Column as text the way astype(str) leaves it (missing values become sa.MISSING_TEXT)"""
+    return pl.col(column).fill_null(sa.MISSING_TEXT) if isinstance(sa.MISSING_TEXT, str) else pl.col(column)
+
+
+def _sku(column):
+    """SKU column as text, with missing SKUs as sa.MISSING_SKU (see sales_analysis.text_categories)"""
+    return pl.col(column).fill_null(sa.MISSING_SKU)
+
+
+def _normalized_content_type(column):
+    """sales_analysis.normalize_content_type as a polars expression"""
+    raw = pl.col(column)
+    text = raw.str.strip_chars()
+    return (
+        pl.when(raw.is_null() | (raw == '')).then(pl.lit('Unknown'))
+        .when(text.str.contains('Livestream', literal=True) | (text == 'Live')).then(pl.lit('Live'))
+        .when(text.str.contains('External Traffic Program', literal=True)).then(pl.lit('External Traffic Programme'))
+        .otherwise(text)
+    )
+
+
+def scan_repeated_lines(config):
+    """Lazy row numbers of the BigSeller line items dropped as repeats (see sales_analysis.line_fingerprints).
+
+    A line's fingerprint is its key columns plus the number of identical lines of the same
+    order before it, counted from zero again in a later order block (consecutive rows of one
+    order, before filtering) that repeats the order's first block line for line; of the kept
+    lines with the same fingerprint only the first stays.
+    """
+    new_block = (_text('order_no') != _text('order_no').shift()).fill_null(True)
+    first_block = pl.col('block') == pl.col('block').first().over('order_no')
+    repeated = ~first_block & (pl.col('block_hash') == pl.col('block_hash').first().over('order_no'))
+    return (
+        pl.scan_csv(config.bigseller_path, infer_schema=False, null_values=PANDAS_NA_VALUES, row_index_name='row')
+        .select(['row', *sa.BIGSELLER_DTYPES])
+        .with_columns(content=pl.struct(*sa.LINE_KEY_COLUMNS).hash(), block=new_block.cum_sum())
+        .with_columns(in_block=pl.int_range(pl.len()).over('block', 'content'))
+        .with_columns(block_hash=pl.struct('content', 'in_block').hash().bitwise_xor().over('block'))
+        .with_columns(repeated=repeated)
+        .with_columns(occurrence=pl.when('repeated').then('in_block')
+                      .otherwise(pl.int_range(pl.len()).over('content', 'repeated')))
+        .filter(
+            pl.col('order_date').str.to_datetime(strict=False)
+            .is_between(pd.Timestamp(config.order_date_start), pd.Timestamp(config.order_date_end))
+            & pl.col('marketplace').is_in(config.marketplaces)
+            & pl.col('order_status').is_in(config.order_statuses)
+        )
+        .filter(pl.col('row') != pl.col('row').min().over('content', 'occurrence'))
+        .select('row')
+    )
+
+
+def scan_orders(config, repeated_rows=None):
+    """Lazy BigSeller rows in the order window, marketplaces and statuses, with link keys"""
+    orders = (
+        pl.scan_csv(config.bigseller_path, infer_schema=False, null_values=PANDAS_NA_VALUES, row_index_name='row')
+        .select(['row', *sa.BIGSELLER_DTYPES])
+        .with_columns(pl.col('order_date').str.to_datetime(strict=False))
+        .filter(
+            pl.col('order_date').is_between(pd.Timestamp(config.order_date_start), pd.Timestamp(config.order_date_end))
+            & pl.col('marketplace').is_in(config.marketplaces)
+            & pl.col('order_status').is_in(config.order_statuses)
+        )
+    )
+    if repeated_rows is not None and len(repeated_rows):
+        orders = orders.join(repeated_rows.to_frame().lazy(), on='row', how='anti')
+    return (
+        orders.with_columns(
+            order_no=_text('order_no'),
+            sku=_sku('sku'),
+            order_key=_text('order_no').str.strip_chars(),
+            combo_sku=_sku('sku').str.strip_chars(),
+            quantity=pl.col('quantity').cast(pl.Float64, strict=False).fill_null(0),
+            price=pl.col('price').cast(pl.Float64, strict=False),
+            integer_quantity=pl.col('quantity').str.to_integer(strict=False).is_not_null(),
+            integer_price=pl.col('price').str.to_integer(strict=False).is_not_null(),
+        )
+    )
+
+
+def scan_fact_lookups(fact_files, statuses):
+    """Lazy (Order ID) and (Order ID, SKU) content type lookups of all exports, tagged with their position"""
+    facts = pl.concat([
+        pl.scan_csv(fact_file['path'], infer_schema=False, null_values=PANDAS_NA_VALUES)
+        .filter(pl.col('Order Status').is_in(statuses))
+        .select(
+            pl.lit(position, dtype=pl.Int32).alias('export'),
+            _text('Order ID').alias('order_key'),
+            _sku('Seller SKU').alias('lookup_sku'),
+            pl.col('Content Type'),
+        )
+        for position, fact_file in enumerate(fact_files)
+    ])
+    # First non-missing content type per group, like groupby(...).agg('first')
+    first_content_type = pl.col('Content Type').drop_nulls().first()
+    order_lookup = (
+        facts.group_by(['export', 'order_key']).agg(first_content_type)
+        .select('export', 'order_key', _normalized_content_type('Content Type').alias('order_content_type'))
+    )
+    sku_lookup = (
+        facts.group_by(['export', 'order_key', 'lookup_sku']).agg(first_content_type)
+        .select('export', 'order_key', 'lookup_sku', _normalized_content_type('Content Type').alias('sku_content_type'))
+    )
+    return order_lookup, sku_lookup
+
+
+def build_queries(config, fact_files, repeated_rows=None):
+    """Return lazy (combo_sales, unknown_orders, counts) queries for one run.
+
+    combo_sales sums quantity and line value by (export, content_type, combo_sku) for the
+    rows with a content type; unknown_orders holds the other rows in file order, with the
+    export that has their order (null when none does). Rows in
+    repeated_rows (see scan_repeated_lines) are left out.
+    """
+    orders = scan_orders(config, repeated_rows)
+    if fact_files:
+        order_lookup, sku_lookup = scan_fact_lookups(fact_files, config.order_statuses)
+        keys = orders.select('order_key', 'combo_sku').unique()
+        # Content type per export: exact (Order ID, SKU) match first, then Order ID only; the
+        # oldest export that has the order claims it
+        exact = keys.join(sku_lookup, left_on=['order_key', 'combo_sku'], right_on=['order_key', 'lookup_sku'])
+        by_order = keys.join(order_lookup, on='order_key')
+        claims = (
+            exact.join(by_order, on=['order_key', 'combo_sku', 'export'], how='full', coalesce=True)
+            .with_columns(content_type=pl.coalesce('sku_content_type', 'order_content_type'))
+            .group_by(['order_key', 'combo_sku'])
+            .agg(pl.col('export', 'content_type').sort_by('export').first())
+        )
+        orders = orders.join(claims, on=['order_key', 'combo_sku'], how='left')
+    else:
+        orders = orders.with_columns(export=pl.lit(None, dtype=pl.Int32), content_type=pl.lit(None, dtype=pl.String))
+    orders = orders.with_columns(pl.col('content_type').fill_null('Unknown'))
+
+    known = pl.col('content_type') != 'Unknown'
+    combo_sales = (
+        orders.filter(known & pl.col('combo_sku').is_not_null())
+        .group_by(['export', 'content_type', 'combo_sku'])
+        .agg(
+            combo_quantity=pl.col('quantity').sum(),
+            # Summed as exact decimals: a plain float sum can land on the other side of a half
+            # cent than pandas' compensated groupby sum, which changes the rounded revenue
+            combo_value=(pl.col('quantity') * pl.col('price').fill_null(0)).cast(pl.Decimal(38, 18)).sum(),
+        )
+    )
+    unknown_orders = orders.filter(~known).sort('row').select(*sa.UNKNOWN_OUTPUT_COLUMNS, 'export')
+    counts = orders.select(
+        rows=pl.len(),
+        integer_quantities=pl.col('integer_quantity').all(),
+        integer_prices=pl.col('integer_price').all(),
+    )
+    return combo_sales, unknown_orders, counts
+
+
+def data_config(data_dir='Data', **overrides):
+    """PipelineConfig for a Data/-style tree (BigSeller Orders/, Ref SKU/ and one directory per store)"""
+    data_dir = Path(data_dir)
+    return sa.PipelineConfig(
+        bigseller_path=str(data_dir / 'BigSeller Orders' / 'bigseller_orders.csv'),
+        combo_sku_path=str(data_dir / 'Ref SKU' / 'Combo SKU.xlsx'),
+        fact_store_dirs={store: str(data_dir / store) for store in sa.FACT_STORE_DIRS},
+        **overrides,
+    )
+
+
+def check_parity(config, backends=('pandas', 'polars')):
+    """Run each backend from scratch into its own directory and compare the CSV outputs byte for byte.
+
+    Returns {backend: {output file: 'match' | 'differs' | 'missing'}} against the first backend.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in backends:
+            out_dir = Path(work_dir) / name
+            out_dir.mkdir()
+            get_backend(name).run(replace(
+                config, input_cache_dir=None, state_dir=None, order_index_path=None, cube_file=None,
+                output_file=str(out_dir / sa.OUTPUT_FILE), unknown_output_file=str(out_dir / sa.UNKNOWN_OUTPUT_FILE),
+            ))
+        reference_dir = Path(work_dir) / backends[0]
+        for name in backends[1:]:
+            results[name] = {}
+            for file_name in (sa.OUTPUT_FILE, sa.UNKNOWN_OUTPUT_FILE):
+                expected, actual = reference_dir / file_name, Path(work_dir) / name / file_name
+                if expected.exists() != actual.exists():
+                    results[name][file_name] = 'missing'
+                elif expected.exists() and not filecmp.cmp(expected, actual, shallow=False):
+                    results[name][file_name] = 'differs'
+                else:
+                    results[name][file_name] = 'match'
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the sales pipeline on a chosen execution backend')
+    parser.add_argument('--data-dir', default='Data', help='Data/-style input tree (default: %(default)s)')
+    parser.add_argument('--start', default=sa.ORDER_DATE_START, help='first order date (default: %(default)s)')
+    parser.add_argument('--end', default=sa.ORDER_DATE_END, help='last order date (default: %(default)s)')
+    parser.add_argument('--log-level', default='INFO', choices=LOG_LEVELS, help='progress message level (default: INFO)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the pipeline and write the output tables')
+    run_parser.add_argument('--backend', default='pandas', choices=list(BACKENDS))
+    run_parser.add_argument('--output', default=sa.OUTPUT_FILE, help='final sales table CSV')
+    run_parser.add_argument('--unknown-output', default=sa.UNKNOWN_OUTPUT_FILE, help='orders without content type CSV')
+    run_parser.add_argument('--report', help='write a JSON run report here')
+    check_parser = commands.add_parser('check', help='check that the backends write identical outputs')
+    check_parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS),
+                              help='backends to compare; the first is the reference')
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+    config = data_config(args.data_dir, order_date_start=args.start, order_date_end=args.end)
+
+    if args.command == 'check':
+        mismatches = 0
+        for name, files in check_parity(config, args.backends).items():
+            for file_name, status in files.items():
+                print(f"{name:<8} {file_name:<45} {status}")
+                mismatches += status != 'match'
+        sys.exit(1 if mismatches else 0)
+
+    report = RunReport()
+    get_backend(args.backend).run(replace(config, output_file=args.output, unknown_output_file=args.unknown_output),
+                                  report=report)
+    log.info(f"Stage timings ({args.backend}):\n{report.summary()}")
+    if args.report:
+        log.info(f"Saved run report to: {report.write(args.report)}")
+
+
+if __name__ == '__main__':
+    main()
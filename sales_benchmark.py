@@ -0,0 +1,242 @@
+"""Benchmark harness for the sales pipeline on synthetic data.
+
+Generates (or reuses) synthetic datasets at the requested scales (see sales_synthetic.py),
+times and memory-profiles every pipeline stage, checks the final sales table against the
+dataset's reference output and writes the results as JSON so runs can be compared.
+
+The first benchmark of a dataset stores its final table as reference_final_sales.csv in
+the dataset directory; later runs (e.g. after a code change) must reproduce it.
+
+Usage:
+    python sales_benchmark.py run --scales 1 10 100 --output bench.json
+    python sales_benchmark.py compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import sales_analysis as sa
+from sales_backend import BACKENDS, get_backend
+from sales_instrument import RunReport, configure_logging
+from sales_synthetic import STORES, generate_dataset
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Datasets are generated under this directory as scale_<n>/
+DATA_DIR = 'bench_data'
+REFERENCE_FILE = 'reference_final_sales.csv'
+
+
+def dataset_config(data_dir, work_dir, warm=False):
+    """PipelineConfig reading a synthetic dataset and writing outputs into work_dir"""
+    data_dir = Path(data_dir)
+    return sa.PipelineConfig(
+        bigseller_path=str(data_dir / 'BigSeller Orders' / 'bigseller_orders.csv'),
+        combo_sku_path=str(data_dir / 'Ref SKU' / 'Combo SKU.xlsx'),
+        fact_store_dirs={store: str(data_dir / store) for store in STORES},
+        input_cache_dir=str(data_dir / '.sales_cache') if warm else None,
+        state_dir=None,
+        order_index_path=str(data_dir / '.sales_state' / 'order_index.sqlite') if warm else None,
+        output_file=str(Path(work_dir) / sa.OUTPUT_FILE),
+        unknown_output_file=str(Path(work_dir) / sa.UNKNOWN_OUTPUT_FILE),
+        cube_file=str(Path(work_dir) / sa.CUBE_FILE),
+    )
+
+
+def run_pipeline(config, reference=None, backend='pandas'):
+    """Run the pipeline once on a backend and return (final_sales, stage totals from its RunReport)"""
+    report = RunReport()
+    result = get_backend(backend).run(config, reference, report)
+    return result['final_sales'], report.totals()
+
+
+def compare_to_reference(final_sales, reference_path, update=False):
+    """Compare a final sales table to the stored reference (creating it if missing)"""
+    if update or not Path(reference_path).exists():
+        final_sales.to_csv(reference_path, index=False)
+        return {'status': 'created', 'rows': len(final_sales)}
+
+    reference = pd.read_csv(reference_path)
+    merged = reference.merge(final_sales, on=['content_type', 'sku'], how='outer',
+                             suffixes=('_reference', ''), indicator=True)
+    missing_rows = int((merged['_merge'] != 'both').sum())
+    quantity_diff = (merged['quantity_sold'] - merged['quantity_sold_reference']).abs().max()
+    revenue_diff = (merged['revenue'] - merged['revenue_reference']).abs().max()
+    quantity_diff = 0.0 if pd.isna(quantity_diff) else float(quantity_diff)
+    revenue_diff = 0.0 if pd.isna(revenue_diff) else float(revenue_diff)
+    matches = missing_rows == 0 and quantity_diff < 1e-6 and revenue_diff <= 0.011
+    return {
+        'status': 'match' if matches else 'mismatch',
+        'rows': len(final_sales),
+        'unmatched_rows': missing_rows,
+        'max_quantity_diff': quantity_diff,
+        'max_revenue_diff': revenue_diff,
+    }
+
+
+def benchmark_scale(scale, data_root=DATA_DIR, repeats=3, seed=0, warm=False, memory=True,
+                    update_reference=False, backend='pandas', partitioned=False):
+    """Benchmark one scale and return its result dict"""
+    data_dir = Path(data_root) / f'scale_{scale:g}'
+    if not (data_dir / 'BigSeller Orders' / 'bigseller_orders.csv').exists():
+        print(f"Generating scale {scale:g} dataset in {data_dir}...", file=sys.stderr)
+        generate_dataset(data_dir, scale, seed)
+
+    stage_seconds = {}
+    stage_cpu_seconds = {}
+    totals = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = replace(dataset_config(data_dir, work_dir, warm), partitioned=partitioned)
+        if warm:
+            # Populate the input cache and order index so timed runs measure warm loading
+            run_pipeline(config, backend=backend)
+
+        for _ in range(repeats):
+            started = time.perf_counter()
+            final_sales, stages = run_pipeline(config, backend=backend)
+            totals.append(time.perf_counter() - started)
+            for name, stage in stages.items():
+                stage_seconds.setdefault(name, []).append(stage['wall_seconds'])
+                stage_cpu_seconds.setdefault(name, []).append(stage['cpu_seconds'])
+
+        traced_peak = {}
+        if memory:
+            # Separate pass: tracemalloc slows the pipeline down, so it is not timed (it does
+            # not see allocations made inside polars)
+            tracemalloc.start()
+            try:
+                _, stages = run_pipeline(config, backend=backend)
+            finally:
+                tracemalloc.stop()
+            traced_peak = {name: stage['traced_peak_mb'] for name, stage in stages.items()}
+
+    reference = compare_to_reference(final_sales, data_dir / REFERENCE_FILE, update_reference)
+    bigseller_rows = sum(1 for _ in open(config.bigseller_path, 'rb')) - 1
+    return {
+        'scale': scale,
+        'data_dir': str(data_dir),
+        'bigseller_rows': bigseller_rows,
+        'repeats': repeats,
+        'backend': backend,
+        'partitioned': partitioned,
+        'warm_cache': warm,
+        'total_seconds': {'runs': totals, 'median': statistics.median(totals)},
+        'stages': {
+            name: {
+                'seconds': seconds,
+                'median_seconds': statistics.median(seconds),
+                'median_cpu_seconds': statistics.median(stage_cpu_seconds[name]),
+                'peak_memory_mb': traced_peak.get(name),
+            }
+            for name, seconds in stage_seconds.items()
+        },
+        'reference': reference,
+    }
+
+
+def environment():
+    """Describe the code version and machine the benchmark ran on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': sa.os.cpu_count(),
+    }
+
+
+def print_results(report):
+    for result in report['results']:
+        print(f"\nScale {result['scale']:g} ({result['bigseller_rows']} BigSeller rows, {result.get('backend', 'pandas')}): "
+              f"{result['total_seconds']['median']:.3f}s median total, reference {result['reference']['status']}")
+        for name, stage in result['stages'].items():
+            memory = f"{stage['peak_memory_mb']:>9.1f} MB" if stage['peak_memory_mb'] is not None else ''
+            print(f"  {name:<18} {stage['median_seconds']:>9.3f}s {memory}")
+    if 'max_rss_mb' in report:
+        print(f"\nProcess peak RSS: {report['max_rss_mb']:.1f} MB")
+
+
+def compare_reports(before, after):
+    """Print per-stage median time ratios (after / before) for scales present in both reports"""
+    before_results = {result['scale']: result for result in before['results']}
+    print(f"before: {before.get('git_commit')} ({before.get('created')})")
+    print(f"after:  {after.get('git_commit')} ({after.get('created')})")
+    for result in after['results']:
+        previous = before_results.get(result['scale'])
+        if previous is None:
+            continue
+        print(f"\nScale {result['scale']:g}")
+        rows = [('total', previous['total_seconds']['median'], result['total_seconds']['median'])]
+        for name, stage in result['stages'].items():
+            if name in previous['stages']:
+                rows.append((name, previous['stages'][name]['median_seconds'], stage['median_seconds']))
+        for name, old, new in rows:
+            ratio = new / old if old else float('nan')
+            print(f"  {name:<18} {old:>9.3f}s -> {new:>9.3f}s  x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the sales pipeline on synthetic data')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='benchmark the pipeline')
+    run_parser.add_argument('--scales', type=float, nargs='+', default=[1, 10], help='dataset scales (default: 1 10)')
+    run_parser.add_argument('--data-dir', default=DATA_DIR, help='where datasets are generated')
+    run_parser.add_argument('--repeats', type=int, default=3, help='timed runs per scale')
+    run_parser.add_argument('--seed', type=int, default=0, help='seed for newly generated datasets')
+    run_parser.add_argument('--warm', action='store_true', help="time runs with a warm input cache and order index")
+    run_parser.add_argument('--backend', default='pandas', choices=list(BACKENDS), help='execution backend (default: pandas)')
+    run_parser.add_argument('--partitioned', action='store_true', help='link (month, store) partitions in a process pool')
+    run_parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc memory pass')
+    run_parser.add_argument('--update-reference', action='store_true', help='overwrite the stored reference outputs')
+    run_parser.add_argument('--output', help='write the JSON report here')
+    compare_parser = commands.add_parser('compare', help='compare two JSON reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    args = parser.parse_args(argv)
+    configure_logging('WARNING')
+
+    if args.command == 'compare':
+        compare_reports(json.loads(Path(args.before).read_text()), json.loads(Path(args.after).read_text()))
+        return
+
+    report = environment()
+    report['results'] = [
+        benchmark_scale(scale, args.data_dir, args.repeats, args.seed, args.warm, not args.no_memory,
+                        args.update_reference, args.backend, args.partitioned)
+        for scale in args.scales
+    ]
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report['max_rss_mb'] = max_rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+    print_results(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {args.output}")
+    if any(result['reference']['status'] == 'mismatch' for result in report['results']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Fingerprinted columnar cache for parsed input files.
+
+Each parsed input (Excel sheet, fact table CSV, filtered BigSeller export) is stored as a
+Parquet file (pickle when pyarrow is not installed) next to a small JSON entry holding the
+source path, size, mtime and SHA-256 of the file it was parsed from. Unchanged inputs load
+straight from the cache; changed inputs are re-parsed and the entry is replaced.
+
+Usage:
+    python sales_cache.py list
+    python sales_cache.py clear [PATH ...]
+    python sales_cache.py prune
+"""
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+# Default cache location (relative to the working directory, like the Data/ paths)
+CACHE_DIR = '.sales_cache'
+# Part of every entry key: bump when what a reader returns changes (dtypes, dropped rows) and
+# its name and parameters do not, so entries written by the old code are re-parsed
+CACHE_VERSION = 3
+
+
+def hash_file(path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """Return the size, mtime and content hash of a file"""
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': hash_file(path),
+    }
+
+
+def is_fresh(entry, path):
+    """Check whether a cache entry still matches the file it was parsed from.
+
+    Size and mtime are compared first; the content hash is only recomputed when the
+    size matches but the mtime moved (e.g. the file was copied or touched).
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime_ns == entry['mtime_ns']:
+        return True
+    return hash_file(path) == entry['sha256']
+
+
+def normalize_frame(frame):
+    """Normalize dtypes so the frame round-trips through the columnar format.
+
+    Object columns hold text: non-missing values become str and missing values NaN.
+    """
+    frame = frame.reset_index(drop=True)
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            values = frame[column]
+            frame[column] = values.astype(str).where(values.notna(), np.nan)
+    return frame
+
+
+def _entry_id(path, reader, params):
+    key = json.dumps(
+        {'path': str(Path(path).resolve()), 'reader': reader.__qualname__, 'params': params, 'version': CACHE_VERSION},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _data_path(cache_dir, entry_id, cache_format):
+    suffix = 'parquet' if cache_format == 'parquet' else 'pkl'
+    return Path(cache_dir) / f'{entry_id}.{suffix}'
+
+
+def _write_json(path, data):
+    tmp_path = path.with_suffix('.json.tmp')
+    tmp_path.write_text(json.dumps(data, indent=2, default=str))
+    os.replace(tmp_path, path)
+
+
+def _write_frame(frame, path, cache_format):
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    if cache_format == 'parquet':
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        frame.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_frame(path, cache_format):
+    if cache_format == 'parquet':
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_pickle(path)
+    # Parquet returns None for missing text; the pipeline expects NaN
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            frame[column] = frame[column].where(frame[column].notna(), np.nan)
+    return frame
+
+
+def cached_read(path, reader, cache_dir=CACHE_DIR, **params):
+    """Return reader(path, **params), served from the cache while the file is unchanged.
+
+    The cache key is the resolved path, the reader name and params and CACHE_VERSION, so the
+    same file read with different options gets separate entries. Frame attrs are kept in the entry.
+    Pass cache_dir=None to bypass the cache.
+    """
+    if cache_dir is None:
+        return reader(path, **params)
+
+    cache_dir = Path(cache_dir)
+    entry_id = _entry_id(path, reader, params)
+    entry_path = cache_dir / f'{entry_id}.json'
+
+    if entry_path.exists():
+        entry = json.loads(entry_path.read_text())
+        data_path = _data_path(cache_dir, entry_id, entry['format'])
+        if data_path.exists() and is_fresh(entry, path):
+            frame = _read_frame(data_path, entry['format'])
+            frame.attrs.update(entry.get('attrs', {}))
+            stat = os.stat(path)
+            if stat.st_mtime_ns != entry['mtime_ns']:
+                entry['mtime_ns'] = stat.st_mtime_ns
+                _write_json(entry_path, entry)
+            return frame
+
+    fingerprint = file_fingerprint(path)
+    frame = reader(path, **params)
+    attrs = dict(frame.attrs)
+    frame = normalize_frame(frame)
+    frame.attrs.update(attrs)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _write_frame(frame, _data_path(cache_dir, entry_id, CACHE_FORMAT), CACHE_FORMAT)
+    _write_json(entry_path, {
+        'path': str(Path(path).resolve()),
+        'reader': reader.__qualname__,
+        'params': params,
+        'version': CACHE_VERSION,
+        'format': CACHE_FORMAT,
+        'rows': len(frame),
+        'attrs': attrs,
+        **fingerprint,
+    })
+    return frame
+
+
+def list_entries(cache_dir=CACHE_DIR):
+    """Return (entry_id, entry) pairs for every cache entry"""
+    cache_dir = Path(cache_dir)
+    if not cache_dir.exists():
+        return []
+    return [(entry_path.stem, json.loads(entry_path.read_text())) for entry_path in sorted(cache_dir.glob('*.json'))]
+
+
+def remove_entry(entry_id, entry, cache_dir=CACHE_DIR):
+    """Delete a cache entry and its data file"""
+    _data_path(cache_dir, entry_id, entry['format']).unlink(missing_ok=True)
+    (Path(cache_dir) / f'{entry_id}.json').unlink(missing_ok=True)
+
+
+def clear_cache(paths=None, cache_dir=CACHE_DIR):
+    """Remove all entries, or only those parsed from the given source paths; returns the count"""
+    targets = {str(Path(path).resolve()) for path in paths} if paths else None
+    removed = 0
+    for entry_id, entry in list_entries(cache_dir):
+        if targets is None or entry['path'] in targets:
+            remove_entry(entry_id, entry, cache_dir)
+            removed += 1
+    return removed
+
+
+def prune_cache(cache_dir=CACHE_DIR):
+    """Remove entries whose source file changed or no longer exists, or that an older
+    CACHE_VERSION wrote; returns the count"""
+    removed = 0
+    for entry_id, entry in list_entries(cache_dir):
+        if entry.get('version') != CACHE_VERSION or not is_fresh(entry, entry['path']):
+            remove_entry(entry_id, entry, cache_dir)
+            removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the parsed input cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f'cache directory (default: {CACHE_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='show cached inputs and whether they are still fresh')
+    clear = commands.add_parser('clear', help='remove cached inputs (all, or only for the given files)')
+    clear.add_argument('paths', nargs='*', help='source files to invalidate')
+    commands.add_parser('prune', help='remove entries whose source file changed or was deleted, or from an older cache version')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        entries = list_entries(args.cache_dir)
+        for entry_id, entry in entries:
+            status = 'fresh' if is_fresh(entry, entry['path']) else 'stale'
+            data_path = _data_path(args.cache_dir, entry_id, entry['format'])
+            size_kb = data_path.stat().st_size / 1024 if data_path.exists() else 0
+            print(f"{entry_id}  {status:5}  {entry['rows']:>9} rows  {size_kb:>9.1f} KB  "
+                  f"{entry['reader']}  {entry['path']}")
+        print(f"{len(entries)} cache entries in {args.cache_dir}")
+    elif args.command == 'clear':
+        print(f"Removed {clear_cache(args.paths, args.cache_dir)} cache entries")
+    elif args.command == 'prune':
+        print(f"Removed {prune_cache(args.cache_dir)} stale cache entries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Pre-aggregated sales cube and query API.
+
+The pipeline writes quantity_sold and revenue at (date, store, creator, content_type, sku)
+grain (FACT TABLE orders only, like final_sales_table_quantity.csv). SalesCube answers
+slices, roll-ups and top-N queries from that file without touching the raw orders.
+
+Usage:
+    python sales_cube.py rollup content_type sku
+    python sales_cube.py rollup creator --where store="HIM Clinic" --start 2025-11-01
+    python sales_cube.py top 10 --by sku --measure quantity_sold --where content_type=Live,Video
+    python sales_cube.py slice --where creator=bob --where sku=COF1
+"""
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from sales_cache import CACHE_FORMAT
+
+# Cube grain and measures
+DIMENSIONS = ['date', 'store', 'creator', 'content_type', 'sku']
+MEASURES = ['quantity_sold', 'revenue']
+
+# Parquet when pyarrow is installed, otherwise pickle (both keep the categorical dtypes)
+CUBE_FILE = 'sales_cube.parquet' if CACHE_FORMAT == 'parquet' else 'sales_cube.pkl'
+
+
+def build_cube(partials):
+    """Sum partial cubes (frames with DIMENSIONS and MEASURES columns) into one compact cube"""
+    if partials:
+        cube = pd.concat(partials, ignore_index=True)
+    else:
+        cube = pd.DataFrame({column: pd.Series(dtype=object) for column in DIMENSIONS + MEASURES})
+    cube['date'] = pd.to_datetime(cube['date'])
+    for column in DIMENSIONS[1:]:
+        cube[column] = cube[column].astype(str).astype('category')
+    cube = cube.groupby(DIMENSIONS, observed=True)[MEASURES].sum().reset_index()
+    return cube.sort_values(DIMENSIONS, ignore_index=True)
+
+
+def save_cube(cube, path=CUBE_FILE):
+    """Write the cube as Parquet (.parquet), pickle (.pkl) or CSV, by file suffix"""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        cube.to_parquet(path, index=False)
+    elif path.suffix == '.pkl':
+        cube.to_pickle(path)
+    else:
+        cube.to_csv(path, index=False)
+
+
+def load_cube(path=CUBE_FILE):
+    """Read a cube written by save_cube"""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    if path.suffix == '.pkl':
+        return pd.read_pickle(path)
+    cube = pd.read_csv(path, parse_dates=['date'])
+    for column in DIMENSIONS[1:]:
+        cube[column] = cube[column].astype(str).astype('category')
+    return cube
+
+
+class SalesCube:
+    """Slice, roll up and rank a sales cube.
+
+    Filters are keyword arguments per dimension, each a value or a list of values, plus
+    start/end dates (inclusive), e.g. cube.rollup(['creator'], store='HIM Clinic', start='2025-11-01').
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+
+    @classmethod
+    def load(cls, path=CUBE_FILE):
+        return cls(load_cube(path))
+
+    def slice(self, start=None, end=None, **filters):
+        """Return the cube rows matching the filters"""
+        keep = pd.Series(True, index=self.cube.index)
+        if start is not None:
+            keep &= self.cube['date'] >= pd.Timestamp(start)
+        if end is not None:
+            keep &= self.cube['date'] <= pd.Timestamp(end)
+        _check_dimensions(filters)
+        for column, values in filters.items():
+            values = [values] if isinstance(values, str) or not hasattr(values, '__iter__') else list(values)
+            if column == 'date':
+                keep &= self.cube['date'].isin(pd.to_datetime(values))
+            else:
+                keep &= self.cube[column].isin(values)
+        return self.cube[keep]
+
+    def rollup(self, by, measures=MEASURES, **filters):
+        """Sum measures by the given dimensions (a name or a list) over the filtered cube"""
+        by = [by] if isinstance(by, str) else list(by)
+        _check_dimensions(by)
+        rows = self.slice(**filters)
+        if by:
+            result = rows.groupby(by, observed=True)[list(measures)].sum().reset_index()
+        else:
+            result = rows[list(measures)].agg(['sum']).reset_index(drop=True)
+        for column in by:
+            if isinstance(result[column].dtype, pd.CategoricalDtype):
+                result[column] = result[column].astype(str)
+        if 'revenue' in result:
+            result['revenue'] = result['revenue'].round(2)
+        return result.sort_values(by, ignore_index=True)
+
+    def top(self, n=10, by='sku', measure='revenue', **filters):
+        """Return the n largest groups of `by` by `measure` over the filtered cube"""
+        return self.rollup(by, **filters).nlargest(n, measure).reset_index(drop=True)
+
+
+def _check_dimensions(columns):
+    for column in columns:
+        if column not in DIMENSIONS:
+            raise KeyError(f"Unknown dimension '{column}' (expected one of {', '.join(DIMENSIONS)})")
+
+
+def parse_filters(where):
+    """Turn ['store=HIM Clinic', 'content_type=Live,Video'] into slice keyword arguments"""
+    filters = {}
+    for condition in where or []:
+        column, _, values = condition.partition('=')
+        filters.setdefault(column.strip(), []).extend(value.strip() for value in values.split(','))
+    return filters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the pre-aggregated sales cube')
+    parser.add_argument('--cube', default=CUBE_FILE, help=f'cube file (default: {CUBE_FILE})')
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument('--where', action='append', metavar='DIM=VALUE[,VALUE]', help='filter (repeatable)')
+    filters.add_argument('--start', help='first date (inclusive)')
+    filters.add_argument('--end', help='last date (inclusive)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rollup = commands.add_parser('rollup', parents=[filters], help='sum measures by dimensions')
+    rollup.add_argument('by', nargs='*', metavar='DIM', help=f'any of {", ".join(DIMENSIONS)} (none: grand total)')
+    top = commands.add_parser('top', parents=[filters], help='largest groups by a measure')
+    top.add_argument('n', type=int, nargs='?', default=10)
+    top.add_argument('--by', default='sku', choices=DIMENSIONS)
+    top.add_argument('--measure', default='revenue', choices=MEASURES)
+    commands.add_parser('slice', parents=[filters], help='show matching cube rows')
+    args = parser.parse_args(argv)
+
+    cube = SalesCube.load(args.cube)
+    started = time.perf_counter()
+    query = {'start': args.start, 'end': args.end, **parse_filters(args.where)}
+    if args.command == 'rollup':
+        result = cube.rollup(args.by, **query)
+    elif args.command == 'top':
+        result = cube.top(args.n, args.by, args.measure, **query)
+    else:
+        result = cube.slice(**query)
+    elapsed = (time.perf_counter() - started) * 1000
+
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(result.to_string(index=False))
+    print(f"\n{len(result)} rows from {len(cube.cube)} cube rows in {elapsed:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
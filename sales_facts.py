@@ -0,0 +1,199 @@
+"""Partitioned line-item fact dataset.
+
+Runs with --facts write every FACT TABLE order line, broken down into unit SKUs with its
+allocated revenue, as a Parquet dataset partitioned by order month and content type:
+
+    sales_facts/month=2025-11/content_type=Live/<export>-0.parquet
+
+Each export writes its own file per partition, so incremental runs only rewrite the exports
+they reprocess. Text columns are dictionary encoded and rows are sorted by order date and
+SKU within each file, so the row-group statistics let readers skip data. Readers
+(pyarrow.dataset, pandas.read_parquet, polars.scan_parquet) only open the partitions,
+columns and row groups a query needs.
+
+Usage:
+    python sales_facts.py list
+    python sales_facts.py rollup sku --where month=2025-11 --where content_type=Live
+    python sales_facts.py rows --where sku=COF1 --start 2025-11-01 --columns order_no order_date revenue
+"""
+import argparse
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+import pandas as pd
+
+from sales_cube import MEASURES, parse_filters
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+FACTS_DIR = 'sales_facts'
+# Directory levels of the dataset (hive style: <column>=<value>)
+PARTITION_COLUMNS = ['month', 'content_type']
+# Columns stored in the files
+LINE_ITEM_COLUMNS = ['order_no', 'order_date', 'store', 'sales_channel', 'creator', 'combo_sku', 'sku',
+                     'quantity_sold', 'revenue']
+# Rows per Parquet row group (each has its own min/max statistics)
+ROW_GROUP_ROWS = 65_536
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS]), flavor='hive')
+
+
+def write_facts(line_items, root=FACTS_DIR, name='facts'):
+    """Replace the files of one export (name) with its line items (PARTITION_COLUMNS + LINE_ITEM_COLUMNS)"""
+    if ds is None:
+        raise ImportError("The line-item facts dataset needs pyarrow (pip install pyarrow)")
+    remove_facts(root, [name])
+    if len(line_items) == 0:
+        return
+    line_items = line_items[PARTITION_COLUMNS + LINE_ITEM_COLUMNS].sort_values(['order_date', 'sku'], ignore_index=True)
+    for column in PARTITION_COLUMNS:
+        line_items[column] = line_items[column].astype(str)
+    ds.write_dataset(
+        pa.Table.from_pandas(line_items, preserve_index=False),
+        root,
+        format='parquet',
+        partitioning=_partitioning(),
+        basename_template=f'{name}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(
+            use_dictionary=True, write_statistics=True, compression='zstd'),
+        max_rows_per_group=ROW_GROUP_ROWS,
+        min_rows_per_group=min(ROW_GROUP_ROWS, len(line_items)),
+    )
+
+
+def _files(root):
+    return sorted(Path(root).glob('*=*/*=*/*.parquet'))
+
+
+def remove_facts(root, names):
+    """Delete the files of the given exports (and partition directories left empty)"""
+    names = set(names)
+    for path in _files(root):
+        if path.stem.rsplit('-', 1)[0] in names:
+            path.unlink()
+    _remove_empty_dirs(root)
+
+
+def prune_facts(root, names):
+    """Delete the files of exports not in names (e.g. exports that were removed or left the window)"""
+    stale = {path.stem.rsplit('-', 1)[0] for path in _files(root)} - set(names)
+    if stale:
+        remove_facts(root, stale)
+    return stale
+
+
+def _remove_empty_dirs(root):
+    for directory in sorted(Path(root).glob('*=*/*=*')) + sorted(Path(root).glob('*=*')):
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+
+
+def open_facts(root=FACTS_DIR):
+    """Return the dataset as a pyarrow.dataset.Dataset (month and content_type come from the paths)"""
+    if ds is None:
+        raise ImportError("Reading the line-item facts dataset needs pyarrow (pip install pyarrow)")
+    return ds.dataset(root, format='parquet', partitioning=_partitioning())
+
+
+def facts_filter(start=None, end=None, **filters):
+    """Build a pyarrow filter expression: each keyword is a column and a value or list of values,
+    start/end bound order_date (inclusive; end is a date, so the whole day is included)"""
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('order_date') >= pd.Timestamp(start))
+    if end is not None:
+        conditions.append(ds.field('order_date') < pd.Timestamp(end) + pd.Timedelta(days=1))
+    for column, values in filters.items():
+        if column not in PARTITION_COLUMNS + LINE_ITEM_COLUMNS:
+            raise KeyError(f"Unknown column '{column}' (expected one of {', '.join(PARTITION_COLUMNS + LINE_ITEM_COLUMNS)})")
+        values = [values] if isinstance(values, str) or not hasattr(values, '__iter__') else list(values)
+        conditions.append(ds.field(column).isin(values))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_facts(root=FACTS_DIR, columns=None, start=None, end=None, **filters):
+    """Read the matching line items as a DataFrame; only the needed partitions, columns and row groups are read"""
+    table = open_facts(root).to_table(columns=columns, filter=facts_filter(start, end, **filters))
+    return table.to_pandas()
+
+
+def rollup_facts(by, root=FACTS_DIR, start=None, end=None, **filters):
+    """Sum quantity_sold and revenue by the given columns over the matching line items"""
+    by = [by] if isinstance(by, str) else list(by)
+    rows = read_facts(root, by + MEASURES, start, end, **filters)
+    if by:
+        result = rows.groupby(by, observed=True)[MEASURES].sum().reset_index()
+        for column in by:
+            if isinstance(result[column].dtype, pd.CategoricalDtype):
+                result[column] = result[column].astype(str)
+    else:
+        result = rows[MEASURES].agg(['sum']).reset_index(drop=True)
+    result['revenue'] = result['revenue'].round(2)
+    return result.sort_values(by, ignore_index=True)
+
+
+def describe_facts(root=FACTS_DIR):
+    """Return one row per partition with its files, rows, row groups and size"""
+    partitions = {}
+    for path in _files(root):
+        metadata = pq.ParquetFile(path).metadata
+        key = tuple(unquote(part.split('=', 1)[1]) for part in path.parent.relative_to(root).parts)
+        entry = partitions.setdefault(key, {'files': 0, 'rows': 0, 'row_groups': 0, 'mb': 0.0})
+        entry['files'] += 1
+        entry['rows'] += metadata.num_rows
+        entry['row_groups'] += metadata.num_row_groups
+        entry['mb'] += path.stat().st_size / 2 ** 20
+    listing = pd.DataFrame(
+        [{**dict(zip(PARTITION_COLUMNS, key)), **entry} for key, entry in sorted(partitions.items())],
+        columns=PARTITION_COLUMNS + ['files', 'rows', 'row_groups', 'mb'],
+    )
+    listing['mb'] = listing['mb'].round(3)
+    return listing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the partitioned line-item facts dataset')
+    parser.add_argument('--dir', default=FACTS_DIR, help=f'dataset directory (default: {FACTS_DIR})')
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument('--where', action='append', metavar='COLUMN=VALUE[,VALUE]', help='filter (repeatable)')
+    filters.add_argument('--start', help='first order date (inclusive)')
+    filters.add_argument('--end', help='last order date (inclusive)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='partitions with their files, rows and size')
+    rollup = commands.add_parser('rollup', parents=[filters], help='sum quantity and revenue by columns')
+    rollup.add_argument('by', nargs='*', metavar='COLUMN', help='columns to group by (none: grand total)')
+    rows = commands.add_parser('rows', parents=[filters], help='show matching line items')
+    rows.add_argument('--columns', nargs='+', help='columns to read (default: all)')
+    rows.add_argument('--limit', type=int, default=50, help='rows to print (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == 'list':
+        result = describe_facts(args.dir)
+    else:
+        query = {'start': args.start, 'end': args.end, **parse_filters(args.where)}
+        if args.command == 'rollup':
+            result = rollup_facts(args.by, args.dir, **query)
+        else:
+            result = read_facts(args.dir, args.columns, **query)
+    elapsed = (time.perf_counter() - started) * 1000
+
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(result.head(args.limit).to_string(index=False) if args.command == 'rows' else result.to_string(index=False))
+    print(f"\n{len(result)} rows in {elapsed:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""Persistent Order ID index of the TikTok fact table exports.
+
+Each fact table export is reduced once to its attribution lookups and stored in a local
+SQLite database:
+- orders: (file, Order ID) -> normalized content type and creator
+- order_skus: (file, Order ID, SKU) -> sales channel and normalized content type
+
+Exports are keyed by path and fingerprinted like the input cache (size, mtime, SHA-256);
+a new or changed export only replaces its own rows. Attribution probes the index in bulk
+with the candidate Order IDs instead of re-parsing and re-grouping every CSV.
+
+Usage:
+    python sales_index.py list
+    python sales_index.py lookup ORDER_ID [ORDER_ID ...]
+    python sales_index.py prune
+    python sales_index.py clear
+"""
+import argparse
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from sales_cache import file_fingerprint, is_fresh
+
+# Default index location (next to the saved partial aggregates)
+INDEX_PATH = '.sales_state/order_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    store TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    orders INTEGER,
+    order_skus INTEGER
+);
+CREATE TABLE IF NOT EXISTS orders (
+    file_id INTEGER NOT NULL,
+    order_id TEXT NOT NULL,
+    content_type TEXT,
+    creator TEXT,
+    PRIMARY KEY (file_id, order_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS order_skus (
+    file_id INTEGER NOT NULL,
+    order_id TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    sales_channel TEXT,
+    content_type TEXT,
+    PRIMARY KEY (file_id, order_id, sku)
+) WITHOUT ROWID;
+"""
+
+
+class OrderIndex:
+    """SQLite-backed attribution lookups per fact table export.
+
+    settings describes how the lookups were built (statuses, normalization version); when
+    it differs from the stored value the index is emptied and rebuilt as exports are added.
+    Pass settings=None to open an existing index without checking them (e.g. to inspect it).
+    """
+
+    def __init__(self, path=INDEX_PATH, settings=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        stored = self.connection.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        if settings is not None and (stored is None or stored[0] != settings):
+            with self.connection:
+                for table in ('order_skus', 'orders', 'files'):
+                    self.connection.execute(f'DELETE FROM {table}')
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (settings,))
+
+    def close(self):
+        self.connection.close()
+
+    def _file(self, path):
+        row = self.connection.execute(
+            'SELECT file_id, size, mtime_ns, sha256 FROM files WHERE path = ?', (str(path),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'file_id': row[0], 'size': row[1], 'mtime_ns': row[2], 'sha256': row[3]}
+
+    def is_current(self, path):
+        """Check whether the export at path is indexed and unchanged since it was added"""
+        entry = self._file(path)
+        return entry is not None and is_fresh(entry, path)
+
+    def add(self, fact_file, order_lookup, sku_lookup):
+        """Index one export's lookups (from build_tiktok_lookups), replacing any earlier version"""
+        path = fact_file['path']
+        entry = self._file(path)
+        with self.connection:
+            if entry is not None:
+                self._delete(entry['file_id'])
+            cursor = self.connection.execute(
+                'INSERT INTO files (path, store, size, mtime_ns, sha256, orders, order_skus) '
+                'VALUES (:path, :store, :size, :mtime_ns, :sha256, :orders, :order_skus)',
+                {'path': path, 'store': fact_file['store'], **file_fingerprint(path),
+                 'orders': len(order_lookup), 'order_skus': len(sku_lookup)},
+            )
+            file_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO orders VALUES (?, ?, ?, ?)',
+                zip([file_id] * len(order_lookup), _text(order_lookup['Order ID']),
+                    _text(order_lookup['content_type']), _text(order_lookup['Creator Username'])),
+            )
+            self.connection.executemany(
+                'INSERT INTO order_skus VALUES (?, ?, ?, ?, ?)',
+                zip([file_id] * len(sku_lookup), _text(sku_lookup['Order ID']), _text(sku_lookup['sku']),
+                    _text(sku_lookup['sales_channel']), _text(sku_lookup['content_type'])),
+            )
+
+    def remove(self, path):
+        """Drop an export and its rows from the index"""
+        entry = self._file(path)
+        if entry is not None:
+            with self.connection:
+                self._delete(entry['file_id'])
+
+    def _delete(self, file_id):
+        for table in ('order_skus', 'orders', 'files'):
+            self.connection.execute(f'DELETE FROM {table} WHERE file_id = ?', (file_id,))
+
+    def prune(self):
+        """Remove exports whose file changed or no longer exists; returns the count"""
+        stale = [path for path in self.files()['path'] if not self.is_current(path)]
+        for path in stale:
+            self.remove(path)
+        return len(stale)
+
+    def lookups(self, paths, order_ids):
+        """Return {path: (order_lookup, sku_lookup)} of indexed exports for the given Order IDs.
+
+        When there are fewer Order IDs than index entries for the exports, the IDs are loaded
+        once into a temporary table and joined against the index, so only entries for the
+        probed orders are read; otherwise the exports' entries are read directly. Either way
+        it is one query per table. Entries for other orders may be included.
+        """
+        entries = {self._file(path)['file_id']: path for path in paths}
+        placeholders = ', '.join('?' * len(entries))
+        indexed = self.connection.execute(
+            f'SELECT SUM(order_skus) FROM files WHERE file_id IN ({placeholders})', list(entries)
+        ).fetchone()[0] or 0
+        if len(order_ids) < indexed:
+            with self.connection:
+                self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS probe (order_id TEXT PRIMARY KEY) WITHOUT ROWID')
+                self.connection.execute('DELETE FROM probe')
+                self.connection.executemany('INSERT OR IGNORE INTO probe VALUES (?)', ((order_id,) for order_id in order_ids))
+            probe = 'JOIN probe p ON p.order_id = t.order_id'
+        else:
+            probe = ''
+        order_lookups = pd.read_sql_query(
+            'SELECT t.file_id, t.order_id AS "Order ID", t.content_type, t.creator AS "Creator Username" '
+            f'FROM orders t {probe} WHERE t.file_id IN ({placeholders})',
+            self.connection, params=list(entries),
+        )
+        sku_lookups = pd.read_sql_query(
+            'SELECT t.file_id, t.order_id AS "Order ID", t.sku, t.sales_channel, t.content_type '
+            f'FROM order_skus t {probe} WHERE t.file_id IN ({placeholders})',
+            self.connection, params=list(entries),
+        )
+        order_groups = dict(list(order_lookups.groupby('file_id')))
+        sku_groups = dict(list(sku_lookups.groupby('file_id')))
+        return {
+            path: (
+                order_groups.get(file_id, order_lookups.iloc[:0]).drop(columns='file_id').reset_index(drop=True),
+                sku_groups.get(file_id, sku_lookups.iloc[:0]).drop(columns='file_id').reset_index(drop=True),
+            )
+            for file_id, path in entries.items()
+        }
+
+    def order_ids(self, paths, windows=None):
+        """Return the indexed Order IDs of the given exports as a DataFrame (path, Order ID).
+
+        With windows=(low, high) (arrays of integers with the same number of digits), only Order IDs
+        that are not plain digits without leading zeros, and plain ones within one of the
+        windows, are read: the windows are loaded into a temporary table and joined against the
+        index in one query.
+        """
+        entries = {self._file(path)['file_id']: path for path in paths}
+        placeholders = ', '.join('?' * len(entries))
+        query = f'SELECT t.file_id, t.order_id AS "Order ID" FROM orders t WHERE t.file_id IN ({placeholders})'
+        params = list(entries)
+        if windows is not None:
+            with self.connection:
+                self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS windows (low TEXT, high TEXT)')
+                self.connection.execute('DELETE FROM windows')
+                self.connection.executemany('INSERT INTO windows VALUES (?, ?)', zip(*(map(str, bound) for bound in windows)))
+            # Plain IDs of the same length compare as text like numbers
+            query = (
+                f"{query} AND (t.order_id GLOB '*[^0-9]*' OR t.order_id GLOB '0*' OR t.order_id = '') UNION "
+                'SELECT t.file_id, t.order_id AS "Order ID" FROM windows w JOIN orders t ON t.order_id BETWEEN w.low AND w.high '
+                f"AND length(t.order_id) = length(w.low) WHERE t.file_id IN ({placeholders}) AND t.order_id NOT GLOB '*[^0-9]*'"
+            )
+            params += list(entries)
+        order_ids = pd.read_sql_query(query, self.connection, params=params)
+        order_ids.insert(0, 'path', order_ids.pop('file_id').map(entries))
+        return order_ids
+
+    def files(self):
+        """Return the indexed exports as a DataFrame"""
+        return pd.read_sql_query('SELECT * FROM files ORDER BY path', self.connection)
+
+    def find(self, order_ids):
+        """Return every indexed (export, SKU) entry for the given Order IDs"""
+        placeholders = ', '.join('?' * len(order_ids))
+        return pd.read_sql_query(
+            'SELECT f.path, s.order_id, s.sku, s.sales_channel, s.content_type, o.creator '
+            'FROM order_skus s JOIN files f USING (file_id) '
+            'LEFT JOIN orders o ON o.file_id = s.file_id AND o.order_id = s.order_id '
+            f'WHERE s.order_id IN ({placeholders}) ORDER BY f.path, s.order_id, s.sku',
+            self.connection, params=list(order_ids),
+        )
+
+
+def _text(values):
+    """Column values as Python str, with missing values as None (SQL NULL)"""
+    return [None if pd.isna(value) else str(value) for value in values]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect the persistent TikTok Order ID index')
+    parser.add_argument('--index', default=INDEX_PATH, help=f'index database (default: {INDEX_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='show the indexed exports')
+    lookup = commands.add_parser('lookup', help='show the index entries for Order IDs')
+    lookup.add_argument('order_ids', nargs='+')
+    commands.add_parser('prune', help='remove exports whose file changed or was deleted')
+    commands.add_parser('clear', help='delete the index')
+    args = parser.parse_args(argv)
+
+    if args.command == 'clear':
+        Path(args.index).unlink(missing_ok=True)
+        print(f"Removed {args.index}")
+        return
+    if not Path(args.index).exists():
+        print(f"No index at {args.index}")
+        return
+
+    index = OrderIndex(args.index)
+    if args.command == 'list':
+        files = index.files()
+        for _, entry in files.iterrows():
+            status = 'fresh' if is_fresh(entry, entry['path']) else 'stale'
+            print(f"{status:5}  {entry['orders']:>9} orders  {entry['order_skus']:>9} order SKUs  {entry['path']}")
+        print(f"{len(files)} exports in {args.index}")
+    elif args.command == 'lookup':
+        entries = index.find(args.order_ids)
+        print(entries.to_string(index=False) if len(entries) else 'No entries')
+    elif args.command == 'prune':
+        print(f"Removed {index.prune()} stale exports")
+    index.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Stage instrumentation for the sales pipeline.
+
+RunReport.stage() is a context manager that records, for one pipeline stage, the wall time,
+CPU time (including finished child processes such as the fact table loaders), RSS, peak RSS
+growth and input/output row counts. One stage can be run under cProfile. The collected
+stages are written as a JSON run report.
+
+Usage:
+    report = RunReport(profile_stage='attribute')
+    with report.stage('filter', rows_in=len(orders)) as stage:
+        orders = filter_orders(orders, config)
+        stage['rows_out'] = len(orders)
+    report.write('run_report.json')
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = logging.getLogger('sales_analysis.instrument')
+
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+
+def configure_logging(level='INFO'):
+    """Send pipeline log messages to stderr at the given level"""
+    logging.basicConfig(format='%(message)s', stream=sys.stderr)
+    logging.getLogger('sales_analysis').setLevel(level)
+
+
+def current_rss_mb():
+    """Return the resident set size of this process in MB (None where it cannot be read)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB (None where unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def cpu_seconds():
+    """Return user + system CPU seconds of this process and its finished child processes"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _delta(end, start):
+    return None if end is None or start is None else round(end - start, 2)
+
+
+class RunReport:
+    """Collects per-stage metrics for one pipeline run.
+
+    Stages that run several times (e.g. once per fact table export) get one record per call;
+    totals() sums them by stage name. When tracemalloc is tracing, the traced peak allocation
+    of each stage is recorded as well. meta holds free-form run details (config, results).
+    """
+
+    def __init__(self, profile_stage=None):
+        self.stages = []
+        self.meta = {}
+        self.profile_stage = profile_stage
+        self.profiler = None
+        self.started = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._cpu_started = cpu_seconds()
+
+    @contextmanager
+    def stage(self, name, rows_in=None, **detail):
+        """Measure the enclosed block as stage `name`; set record['rows_out'] inside the block"""
+        record = {'stage': name, **detail, 'rows_in': rows_in, 'rows_out': None}
+        profiling = name == self.profile_stage
+        if profiling:
+            self.profiler = self.profiler or cProfile.Profile()
+            self.profiler.enable()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+        rss_start = current_rss_mb()
+        peak_start = peak_rss_mb()
+        cpu_start = cpu_seconds()
+        wall_start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall_start, 4)
+            record['cpu_seconds'] = round(cpu_seconds() - cpu_start, 4)
+            if profiling:
+                self.profiler.disable()
+            rss = current_rss_mb()
+            record['rss_mb'] = None if rss is None else round(rss, 2)
+            record['rss_delta_mb'] = _delta(rss, rss_start)
+            record['peak_rss_delta_mb'] = _delta(peak_rss_mb(), peak_start)
+            if tracing:
+                record['traced_peak_mb'] = round((tracemalloc.get_traced_memory()[1] - traced_start) / 2 ** 20, 2)
+            self.stages.append(record)
+            log.debug("[%s] %.3fs wall, %.3fs cpu, rows %s -> %s", name, record['wall_seconds'],
+                      record['cpu_seconds'], record['rows_in'], record['rows_out'])
+
+    def totals(self):
+        """Return {stage: summed metrics} over all calls of each stage, in first-call order"""
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record['stage'], {
+                'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows_in': None, 'rows_out': None,
+                'peak_rss_delta_mb': None,
+            })
+            total['calls'] += 1
+            total['wall_seconds'] = round(total['wall_seconds'] + record['wall_seconds'], 4)
+            total['cpu_seconds'] = round(total['cpu_seconds'] + record['cpu_seconds'], 4)
+            for key in ('rows_in', 'rows_out', 'peak_rss_delta_mb'):
+                if record[key] is not None:
+                    total[key] = round((total[key] or 0) + record[key], 2)
+            if 'traced_peak_mb' in record:
+                total['traced_peak_mb'] = max(total.get('traced_peak_mb', 0.0), record['traced_peak_mb'])
+        return totals
+
+    def profile_summary(self, limit=25):
+        """Return the cProfile statistics of the profiled stage, sorted by cumulative time"""
+        if self.profiler is None:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+    def summary(self):
+        """Return a one-line-per-stage text table of the totals"""
+        lines = [f"{'stage':<18} {'calls':>5} {'wall s':>9} {'cpu s':>9} {'rows in':>10} {'rows out':>10} {'peak RSS +MB':>12}"]
+        for name, total in self.totals().items():
+            lines.append(
+                f"{name:<18} {total['calls']:>5} {total['wall_seconds']:>9.3f} {total['cpu_seconds']:>9.3f} "
+                f"{_format(total['rows_in'], '.0f'):>10} {_format(total['rows_out'], '.0f'):>10} "
+                f"{_format(total['peak_rss_delta_mb'], '.1f'):>12}"
+            )
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self._started, 4),
+            'cpu_seconds': round(cpu_seconds() - self._cpu_started, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pid': os.getpid(),
+            **self.meta,
+            'profile_stage': self.profile_stage,
+            'totals': self.totals(),
+            'stages': self.stages,
+        }
+
+    def write(self, path):
+        """Write the JSON run report; a profiled stage's stats go next to it as <stem>.<stage>.prof"""
+        path = Path(path)
+        report = self.to_dict()
+        if self.profiler is not None:
+            profile_path = path.with_name(f'{path.stem}.{self.profile_stage}.prof')
+            self.profiler.dump_stats(profile_path)
+            report['profile_path'] = str(profile_path)
+        path.write_text(json.dumps(report, indent=2, default=str))
+        return path
+
+
+def _format(value, spec):
+    return '-' if value is None else format(value, spec)
@@ -0,0 +1,213 @@
+"""Sampled preview of the final sales table, with confidence intervals.
+
+Keeps a deterministic sample of the orders: an order is in the sample when the 64-bit hash
+of its (stripped) order number falls below rate * 2**64, so every line of a sampled order is
+kept, and the fact table rows of the same Order IDs link it exactly as in a full run. The
+sample goes through the same attribution (oldest export first), Order ID reconciliation
+and combo SKU revenue allocation, and each (content_type, sku) total is estimated by scaling the sampled orders'
+sums by 1 / rate. The interval uses the variance of that estimator when every order is kept
+independently with probability rate, (1 - rate) / rate**2 * sum(order total**2), with a normal
+approximation; its lower end is never below what the sampled orders alone add up to. Cells
+with few sampled orders get wide intervals. Rate 1 gives the full run's totals.
+
+Usage:
+    python sales_preview.py --rate 0.05
+    python sales_preview.py --rate 0.1 --by content_type --start 2025-11-24 --end 2025-11-30
+    python sales_preview.py --rate 0.02 --confidence 0.9 --seed 3 --output preview.csv
+"""
+import argparse
+import logging
+import time
+from dataclasses import replace
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import sales_analysis as sa
+from sales_cube import MEASURES
+from sales_index import OrderIndex
+from sales_instrument import LOG_LEVELS, RunReport, configure_logging
+
+log = logging.getLogger('sales_analysis.preview')
+
+# Share of orders kept by default
+PREVIEW_RATE = 0.05
+CONFIDENCE = 0.95
+PREVIEW_KEYS = ('content_type', 'sku')
+
+
+def order_sample(order_ids, rate, seed=0):
+    """Boolean mask of the order IDs in the sample (the same IDs are always kept for a rate and seed)"""
+    if rate >= 1:
+        return np.ones(len(order_ids), dtype=bool)
+    hashes = pd.util.hash_array(np.asarray(order_ids, dtype=object), hash_key=f'{seed:016d}'[-16:])
+    return hashes < np.uint64(rate * float(2 ** 64))
+
+
+def sample_lookups(fact_files, order_ids, rate, seed, config):
+    """Return (lookups, parsed): {path: (order_lookup, sku_lookup)} of every export, restricted to
+    the sampled orders, and the full lookups of the exports that were parsed.
+
+    Exports current in the order index are probed with order_ids; the others are parsed (through
+    the input cache) and only their sampled Order IDs are reduced to lookups. The full lookups
+    are kept for sales_analysis.reconcile when config.reconcile is set (mangled Order IDs hash
+    differently from the fact Order IDs they match). The index is not updated, so a preview
+    never writes state a full run depends on.
+    """
+    index = OrderIndex(config.order_index_path, sa.order_index_settings(config)) if config.order_index_path is not None else None
+    try:
+        indexed_paths = [fact_file['path'] for fact_file in fact_files if index is not None and index.is_current(fact_file['path'])]
+        stale_files = [fact_file for fact_file in fact_files if fact_file['path'] not in indexed_paths]
+        lookups, parsed = {}, {}
+        for fact_file, tiktok in zip(stale_files, sa.load_fact_tables(stale_files, config)):
+            sampled = tiktok[order_sample(tiktok['Order ID'].astype(str).str.strip(), rate, seed)].reset_index(drop=True)
+            lookups[fact_file['path']] = sa.build_tiktok_lookups(sampled)
+            if config.reconcile:
+                parsed[fact_file['path']] = sa.build_tiktok_lookups(tiktok) if rate < 1 else lookups[fact_file['path']]
+        if indexed_paths:
+            lookups.update(index.lookups(indexed_paths, order_ids))
+    finally:
+        if index is not None:
+            index.close()
+    return lookups, parsed
+
+
+def estimate_totals(line_items, rate, confidence=CONFIDENCE, keys=PREVIEW_KEYS):
+    """Scale the sampled line items' sums by 1 / rate and add confidence intervals per group of keys"""
+    keys = list(keys)
+    columns = [column for measure in MEASURES for column in (measure, f'{measure}_low', f'{measure}_high')]
+    lines = pd.concat(line_items, ignore_index=True) if line_items else pd.DataFrame()
+    if len(lines) == 0:
+        return pd.DataFrame(columns=keys + columns + ['sample_orders'])
+    for key in keys:
+        lines[key] = lines[key].astype(str)
+
+    # The orders are the sampling units: the variance comes from each order's own total
+    per_order = lines.groupby(keys + ['order_no'], observed=True)[MEASURES].sum()
+    groups = per_order.groupby(level=keys)
+    sampled = groups.sum()
+    squares = (per_order ** 2).groupby(level=keys).sum()
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    estimates = pd.DataFrame(index=sampled.index)
+    for measure in MEASURES:
+        estimate = sampled[measure] / rate
+        margin = z * np.sqrt((1 - rate) * squares[measure]) / rate
+        estimates[measure] = estimate
+        estimates[f'{measure}_low'] = np.maximum(estimate - margin, sampled[measure])
+        estimates[f'{measure}_high'] = estimate + margin
+    estimates['sample_orders'] = groups.size()
+    estimates = estimates.reset_index()
+    estimates[columns] = estimates[columns].round({column: 2 if column.startswith('revenue') else 1 for column in columns})
+    return estimates.sort_values([keys[0], 'quantity_sold'], ascending=[True, False], ignore_index=True)
+
+
+def preview(config=None, rate=PREVIEW_RATE, confidence=CONFIDENCE, seed=0, keys=PREVIEW_KEYS,
+            reference=None, report=None):
+    """Estimate the final sales table from a sample of the orders.
+
+    Returns a dict with estimates (keys, quantity_sold and revenue with their _low/_high bounds,
+    sample_orders), orders and sample_orders (distinct order numbers in the window and in the
+    sample), rate, confidence and report.
+    """
+    if not 0 < rate <= 1:
+        raise ValueError(f"rate must be in (0, 1], got {rate}")
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be in (0, 1), got {confidence}")
+    config = config or sa.PipelineConfig()
+    reference = reference or sa.ReferenceData()
+    report = report or RunReport()
+
+    with report.stage('load') as stage:
+        orders, fact_files = sa.load(config)
+        stage['rows_out'] = len(orders)
+    with report.stage('filter', rows_in=len(orders)) as stage:
+        orders = sa.filter_orders(orders, config)
+        stage['rows_out'] = len(orders)
+    with report.stage('sample', rows_in=len(orders)) as stage:
+        order_no = orders['order_no'].str.strip()
+        keep = order_sample(order_no, rate, seed)
+        population = order_no.nunique()
+        orders = orders[keep].reset_index(drop=True)
+        stage['rows_out'] = len(orders)
+    with report.stage('reference') as stage:
+        sku_resolver = reference.sku_resolver(config)
+        stage['rows_out'] = len(reference.sku_mapping)
+    with report.stage('lookups', rows_in=len(fact_files)) as stage:
+        order_ids = pd.unique(pd.concat([orders['order_no'], orders['order_no'].str.strip()]))
+        lookups, parsed_lookups = sample_lookups(fact_files, order_ids, rate, seed, config)
+        stage['rows_out'] = sum(len(sku_lookup) for _, sku_lookup in lookups.values())
+
+    # Same linking as a full run: exports oldest first, each claiming the rows it can attribute
+    unclaimed = np.ones(len(orders), dtype=bool)
+    line_items = []
+    for fact_file in fact_files:
+        name = Path(fact_file['path']).name
+        with report.stage('attribute', rows_in=int(unclaimed.sum()), export=name) as stage:
+            rows, claimed = sa.attribute(orders, unclaimed, *lookups.pop(fact_file['path']))
+            stage['rows_out'] = len(claimed)
+        unclaimed[rows] = False
+        with report.stage('expand', rows_in=len(claimed), export=name) as stage:
+            known = claimed['content_type'] != 'Unknown'
+            line_items.append(sa.expand_combo_sales(claimed[known], sku_resolver, keys=('order_no', 'content_type')))
+            stage['rows_out'] = len(line_items[-1])
+    if config.reconcile:
+        # Sampled rows no export claimed, relinked through normalized Order IDs as in a full run
+        with report.stage('reconcile', rows_in=int(unclaimed.sum())) as stage:
+            claims, _ = sa.reconcile(orders, unclaimed, fact_files, parsed_lookups, config)
+            for _, rows, claimed in claims:
+                known = claimed['content_type'] != 'Unknown'
+                line_items.append(sa.expand_combo_sales(claimed[known], sku_resolver, keys=('order_no', 'content_type')))
+            stage['rows_out'] = sum(len(rows) for _, rows, _ in claims)
+
+    with report.stage('estimate') as stage:
+        estimates = estimate_totals(line_items, rate, confidence, keys)
+        stage['rows_out'] = len(estimates)
+    report.meta.update(rate=rate, confidence=confidence, seed=seed)
+    return {
+        'estimates': estimates,
+        'orders': int(population),
+        'sample_orders': int(orders['order_no'].str.strip().nunique()),
+        'rate': rate,
+        'confidence': confidence,
+        'report': report,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estimate the final sales table from a sample of the orders')
+    parser.add_argument('--rate', type=float, default=PREVIEW_RATE, help='share of orders to sample (default: %(default)s)')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='interval confidence level (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='sample seed; each seed keeps a different set of orders')
+    parser.add_argument('--by', nargs='+', default=list(PREVIEW_KEYS), choices=PREVIEW_KEYS,
+                        help='columns to estimate totals by (default: content_type sku)')
+    parser.add_argument('--start', help=f'first order date (default: {sa.ORDER_DATE_START})')
+    parser.add_argument('--end', help=f'last order date (default: {sa.ORDER_DATE_END})')
+    parser.add_argument('--output', help='also write the estimates to this CSV file')
+    parser.add_argument('--log-level', default='WARNING', choices=LOG_LEVELS, help='progress message level (default: WARNING)')
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+
+    config = sa.PipelineConfig()
+    if args.start:
+        config = replace(config, order_date_start=args.start)
+    if args.end:
+        config = replace(config, order_date_end=args.end)
+
+    started = time.perf_counter()
+    result = preview(config, args.rate, args.confidence, args.seed, args.by)
+    elapsed = time.perf_counter() - started
+
+    with pd.option_context('display.max_rows', 500, 'display.width', 200):
+        print(result['estimates'].to_string(index=False))
+    print(f"\nEstimated from {result['sample_orders']} of {result['orders']} orders (rate {args.rate:g}), "
+          f"{args.confidence:.0%} intervals, in {elapsed:.2f}s")
+    if args.output:
+        result['estimates'].to_csv(args.output, index=False)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
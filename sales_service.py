@@ -0,0 +1,304 @@
+"""Refresh service for the dashboard data.
+
+Watches the BigSeller export, the combo SKU sheet and the fact table store directories and
+reruns the pipeline when an input changes. Runs are incremental: with the saved partials,
+order index and input cache only new or changed exports are parsed and linked, and the SKU
+resolver stays in memory between runs. The final sales table is served over HTTP as the
+dashboard's JSON payload (content_type, sku, quantity_sold, revenue). The serialized payload,
+its gzip form and its ETag are cached in memory, so polling clients that send If-None-Match
+get 304 Not Modified until the data changes.
+
+Usage:
+    python sales_service.py --port 8050 --interval 10
+    curl -i http://localhost:8050/sales-data.json
+    curl -i http://localhost:8050/status
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from pathlib import Path
+
+import sales_analysis as sa
+from sales_instrument import LOG_LEVELS, RunReport, configure_logging
+
+log = logging.getLogger('sales_analysis.service')
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8050
+# Seconds between input checks; a change is picked up once the files stop changing
+WATCH_INTERVAL = 10
+# Seconds an idle keep-alive connection stays open
+KEEPALIVE_TIMEOUT = 30
+# Dashboard data bundled into the build (written on refresh with --write-json)
+DASHBOARD_DATA_FILE = 'sales-dashboard/src/data/sales-data.json'
+PAYLOAD_PATH = '/sales-data.json'
+
+REASONS = {200: 'OK', 204: 'No Content', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+
+def input_snapshot(config):
+    """Return {path: (size, mtime_ns)} of the pipeline inputs, including every fact table export"""
+    paths = [Path(config.bigseller_path), Path(config.combo_sku_path)]
+    for directory in config.fact_store_dirs.values():
+        paths.extend(sorted(Path(directory).glob('creator_order_all_*.csv')))
+    snapshot = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        snapshot[str(path)] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+class Payload:
+    """The serialized dashboard payload of one pipeline run, with its gzip form and ETag"""
+
+    def __init__(self, final_sales):
+        self.body = final_sales.to_json(orient='records', indent=2).encode()
+        self.gzip_body = gzip.compress(self.body, mtime=0)
+        digest = hashlib.sha256(self.body).hexdigest()[:20]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.generated = datetime.now(timezone.utc).replace(microsecond=0)
+        self.last_modified = format_datetime(self.generated, usegmt=True)
+        self.rows = len(final_sales)
+        self.quantity_sold = float(final_sales['quantity_sold'].sum())
+        self.revenue = round(float(final_sales['revenue'].sum()), 2)
+
+    def matches(self, if_none_match):
+        """Check an If-None-Match header against this payload (weak comparison, either encoding)"""
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return any(tag == '*' or tag.removeprefix('W/') in (self.etag, self.gzip_etag) for tag in tags)
+
+
+def accepts_gzip(accept_encoding):
+    """Check whether an Accept-Encoding header allows gzip"""
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            quality = params.strip().removeprefix('q=') if params.strip().startswith('q=') else '1'
+            try:
+                return float(quality) > 0
+            except ValueError:
+                return False
+    return False
+
+
+class SalesService:
+    """Keeps the pipeline output current and answers HTTP requests for it.
+
+    Refreshes run one at a time in a worker thread; requests keep being served from the
+    previous payload until the new one is ready.
+    """
+
+    def __init__(self, config, json_file=None):
+        self.config = config
+        self.json_file = json_file
+        self.reference = sa.ReferenceData()
+        self.payload = None
+        self.snapshot = None
+        self.runs = 0
+        self.refreshing = False
+        self.last_run = None
+        self.last_error = None
+        self._pending = None
+        self._lock = asyncio.Lock()
+
+    def _run(self):
+        report = RunReport()
+        result = sa.run(self.config, self.reference, report)
+        return Payload(result['final_sales']), report
+
+    async def refresh(self, snapshot=None):
+        """Rerun the pipeline and swap in the new payload (errors keep the previous one)"""
+        async with self._lock:
+            self.refreshing = True
+            started = time.perf_counter()
+            snapshot = snapshot if snapshot is not None else await asyncio.to_thread(input_snapshot, self.config)
+            try:
+                payload, report = await asyncio.to_thread(self._run)
+                if self.json_file is not None:
+                    temporary = Path(f'{self.json_file}.tmp')
+                    temporary.write_bytes(payload.body)
+                    temporary.replace(self.json_file)
+            except Exception as error:
+                self.last_error = f'{type(error).__name__}: {error}'
+                log.exception("Refresh failed; still serving the previous data")
+            else:
+                self.payload = payload
+                self.last_error = None
+                totals = report.totals()
+                self.last_run = {
+                    'seconds': round(time.perf_counter() - started, 3),
+                    'reused_fact_files': report.meta.get('reused_fact_files'),
+                    'fact_files': report.meta.get('fact_files'),
+                    'stage_seconds': {name: total['wall_seconds'] for name, total in totals.items()},
+                }
+                log.info(f"Refreshed: {payload.rows} rows, ETag {payload.etag}, {self.last_run['seconds']}s "
+                         f"({self.last_run['reused_fact_files']}/{self.last_run['fact_files']} exports reused)")
+            finally:
+                self.snapshot = snapshot
+                self.runs += 1
+                self.refreshing = False
+
+    async def watch(self, interval=WATCH_INTERVAL):
+        """Poll the inputs and refresh once a change has been stable for one interval"""
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = await asyncio.to_thread(input_snapshot, self.config)
+            if snapshot == self.snapshot:
+                self._pending = None
+            elif snapshot == self._pending:
+                changed = sorted(set(snapshot.items()) ^ set(self.snapshot.items()))
+                log.info(f"Inputs changed: {', '.join(sorted({Path(path).name for path, _ in changed}))}")
+                self._pending = None
+                await self.refresh(snapshot)
+            else:
+                # Still being written (or just appeared): wait until it stops changing
+                self._pending = snapshot
+
+    def status(self):
+        payload = self.payload
+        return {
+            'state': 'refreshing' if self.refreshing else 'ready' if payload is not None else 'starting',
+            'generated': payload.generated.isoformat() if payload is not None else None,
+            'etag': payload.etag if payload is not None else None,
+            'rows': payload.rows if payload is not None else None,
+            'quantity_sold': payload.quantity_sold if payload is not None else None,
+            'revenue': payload.revenue if payload is not None else None,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'last_error': self.last_error,
+            'watched_files': len(self.snapshot or {}),
+        }
+
+    def respond(self, method, path, headers):
+        """Return (status, response headers, body) for one request"""
+        common = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag',
+        }
+        path = path.split('?', 1)[0]
+        if method == 'OPTIONS':
+            return 204, {**common, 'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
+                         'Access-Control-Allow-Headers': 'If-None-Match', 'Access-Control-Max-Age': '86400'}, b''
+        if method not in ('GET', 'HEAD'):
+            return 405, {**common, 'Allow': 'GET, HEAD, OPTIONS'}, b''
+        if path == '/status':
+            return 200, {**common, 'Content-Type': 'application/json', 'Cache-Control': 'no-store'}, \
+                json.dumps(self.status(), indent=2).encode()
+        if path not in (PAYLOAD_PATH, '/'):
+            return 404, common, b''
+
+        payload = self.payload
+        if payload is None:
+            return 503, {**common, 'Retry-After': '5'}, b''
+        use_gzip = accepts_gzip(headers.get('accept-encoding', ''))
+        cache = {
+            **common,
+            'ETag': payload.gzip_etag if use_gzip else payload.etag,
+            'Last-Modified': payload.last_modified,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if 'if-none-match' in headers and payload.matches(headers['if-none-match']):
+            return 304, cache, b''
+        if use_gzip:
+            return 200, {**cache, 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}, payload.gzip_body
+        return 200, {**cache, 'Content-Type': 'application/json'}, payload.body
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until it closes or idles out"""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                method, path, version = (request_line.decode('latin-1').split() + ['', '', ''])[:3]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                # Request bodies are not used; skip them so the connection stays in sync
+                try:
+                    content_length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    content_length = -1
+                if content_length < 0:
+                    # The body cannot be skipped reliably, so answer and drop the connection
+                    status, response_headers, body = 400, {}, b''
+                    keep_alive = False
+                else:
+                    if content_length:
+                        await reader.readexactly(content_length)
+                    status, response_headers, body = self.respond(method, path, headers)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                lines = [f'HTTP/1.1 {status} {REASONS[status]}']
+                lines += [f'{name}: {value}' for name, value in response_headers.items()]
+                if status != 304 and status != 204:
+                    lines.append(f'Content-Length: {len(body)}')
+                lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD' and status not in (204, 304):
+                    writer.write(body)
+                await writer.drain()
+                log.debug(f"{method} {path} -> {status}")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host=SERVICE_HOST, port=SERVICE_PORT, interval=WATCH_INTERVAL):
+    """Compute the first payload, then serve requests and watch the inputs until cancelled"""
+    server = await asyncio.start_server(service.handle, host, port)
+    log.info(f"Serving http://{host}:{port}{PAYLOAD_PATH} (status at /status), checking inputs every {interval}s")
+    await service.refresh()
+    async with server:
+        await asyncio.gather(server.serve_forever(), service.watch(interval))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the dashboard data and refresh it when the inputs change')
+    parser.add_argument('--host', default=SERVICE_HOST, help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL, help='seconds between input checks')
+    parser.add_argument('--write-json', nargs='?', const=DASHBOARD_DATA_FILE, metavar='PATH',
+                        help=f'also write the payload to PATH on every refresh (default PATH: {DASHBOARD_DATA_FILE})')
+    parser.add_argument('--no-outputs', action='store_true', help='do not write the CSV outputs and sales cube')
+    parser.add_argument('--log-level', default='INFO', choices=LOG_LEVELS, help='progress message level (default: INFO)')
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+    # Pipeline progress is verbose on every refresh; only the service's own messages at INFO
+    if args.log_level == 'INFO':
+        logging.getLogger('sales_analysis').setLevel('WARNING')
+        log.setLevel('INFO')
+
+    config = replace(sa.PipelineConfig(), write_outputs=not args.no_outputs)
+    service = SalesService(config, args.write_json)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""Synthetic input generator for benchmarking the sales pipeline.
+
+Writes a Data/-style tree with a BigSeller export, per-store creator_order_all fact tables
+and the combo/single SKU reference sheets. Orders use the SKU families sales_analysis.py
+knows (HIM*, HER*, COF*, SPU*, 2HIMVGO, shaker/trial packs, ...) with realistic prices,
+statuses, marketplaces and content type spellings. Scale 1 is roughly 30,000 BigSeller
+line items; larger scales grow linearly.
+
+Usage:
+    python sales_synthetic.py bench_data/scale_10 --scale 10 --seed 0
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# BigSeller line items generated at scale 1
+BASE_LINE_ITEMS = 30_000
+
+# Sellable SKUs as (sku, price, popularity weight, in combo sheet)
+SKU_CATALOGUE = [
+    ('HIM1', 69.0, 18, True),
+    ('HIM2', 129.0, 8, True),
+    ('HIM3', 189.0, 10, True),
+    ('HIM1-A', 69.0, 3, True),
+    ('HIM3-A', 189.0, 2, False),
+    ('HER1', 69.0, 8, True),
+    ('HER3', 189.0, 5, True),
+    ('HER3+1', 199.0, 2, False),
+    ('COF2', 129.0, 2, True),
+    ('HERCOF2', 129.0, 1, True),
+    ('SPU', 89.0, 6, True),
+    ('SPU-A', 89.0, 2, True),
+    ('SPU2', 169.0, 2, True),
+    ('SPUHIM', 149.0, 4, True),
+    ('SPUHIM-A', 149.0, 1, True),
+    ('HIMHER1', 135.0, 3, True),
+    ('2HIMVGO', 219.0, 3, True),
+    ('3HIM3HER', 369.0, 1, True),
+    ('HIM3SHA-V2', 199.0, 4, True),
+    ('HER3SHA-V2', 199.0, 2, True),
+    ('HIM3TP', 189.0, 2, True),
+    ('HER3TP', 189.0, 1, True),
+    ('TPHIM', 0.0, 2, True),
+    ('TPHER', 0.0, 1, True),
+    ('COFFEECUP-V1', 0.0, 2, True),
+    ('SHA-V2', 0.0, 2, True),
+    ('COF1', 69.0, 3, False),
+    ('VGOMX', 89.0, 2, False),
+    ('HBLISS', 89.0, 2, True),
+    ('GIFTBOX-X', 15.0, 1, False),
+]
+SINGLE_SKUS = ['COF1', 'HERCOF1', 'spr/x1', 'VGOMX', 'HBLISS', 'SHAKER', 'COFFEE CUP V1', 'TP-COF', 'TP-HERCOF']
+
+STORES = ['DrSamhanWellness', 'HIM Clinic']
+MARKETPLACES = (['TikTok', 'Shopee', 'Lazada'], [0.85, 0.10, 0.05])
+ORDER_STATUSES = (['Completed', 'Shipped', 'Processing', 'Cancelled', 'Returned'], [0.55, 0.18, 0.12, 0.12, 0.03])
+CONTENT_TYPES = (
+    ['LIVE', 'Livestream', 'Live', 'Video', 'Showcase', 'External Traffic Program', None],
+    [0.25, 0.10, 0.05, 0.25, 0.20, 0.10, 0.05],
+)
+
+# Export months: (start, end) of each creator_order_all file per store
+EXPORT_PERIODS = [
+    ('2025-10-01 00:00:00', '2025-10-31 23:59:59'),
+    ('2025-11-01 00:00:00', '2025-11-30 23:59:59'),
+]
+
+
+def generate_orders(line_items, rng):
+    """Return BigSeller line items as a DataFrame"""
+    n_orders = max(1, int(line_items / 1.4))
+    lines_per_order = np.minimum(1 + rng.poisson(0.4, n_orders), 4)
+
+    # Order-level attributes; about 10% of orders fall outside Oct-Nov
+    order_no = 576_000_000_000_000_000 + rng.choice(10 ** 15, n_orders, replace=False)
+    window_start = pd.Timestamp('2025-09-20').value
+    window_end = pd.Timestamp('2025-12-10').value
+    order_date = pd.to_datetime(rng.integers(window_start, window_end, n_orders))
+    marketplace = rng.choice(MARKETPLACES[0], n_orders, p=MARKETPLACES[1])
+    store = rng.choice(STORES, n_orders, p=[0.55, 0.45]).astype(object)
+    store[rng.random(n_orders) < 0.02] = None
+    status = rng.choice(ORDER_STATUSES[0], n_orders, p=ORDER_STATUSES[1])
+
+    # Explode to line items
+    order_index = np.repeat(np.arange(n_orders), lines_per_order)
+    skus = np.array([sku for sku, _, _, _ in SKU_CATALOGUE], dtype=object)
+    prices = np.array([price for _, price, _, _ in SKU_CATALOGUE])
+    weights = np.array([weight for _, _, weight, _ in SKU_CATALOGUE], dtype=float)
+    sku_index = rng.choice(len(skus), len(order_index), p=weights / weights.sum())
+    quantity = np.minimum(1 + rng.poisson(0.25, len(order_index)), 5)
+    # Occasional promo discounts and missing prices
+    price = prices[sku_index] * rng.choice([1.0, 0.9, 0.85], len(order_index), p=[0.8, 0.15, 0.05])
+    price = np.round(price, 2)
+    price[rng.random(len(order_index)) < 0.005] = np.nan
+
+    orders = pd.DataFrame({
+        'order_no': order_no[order_index].astype(str),
+        'order_date': order_date[order_index].strftime('%Y-%m-%d %H:%M:%S'),
+        'order_status': status[order_index],
+        'marketplace': marketplace[order_index],
+        'marketplace_store': store[order_index],
+        'sku': skus[sku_index],
+        'quantity': quantity,
+        'price': price,
+    })
+    orders['product_subtotal'] = (orders['quantity'] * orders['price']).round(2)
+    orders['order_total'] = orders.groupby('order_no')['product_subtotal'].transform('sum').round(2)
+    # Columns the pipeline does not read, as in the real export
+    orders['buyer_username'] = 'buyer_' + pd.Series(order_index % 50_000).astype(str)
+    orders['tracking_no'] = 'MY' + orders['order_no'].str[-10:]
+    orders['warehouse'] = 'Kuala Terengganu'
+    orders['shipping_fee'] = 4.9
+    orders['buyer_note'] = ''
+    return orders
+
+
+def generate_fact_tables(orders, rng):
+    """Return {(store, period index): fact table} for TikTok orders covered by the exports"""
+    tiktok = orders[(orders['marketplace'] == 'TikTok') & orders['marketplace_store'].notna()]
+    order_ids = tiktok['order_no'].unique()
+    # About 75% of TikTok orders come through a creator and appear in the fact tables
+    covered = set(order_ids[rng.random(len(order_ids)) < 0.75])
+    lines = tiktok[tiktok['order_no'].isin(covered)].reset_index(drop=True)
+
+    # Creator and content type are per order
+    order_codes, order_uniques = pd.factorize(lines['order_no'])
+    creators = np.array([f'creator_{i:04d}' for i in range(max(10, len(order_uniques) // 40))], dtype=object)
+    order_creator = rng.choice(creators, len(order_uniques)).astype(object)
+    order_creator[rng.random(len(order_uniques)) < 0.05] = None
+    order_content_type = rng.choice(np.array(CONTENT_TYPES[0], dtype=object), len(order_uniques), p=CONTENT_TYPES[1])
+
+    # Seller SKU usually matches BigSeller; sometimes the listing uses another SKU
+    seller_sku = lines['sku'].to_numpy(dtype=object).copy()
+    mismatch = rng.random(len(lines)) < 0.05
+    seller_sku[mismatch] = 'LISTING-' + lines['sku'][mismatch].to_numpy(dtype=object)
+    fact_status = lines['order_status'].to_numpy(dtype=object).copy()
+    fact_status[rng.random(len(lines)) < 0.03] = 'Cancelled'
+
+    facts = pd.DataFrame({
+        'Order ID': lines['order_no'].astype(np.int64),
+        'Order Status': fact_status,
+        'Creator Username': order_creator[order_codes],
+        'Content Type': order_content_type[order_codes],
+        'Seller SKU': seller_sku,
+        'Product Name': 'Product ' + lines['sku'],
+        'Quantity': lines['quantity'],
+        'Order Amount': lines['product_subtotal'],
+        'Commission Rate': '10%',
+        'Created Time': lines['order_date'],
+        'store': lines['marketplace_store'],
+    })
+    created = pd.to_datetime(facts['Created Time'])
+
+    tables = {}
+    for store in STORES:
+        for period_index, (start, end) in enumerate(EXPORT_PERIODS):
+            in_export = (facts['store'] == store) & (created >= start) & (created <= end)
+            tables[(store, period_index)] = facts[in_export].drop(columns=['store'])
+    return tables
+
+
+def write_reference_sheets(ref_dir):
+    """Write the combo and single SKU sheets"""
+    combo_names = [sku for sku, _, _, in_sheet in SKU_CATALOGUE if in_sheet]
+    combo = pd.DataFrame({'SKU Name': combo_names, 'Title': [f'{name} bundle' for name in combo_names]})
+    combo.to_excel(ref_dir / 'Combo SKU.xlsx', index=False)
+    pd.DataFrame({'SKU Name': SINGLE_SKUS}).to_excel(ref_dir / 'Single SKU.xlsx', index=False)
+
+
+def generate_dataset(out_dir, scale=1, seed=0):
+    """Generate a synthetic Data/ tree under out_dir and return a summary dict"""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    for directory in ['BigSeller Orders', 'Ref SKU', *STORES]:
+        (out_dir / directory).mkdir(parents=True, exist_ok=True)
+
+    orders = generate_orders(int(BASE_LINE_ITEMS * scale), rng)
+    orders.to_csv(out_dir / 'BigSeller Orders' / 'bigseller_orders.csv', index=False)
+
+    fact_rows = 0
+    for (store, period_index), table in generate_fact_tables(orders, rng).items():
+        start, end = (pd.Timestamp(value).strftime('%Y%m%d%H%M%S') for value in EXPORT_PERIODS[period_index])
+        export_id = int(rng.integers(1_000_000, 999_999_999))
+        table.to_csv(out_dir / store / f'creator_order_all_{start}_{end}_{export_id}.csv', index=False)
+        fact_rows += len(table)
+
+    write_reference_sheets(out_dir / 'Ref SKU')
+    return {'scale': scale, 'seed': seed, 'bigseller_rows': len(orders), 'fact_rows': fact_rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic BigSeller / TikTok inputs')
+    parser.add_argument('out_dir', help='directory to write the Data/-style tree into')
+    parser.add_argument('--scale', type=float, default=1, help='size multiplier (1 = ~30k BigSeller rows)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args(argv)
+    summary = generate_dataset(args.out_dir, args.scale, args.seed)
+    print(f"Wrote {summary['bigseller_rows']} BigSeller rows and {summary['fact_rows']} fact rows to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""Regression tests for the sales pipeline on a small synthetic Data/ tree.
+
+The tree comes from sales_synthetic with a quarter of the BigSeller Order IDs mangled the
+way Excel or a float column does, and with repeated order blocks appended as an overlapping
+export would. Run with `python -m pytest -q`.
+"""
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sales_analysis as sa
+from sales_backend import check_parity, data_config
+from sales_benchmark import benchmark_scale
+from sales_cache import cached_read
+from sales_cube import SalesCube
+from sales_instrument import RunReport
+from sales_preview import preview
+from sales_service import SalesService
+from sales_synthetic import generate_dataset
+
+# Synthetic size: about 1,500 BigSeller line items
+SCALE = 0.05
+# Order blocks appended again at the end of the BigSeller export
+REPEATED_ORDERS = 40
+
+
+# Function to mangle an Order ID the way spreadsheets and float columns do
+def mangle_order_id(order_id, form):
+    """Return order_id as a float text, with a leading zero or in Python's float repr"""
+    return [f'{order_id}.0', f'0{order_id}', repr(float(int(order_id)))][form % 3]
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    """Synthetic Data/ tree with mangled Order IDs and repeated order blocks"""
+    data_dir = tmp_path_factory.mktemp('data')
+    generate_dataset(data_dir, scale=SCALE, seed=1)
+    path = data_dir / 'BigSeller Orders' / 'bigseller_orders.csv'
+    orders = pd.read_csv(path, dtype=str, keep_default_na=False)
+    order_ids = orders['order_no'].unique()
+    rng = np.random.default_rng(1)
+    mangled = rng.choice(order_ids, len(order_ids) // 4, replace=False)
+    mapping = {order_id: mangle_order_id(order_id, form) for form, order_id in enumerate(mangled)}
+    orders['order_no'] = orders['order_no'].map(lambda order_id: mapping.get(order_id, order_id))
+    repeated = orders[orders['order_no'].isin(orders['order_no'].unique()[:REPEATED_ORDERS])]
+    pd.concat([orders, repeated]).to_csv(path, index=False)
+    return data_dir
+
+
+# Function to build a config that keeps nothing between runs
+def fresh_config(data_dir, **overrides):
+    config = data_config(data_dir, input_cache_dir=None, state_dir=None, order_index_path=None, cube_file=None,
+                         write_outputs=False)
+    return replace(config, **overrides)
+
+
+# Function to copy the synthetic tree for a test that edits its inputs
+def copy_data(data_dir, tmp_path):
+    shutil.copytree(data_dir, tmp_path / 'data')
+    return tmp_path / 'data'
+
+
+# Function to sort a sales table for comparison
+def sorted_sales(sales):
+    return sales.sort_values(['content_type', 'sku'], ignore_index=True)
+
+
+@pytest.mark.parametrize('sku, breakdown', [
+    # Combo sheet SKUs: combo rules, otherwise the SKU itself as one unit
+    ('HIM3', (('COF1', 3),)),
+    ('COF2', (('COF1', 2),)),
+    ('SPUHIM-A', (('COF1', 1), ('spr/x1', 1))),
+    ('HER3+1', (('HER3+1', 1),)),
+    ('MYSTERY', (('MYSTERY', 1),)),
+    # Other order SKUs: the order rules, otherwise nothing
+    ('HIM4-B', (('COF1', 4),)),
+    ('HER3-B', (('HERCOF1', 3),)),
+    ('HER2+1', (('HERCOF1', 2), ('HERCOF1', 1))),
+    ('SPU-A', (('spr/x1', 1),)),
+    ('2HIMVGO', (('COF1', 2), ('VGOMX', 1))),
+    ('SPUHIMZ', (('COF1', 1), ('spr/x1', 1))),
+    ('UNKNOWN1', ()),
+])
+def test_sku_resolver_rules(sku, breakdown):
+    resolver = sa.SkuResolver(['HIM3', 'COF2', 'SPUHIM-A', 'HER3+1', 'MYSTERY'])
+    assert resolver.resolve_one(sku) == breakdown
+    assert resolver.resolve([sku, sku]) == {sku: breakdown}
+
+
+def test_sku_resolver_reads_stripped_combo_names(tmp_path):
+    path = tmp_path / 'Combo SKU.xlsx'
+    pd.DataFrame({'SKU Name': [' HIM5 ', None, 'TPHIM'], 'Title': ['x', None, 'y']}).to_excel(path, index=False)
+    resolver = sa.create_sku_resolver(path, cache_dir=None)
+    assert resolver.combo_skus == {'HIM5', 'TPHIM'}
+    assert resolver.resolve_one('HIM5') == (('COF1', 5),)
+    assert resolver.resolve_one('TPHIM') == (('TP-COF', 1),)
+
+
+def test_missing_skus_are_counted_as_nan(data_dir, tmp_path):
+    work_dir = copy_data(data_dir, tmp_path)
+    path = work_dir / 'BigSeller Orders' / 'bigseller_orders.csv'
+    orders = pd.read_csv(path, dtype=str, keep_default_na=False)
+    orders.loc[orders.index[::20], 'sku'] = ''
+    orders.to_csv(path, index=False)
+    result = sa.run(fresh_config(work_dir))
+    linked = result['orders'][result['orders']['content_type'] != 'Unknown']
+    expected = linked.loc[linked['sku'] == sa.MISSING_SKU, 'quantity'].sum()
+    final_sales = result['final_sales']
+    assert expected > 0
+    assert final_sales.loc[final_sales['sku'] == sa.MISSING_SKU, 'quantity_sold'].sum() == expected
+    expanded = sa.run(fresh_config(work_dir, row_level_expansion=True))
+    pd.testing.assert_frame_equal(sorted_sales(expanded['final_sales']), sorted_sales(final_sales), check_dtype=False)
+
+
+def test_empty_fact_table_links_nothing(data_dir, tmp_path):
+    work_dir = copy_data(data_dir, tmp_path)
+    exports = sorted(work_dir.glob('*/creator_order_all_*.csv'))
+    expected = sa.run(fresh_config(work_dir, fact_store_dirs={}))
+    for path in exports[1:]:
+        path.unlink()
+    # A header-only export, and one whose orders have creators but no content type
+    pd.read_csv(exports[0], nrows=0).to_csv(exports[0], index=False)
+    no_content_type = pd.read_csv(data_dir / exports[1].relative_to(work_dir)).assign(**{'Content Type': None})
+    no_content_type.to_csv(exports[1], index=False)
+    result = sa.run(fresh_config(work_dir))
+    assert len(result['fact_files']) == 2
+    assert result['final_sales'].empty
+    assert len(result['unknown_orders']) == len(expected['unknown_orders'])
+
+
+def test_empty_bigseller_window_keeps_dtypes(data_dir):
+    path = data_dir / 'BigSeller Orders' / 'bigseller_orders.csv'
+    orders = sa.read_bigseller_orders(path, marketplaces=['Nope'])
+    assert orders.empty
+    assert pd.api.types.is_datetime64_any_dtype(orders['order_date'])
+    assert pd.api.types.is_float_dtype(orders['quantity'])
+
+
+@pytest.mark.parametrize('overrides', [
+    {'marketplaces': ['Nope']},
+    {'order_statuses': ['Pending']},
+    {'marketplaces': ['Nope'], 'partitioned': True},
+])
+def test_run_with_no_bigseller_rows(data_dir, tmp_path, overrides):
+    config = fresh_config(data_dir, state_dir=str(tmp_path / 'state'), cube_file=str(tmp_path / sa.CUBE_FILE),
+                          **overrides)
+    result = sa.run(config)
+    assert result['final_sales'].empty and result['unknown_orders'].empty and result['cube'].empty
+    # Again, with the saved (empty) partials
+    assert sa.run(config)['final_sales'].empty
+    assert preview(config, rate=1)['estimates'].empty
+
+
+def test_cached_read_reparses_only_changed_files(tmp_path):
+    calls = []
+
+    def reader(path):
+        calls.append(path)
+        return pd.read_csv(path)
+
+    path = tmp_path / 'input.csv'
+    pd.DataFrame({'a': [1, 2]}).to_csv(path, index=False)
+    first = cached_read(path, reader, cache_dir=tmp_path / 'cache')
+    pd.testing.assert_frame_equal(cached_read(path, reader, cache_dir=tmp_path / 'cache'), first)
+    # Touched but identical: still served from the cache
+    os.utime(path, ns=(0, 0))
+    cached_read(path, reader, cache_dir=tmp_path / 'cache')
+    assert len(calls) == 1
+    pd.DataFrame({'a': [1, 2, 3]}).to_csv(path, index=False)
+    assert len(cached_read(path, reader, cache_dir=tmp_path / 'cache')) == 3
+    assert len(calls) == 2
+
+
+def test_cached_bigseller_orders_keep_dtypes_and_attrs(data_dir, tmp_path):
+    path = data_dir / 'BigSeller Orders' / 'bigseller_orders.csv'
+    parsed = cached_read(path, sa.read_bigseller_orders, cache_dir=tmp_path)
+    cached = cached_read(path, sa.read_bigseller_orders, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(cached, parsed)
+    assert cached.attrs == parsed.attrs
+
+
+def test_replaced_bigseller_export_reuses_partials(data_dir, tmp_path):
+    work_dir = copy_data(data_dir, tmp_path)
+    config = fresh_config(work_dir, state_dir=str(tmp_path / 'state'))
+    sa.run(config)
+
+    # A new export with a few more orders no fact table has
+    path = work_dir / 'BigSeller Orders' / 'bigseller_orders.csv'
+    orders = pd.read_csv(path, dtype=str, keep_default_na=False)
+    added = orders.head(5).assign(order_no=[f'999000000000000{i}' for i in range(5)])
+    pd.concat([orders, added]).to_csv(path, index=False)
+    result = sa.run(config)
+    assert result['report'].meta['reused_fact_files'] == len(result['fact_files'])
+    expected = sa.run(replace(config, state_dir=None))
+    pd.testing.assert_frame_equal(sorted_sales(result['final_sales']), sorted_sales(expected['final_sales']),
+                                  check_dtype=False)
+
+
+def test_removed_export_relinks_its_rows(data_dir, tmp_path):
+    work_dir = copy_data(data_dir, tmp_path)
+    config = fresh_config(work_dir, state_dir=str(tmp_path / 'state'))
+    # An overlapping copy of an export, sorted after it: it claims nothing while the original is there
+    original = sorted(work_dir.glob('*/creator_order_all_*.csv'))[0]
+    shutil.copy(original, original.with_name(original.name.rsplit('_', 1)[0] + '_999999999.csv'))
+    sa.run(config)
+
+    original.unlink()
+    result = sa.run(config)
+    expected = sa.run(replace(config, state_dir=None))
+    pd.testing.assert_frame_equal(sorted_sales(result['final_sales']), sorted_sales(expected['final_sales']),
+                                  check_dtype=False)
+    assert len(result['unknown_orders']) == len(expected['unknown_orders'])
+
+
+def test_parallel_fact_table_loading_matches_serial(data_dir):
+    config = fresh_config(data_dir)
+    fact_files = sa.discover_fact_files(config.fact_store_dirs, config.order_date_start, config.order_date_end)
+    serial = sa.load_fact_tables(fact_files, replace(config, fact_load_workers=1))
+    parallel = sa.load_fact_tables(fact_files, replace(config, fact_load_workers=2))
+    assert len(parallel) == len(fact_files) > 1
+    for expected, actual in zip(serial, parallel):
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_import_has_no_side_effects(tmp_path):
+    completed = subprocess.run([sys.executable, '-c', 'import sales_analysis'], cwd=tmp_path, capture_output=True,
+                               text=True, env={**os.environ, 'PYTHONPATH': str(Path(__file__).parent)})
+    assert completed.returncode == 0
+    assert completed.stdout == completed.stderr == ''
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_writes_outputs_to_configured_paths(data_dir, tmp_path):
+    config = fresh_config(data_dir, write_outputs=True, output_file=str(tmp_path / 'final.csv'),
+                          unknown_output_file=str(tmp_path / 'unknown.csv'), bigseller_chunksize=100)
+    result = sa.run(config)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['final.csv', 'unknown.csv']
+    assert len(pd.read_csv(tmp_path / 'unknown.csv')) == len(result['unknown_orders'])
+    # The chunk size only changes how the BigSeller export is streamed
+    expected = sa.run(fresh_config(data_dir))
+    pd.testing.assert_frame_equal(sorted_sales(result['final_sales']), sorted_sales(expected['final_sales']))
+
+
+def test_synthetic_data_is_reproducible(tmp_path):
+    first = generate_dataset(tmp_path / 'a', scale=0.01, seed=3)
+    second = generate_dataset(tmp_path / 'b', scale=0.01, seed=3)
+    assert first == second
+    for path in sorted((tmp_path / 'a').rglob('*.csv')):
+        assert path.read_bytes() == (tmp_path / 'b' / path.relative_to(tmp_path / 'a')).read_bytes()
+
+
+def test_benchmark_checks_the_reference_output(tmp_path):
+    created = benchmark_scale(0.02, data_root=tmp_path, repeats=1, memory=False)
+    assert created['reference']['status'] == 'created'
+    assert {'load', 'attribute', 'allocate'} <= set(created['stages'])
+    assert benchmark_scale(0.02, data_root=tmp_path, repeats=1, memory=False)['reference']['status'] == 'match'
+
+
+def test_run_report_measures_every_stage(data_dir, tmp_path):
+    report = RunReport(profile_stage='allocate')
+    result = sa.run(fresh_config(data_dir), report=report)
+    totals = report.totals()
+    assert totals['load']['rows_out'] == totals['filter']['rows_in']
+    assert totals['filter']['rows_out'] == len(result['orders'])
+    # One record per export for the per-export stages
+    assert totals['attribute']['calls'] == len(result['fact_files'])
+    assert all(record['wall_seconds'] >= 0 for record in report.stages)
+    written = json.loads(report.write(tmp_path / 'run.json').read_text())
+    assert written['totals'].keys() == totals.keys()
+    assert Path(written['profile_path']).exists()
+
+
+def test_pipeline_frames_use_compact_dtypes(data_dir):
+    config = fresh_config(data_dir)
+    orders = sa.filter_orders(sa.load(config)[0], config)
+    for column in ('order_status', 'marketplace', 'marketplace_store', 'sku'):
+        assert isinstance(orders[column].dtype, pd.CategoricalDtype)
+    assert orders['quantity'].dtype.itemsize == 1
+    fact_files = sa.discover_fact_files(config.fact_store_dirs, config.order_date_start, config.order_date_end)
+    tiktok = sa.load_fact_tables(fact_files[:1], config)[0]
+    assert isinstance(tiktok['sales_channel'].dtype, pd.CategoricalDtype)
+
+
+def test_concat_frames_keeps_categoricals():
+    left = pd.DataFrame({'sku': pd.Categorical(['HIM1', 'HER1'])})
+    right = pd.DataFrame({'sku': pd.Categorical(['COF2'])})
+    combined = sa.concat_frames([left, right])
+    assert isinstance(combined['sku'].dtype, pd.CategoricalDtype)
+    assert combined['sku'].tolist() == ['HIM1', 'HER1', 'COF2']
+
+
+def test_allocation_matches_row_level_expansion(data_dir):
+    allocated = sa.run(fresh_config(data_dir))['final_sales']
+    expanded = sa.run(fresh_config(data_dir, row_level_expansion=True))['final_sales']
+    allocated, expanded = sorted_sales(allocated), sorted_sales(expanded)
+    assert allocated[['content_type', 'sku']].equals(expanded[['content_type', 'sku']])
+    np.testing.assert_allclose(allocated['quantity_sold'], expanded['quantity_sold'])
+    np.testing.assert_allclose(allocated['revenue'], expanded['revenue'], atol=0.01)
+
+
+def test_order_index_serves_unchanged_exports(data_dir, tmp_path):
+    work_dir = copy_data(data_dir, tmp_path)
+    config = fresh_config(work_dir, order_index_path=str(tmp_path / 'order_index.sqlite'))
+    expected = sorted_sales(sa.run(fresh_config(work_dir))['final_sales'])
+    sa.run(config)
+    report = RunReport()
+    indexed = sa.run(config, report=report)
+    assert report.totals()['load_fact_tables']['rows_in'] == 0
+    pd.testing.assert_frame_equal(sorted_sales(indexed['final_sales']), expected)
+
+    # A changed export is parsed and indexed again
+    changed = indexed['fact_files'][0]['path']
+    pd.read_csv(changed).iloc[::2].to_csv(changed, index=False)
+    report = RunReport()
+    result = sa.run(config, report=report)
+    assert report.totals()['load_fact_tables']['rows_in'] == 1
+    pd.testing.assert_frame_equal(sorted_sales(result['final_sales']),
+                                  sorted_sales(sa.run(fresh_config(work_dir))['final_sales']))
+
+
+def test_sales_cube_rolls_up_to_the_final_table(data_dir, tmp_path):
+    result = sa.run(fresh_config(data_dir, write_outputs=True, cube_file=str(tmp_path / sa.CUBE_FILE),
+                                 output_file=str(tmp_path / sa.OUTPUT_FILE),
+                                 unknown_output_file=str(tmp_path / sa.UNKNOWN_OUTPUT_FILE)))
+    cube = SalesCube.load(tmp_path / sa.CUBE_FILE)
+    rollup = sorted_sales(cube.rollup(['content_type', 'sku']))
+    final_sales = sorted_sales(result['final_sales'])
+    assert rollup[['content_type', 'sku']].equals(final_sales[['content_type', 'sku']].astype(str))
+    np.testing.assert_allclose(rollup['quantity_sold'], final_sales['quantity_sold'])
+    np.testing.assert_allclose(rollup['revenue'], final_sales['revenue'], atol=0.01)
+
+    live = cube.rollup('store', content_type='Live', start='2025-11-01')
+    expected = cube.cube[(cube.cube['content_type'] == 'Live') & (cube.cube['date'] >= '2025-11-01')]
+    assert live['quantity_sold'].sum() == expected['quantity_sold'].sum() > 0
+    with pytest.raises(KeyError):
+        cube.rollup('warehouse')
+
+
+def test_partitioned_run_matches_sequential_run(data_dir):
+    expected = sa.run(fresh_config(data_dir))
+    result = sa.run(fresh_config(data_dir, partitioned=True, partition_workers=2))
+    pd.testing.assert_frame_equal(sorted_sales(result['final_sales']), sorted_sales(expected['final_sales']),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(result['unknown_orders'].reset_index(drop=True),
+                                  expected['unknown_orders'].reset_index(drop=True), check_dtype=False)
+
+
+async def exchange(service, request):
+    """Send raw request bytes to a SalesService and return everything it answers before closing"""
+    server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    return response
+
+
+@pytest.mark.parametrize('content_length', ['abc', '-5'])
+def test_service_rejects_bad_content_length(data_dir, content_length):
+    service = SalesService(fresh_config(data_dir))
+    request = (f'GET /status HTTP/1.1\r\nContent-Length: {content_length}\r\n\r\n'
+               'GET /status HTTP/1.1\r\n\r\n').encode()
+    response = asyncio.run(exchange(service, request))
+    assert response.startswith(b'HTTP/1.1 400 Bad Request\r\n')
+    assert b'Connection: close' in response
+    assert response.count(b'HTTP/1.1 ') == 1
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 3, 1000])
+def test_dedup_keeps_identical_lines_of_split_orders(tmp_path, chunksize):
+    # Order 1001 has three identical lines, one of them after an order-1002 line
+    line = ['2025-10-05 10:00:00', 'Completed', 'TikTok', 'HIM Clinic', 'HIM1', '1', '69.0', '69.0', '207.0']
+    rows = [['1001', *line], ['1001', *line], ['1002', *line], ['1001', *line]]
+    path = tmp_path / 'bigseller_orders.csv'
+    pd.DataFrame(rows, columns=list(sa.BIGSELLER_DTYPES)).to_csv(path, index=False)
+    orders = sa.read_bigseller_orders(path, chunksize=chunksize)
+    assert len(orders) == 4
+    assert orders.attrs['duplicate_rows'] == 0
+    assert orders.attrs['split_blocks'] == 1
+
+    # The start of the export appended again: both orders' first blocks repeat and are dropped
+    pd.DataFrame(rows + rows[2:3] + rows[:2], columns=list(sa.BIGSELLER_DTYPES)).to_csv(path, index=False)
+    orders = sa.read_bigseller_orders(path, chunksize=chunksize)
+    assert len(orders) == 4
+    assert orders.attrs['duplicate_rows'] == 3
+
+
+def test_dedup_drops_repeated_blocks(data_dir):
+    path = data_dir / 'BigSeller Orders' / 'bigseller_orders.csv'
+    orders = sa.read_bigseller_orders(path)
+    everything = sa.read_bigseller_orders(path, dedup=False)
+    assert 0 < orders.attrs['duplicate_rows'] == len(everything) - len(orders)
+    pd.testing.assert_frame_equal(sa.read_bigseller_orders(path, chunksize=97), orders, check_categorical=False)
+
+
+def test_sorted_runs_sum_values_per_key():
+    rng = np.random.default_rng(0)
+    runs = sa.SortedRuns(np.int64)
+    expected = {}
+    for size in rng.integers(1, 50, 40):
+        keys = np.unique(rng.integers(0, 300, size).astype(np.uint64))
+        runs.add(keys, np.ones(len(keys)))
+        for key in keys:
+            expected[key] = expected.get(key, 0) + 1
+    assert len(runs.runs) <= 10
+    probe = np.arange(320, dtype=np.uint64)
+    found, values = runs.get(probe)
+    assert found.tolist() == [key in expected for key in probe]
+    assert values.tolist() == [expected.get(key, 0) for key in probe]
+
+
+def test_line_item_facts_add_up_to_final_sales(data_dir, tmp_path):
+    config = fresh_config(data_dir, facts_dir=str(tmp_path / 'facts'), state_dir=str(tmp_path / 'state'))
+    for _ in range(2):
+        # The second run reuses every export and must leave their files in place
+        final_sales = sorted_sales(sa.run(config)['final_sales'])
+        facts = pd.read_parquet(tmp_path / 'facts')
+        facts = facts.astype({'content_type': str, 'sku': str})
+        totals = facts.groupby(['content_type', 'sku'], as_index=False)[['quantity_sold', 'revenue']].sum()
+        totals = sorted_sales(totals[totals['quantity_sold'] > 0])
+        assert totals[['content_type', 'sku']].values.tolist() == final_sales[['content_type', 'sku']].values.tolist()
+        np.testing.assert_allclose(totals['quantity_sold'], final_sales['quantity_sold'])
+        np.testing.assert_allclose(totals['revenue'], final_sales['revenue'], atol=0.01)
+
+
+def test_preview_at_full_rate_matches_run(data_dir):
+    config = fresh_config(data_dir)
+    final_sales = sorted_sales(sa.run(config)['final_sales'])
+    estimates = sorted_sales(preview(config, rate=1)['estimates'])
+    assert estimates[['content_type', 'sku']].equals(final_sales[['content_type', 'sku']])
+    np.testing.assert_allclose(estimates['quantity_sold'], final_sales['quantity_sold'])
+    np.testing.assert_allclose(estimates['revenue'], final_sales['revenue'], atol=0.01)
+    assert (estimates['quantity_sold_low'] == estimates['quantity_sold_high']).all()
+
+
+def test_sampled_preview_is_reproducible(data_dir):
+    config = fresh_config(data_dir)
+    result = preview(config, rate=0.3, seed=7)
+    assert 0 < result['sample_orders'] < result['orders']
+    estimates = result['estimates']
+    assert (estimates['quantity_sold_low'] <= estimates['quantity_sold']).all()
+    assert (estimates['quantity_sold'] <= estimates['quantity_sold_high']).all()
+    pd.testing.assert_frame_equal(preview(config, rate=0.3, seed=7)['estimates'], estimates)
+
+
+def test_reconcile_recovers_mangled_ids(data_dir):
+    result = sa.run(fresh_config(data_dir))
+    unreconciled = sa.run(fresh_config(data_dir, reconcile=False))
+    assert len(result['unknown_orders']) < len(unreconciled['unknown_orders'])
+    assert result['final_sales']['quantity_sold'].sum() > unreconciled['final_sales']['quantity_sold'].sum()
+
+
+def test_polars_matches_pandas(data_dir):
+    pytest.importorskip('polars')
+    results = check_parity(data_config(data_dir))
+    assert results == {'polars': {sa.OUTPUT_FILE: 'match', sa.UNKNOWN_OUTPUT_FILE: 'match'}}